@@ -0,0 +1,186 @@
+import asyncio
+import collections
+import contextlib
+import threading
+import time
+from typing import Dict
+
+
+class HostState:
+    def __init__(self, limits: Dict) -> None:
+        self.rate_per_s = limits["RATE_PER_S"]
+        self.burst = limits["BURST"]
+        self.max_concurrent = limits["MAX_CONCURRENT"]
+
+        self.tokens = float(self.burst)
+        self.last_refill_ts = time.monotonic()
+        self.in_flight = 0
+        self.waiting = 0
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(
+            self.burst, self.tokens + (now - self.last_refill_ts) * self.rate_per_s
+        )
+        self.last_refill_ts = now
+
+
+# token bucket per host (RATE_PER_S requests per second, in bursts of up to BURST), plus a
+# cap on requests in flight per host and overall. hosts listed in the settings can have
+# their own limits; a listed domain also covers its subdomains, which then share its
+# bucket (e.g., every *.substack.com blog counts against substack.com)
+class HostScheduler:
+    def __init__(self, host_limits_settings: Dict) -> None:
+        self.default_limits = host_limits_settings["DEFAULT"]
+        self.limits_by_host = host_limits_settings.get("HOSTS") or {}
+        self.max_concurrent = host_limits_settings["MAX_CONCURRENT"]
+
+        self.cond = threading.Condition()
+        self.host_states = {}
+        self.in_flight = 0
+        self.waiting = 0
+
+        self.stats = collections.Counter()
+        self.wait_s_by_host = collections.Counter()
+        self.peak_waiting_by_host = collections.Counter()
+
+    def get_bucket_name(self, host: str) -> str:
+        parts = host.split(".")
+        for i in range(len(parts) - 1):
+            candidate = ".".join(parts[i:])
+            if candidate in self.limits_by_host:
+                return candidate
+        return host
+
+    def get_host_state(self, bucket_name: str) -> HostState:
+        # call with self.cond held
+        host_state = self.host_states.get(bucket_name)
+        if not host_state:
+            host_state = HostState(
+                self.limits_by_host.get(bucket_name) or self.default_limits
+            )
+            self.host_states[bucket_name] = host_state
+        return host_state
+
+    def try_acquire(self, host_state: HostState) -> float:
+        # call with self.cond held; returns 0 if a slot was taken, or else how long to wait
+        # before trying again (None means until a request finishes)
+        now = time.monotonic()
+        host_state.refill(now)
+
+        if (
+            host_state.in_flight >= host_state.max_concurrent
+            or self.in_flight >= self.max_concurrent
+        ):
+            return None
+        if host_state.tokens < 1:
+            return (1 - host_state.tokens) / host_state.rate_per_s
+
+        host_state.tokens -= 1
+        host_state.in_flight += 1
+        self.in_flight += 1
+        return 0
+
+    def start_waiting(self, bucket_name: str, host_state: HostState) -> None:
+        # call with self.cond held
+        host_state.waiting += 1
+        self.waiting += 1
+        self.stats["peak_waiting"] = max(self.stats["peak_waiting"], self.waiting)
+        self.peak_waiting_by_host[bucket_name] = max(
+            self.peak_waiting_by_host[bucket_name], host_state.waiting
+        )
+
+    def stop_waiting(self, host_state: HostState) -> None:
+        # call with self.cond held
+        host_state.waiting -= 1
+        self.waiting -= 1
+
+    def record_request(self, bucket_name: str, wait_s: float) -> None:
+        # call with self.cond held
+        self.stats["requests"] += 1
+        if wait_s:
+            self.stats["requests_delayed"] += 1
+            self.stats["wait_s"] += wait_s
+            self.stats["max_wait_s"] = max(self.stats["max_wait_s"], wait_s)
+            self.wait_s_by_host[bucket_name] += wait_s
+
+    def acquire(self, host: str) -> str:
+        # blocks until host may be sent a request; returns what to pass to release()
+        bucket_name = self.get_bucket_name(host)
+        start_ts = time.monotonic()
+
+        with self.cond:
+            host_state = self.get_host_state(bucket_name)
+            retry_after_s = self.try_acquire(host_state)
+            if retry_after_s == 0:
+                self.record_request(bucket_name, 0)
+                return bucket_name
+
+            self.start_waiting(bucket_name, host_state)
+            while retry_after_s != 0:
+                self.cond.wait(retry_after_s)
+                retry_after_s = self.try_acquire(host_state)
+            self.stop_waiting(host_state)
+            self.record_request(bucket_name, time.monotonic() - start_ts)
+
+        return bucket_name
+
+    async def acquire_async(self, host: str) -> str:
+        # like acquire(), but waits on the event loop instead of blocking a thread
+        bucket_name = self.get_bucket_name(host)
+        start_ts = time.monotonic()
+
+        with self.cond:
+            host_state = self.get_host_state(bucket_name)
+            retry_after_s = self.try_acquire(host_state)
+            if retry_after_s == 0:
+                self.record_request(bucket_name, 0)
+                return bucket_name
+            self.start_waiting(bucket_name, host_state)
+
+        try:
+            while retry_after_s != 0:
+                await asyncio.sleep(0.05 if retry_after_s is None else retry_after_s)
+                with self.cond:
+                    retry_after_s = self.try_acquire(host_state)
+                    if retry_after_s == 0:
+                        self.stop_waiting(host_state)
+                        self.record_request(bucket_name, time.monotonic() - start_ts)
+        except asyncio.CancelledError:
+            with self.cond:
+                self.stop_waiting(host_state)
+            raise
+
+        return bucket_name
+
+    def release(self, bucket_name: str) -> None:
+        with self.cond:
+            host_state = self.host_states[bucket_name]
+            host_state.in_flight -= 1
+            self.in_flight -= 1
+            self.cond.notify_all()
+
+    @contextlib.contextmanager
+    def slot(self, host: str):
+        bucket_name = self.acquire(host)
+        try:
+            yield
+        finally:
+            self.release(bucket_name)
+
+    @contextlib.asynccontextmanager
+    async def slot_async(self, host: str):
+        bucket_name = await self.acquire_async(host)
+        try:
+            yield
+        finally:
+            self.release(bucket_name)
+
+    def get_stats(self) -> Dict:
+        with self.cond:
+            return {
+                "stats": dict(self.stats),
+                "in_flight": self.in_flight,
+                "waiting": self.waiting,
+                "most_delayed_hosts": self.wait_s_by_host.most_common(5),
+                "peak_waiting_by_host": dict(self.peak_waiting_by_host),
+            }
@@ -0,0 +1,100 @@
+import re
+from typing import Dict, Optional
+
+import lxml.etree
+from bs4 import BeautifulSoup
+from goose3.parsers import Parser as GooseParser
+
+# meta tags (by their property or name attribute) that are kept in head_metadata
+META_KEY_PREFIXES = ("og:", "twitter:")
+META_AUTHOR_KEYS = {"article:author", "author"}
+
+# where the head ends: at </head>, or wherever the body starts when </head> is left out
+HEAD_END_RE = re.compile(r"</head\s*>|<body[\s>]", re.IGNORECASE)
+
+FEED_CHUNK_CHARS = 65536
+
+
+def get_meta_tags(html: str) -> Dict[str, Optional[str]]:
+    # the content of the first og:*, twitter:* and author meta tag of each key in html, via a
+    # pull parser that drops every element once it's been read, so that even a whole page
+    # costs no more memory than its deepest branch; a meta tag without content maps to None
+    meta_tags = {}
+    parser = lxml.etree.HTMLPullParser(events=("end",))
+
+    def read_meta_tags():
+        for _, el in parser.read_events():
+            if el.tag == "meta":
+                key = el.get("property") or el.get("name")
+                if key and (
+                    key.startswith(META_KEY_PREFIXES) or key in META_AUTHOR_KEYS
+                ):
+                    meta_tags.setdefault(key, el.get("content"))
+            el.clear()
+            parent = el.getparent()
+            while parent is not None and el.getprevious() is not None:
+                del parent[0]
+
+    for i in range(0, len(html), FEED_CHUNK_CHARS):
+        parser.feed(html[i : i + FEED_CHUNK_CHARS])
+        read_meta_tags()
+    try:
+        parser.close()
+    except lxml.etree.XMLSyntaxError:
+        # no elements at all, e.g., the page starts at <body>
+        pass
+    read_meta_tags()
+
+    return meta_tags
+
+
+# an html page whose parts are parsed only as they're asked for: head_metadata parses just
+# the <head>, which is all most stories need, and the full trees (soup for the site-specific
+# extractors in social_media, tree for goose) are built at most once each, on first use
+class HtmlPage:
+    def __init__(self, page_source: str, soup_parser: str = "lxml") -> None:
+        self.page_source = page_source
+        self.soup_parser = soup_parser
+        self._head_metadata = None
+        self._soup = None
+        self._tree = None
+        self._tree_failed = False
+
+    @property
+    def head_metadata(self) -> Dict[str, Optional[str]]:
+        if self._head_metadata is None:
+            match = HEAD_END_RE.search(self.page_source)
+            if not match:
+                self._head_metadata = get_meta_tags(self.page_source)
+                return self._head_metadata
+
+            self._head_metadata = get_meta_tags(self.page_source[: match.start()])
+
+            # some pages put their og:image in the body; find it there too, as soup.find() did
+            if (
+                "og:image" not in self._head_metadata
+                and "og:image" in self.page_source[match.start() :]
+            ):
+                body_meta_tags = get_meta_tags(self.page_source)
+                if "og:image" in body_meta_tags:
+                    self._head_metadata["og:image"] = body_meta_tags["og:image"]
+
+        return self._head_metadata
+
+    @property
+    def soup(self) -> BeautifulSoup:
+        if self._soup is None:
+            self._soup = BeautifulSoup(self.page_source, self.soup_parser)
+        return self._soup
+
+    @property
+    def tree(self):
+        # parsed the way goose parses raw html, so goose can use it instead of parsing the
+        # page again. goose cleans the tree in place, so hand it to goose last. None if lxml
+        # can't parse the page, in which case goose falls back on its other parser
+        if self._tree is None and not self._tree_failed:
+            try:
+                self._tree = GooseParser.fromstring(self.page_source)
+            except (UnicodeDecodeError, ValueError, lxml.etree.ParserError):
+                self._tree_failed = True
+        return self._tree
@@ -0,0 +1,84 @@
+import json
+import os
+import struct
+import tempfile
+import time
+
+import utils_hash
+
+# response headers kept with a cached body; requests has already decoded any
+# content-encoding, so length and encoding headers would no longer be accurate
+CACHED_HEADERS = [
+    "content-disposition",
+    "content-type",
+    "etag",
+    "last-modified",
+]
+
+# each entry is one file: 4-byte length of the JSON metadata, the metadata, then the body
+META_LENGTH_FORMAT = ">I"
+
+
+# on-disk cache of HTTP response bodies and their validators (ETag, Last-Modified), keyed by URL
+class HttpCache:
+    def __init__(self, cache_dir: str) -> None:
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def get_entry_path(self, url: str) -> str:
+        return os.path.join(
+            self.cache_dir, utils_hash.get_sha1_of_string(url, length=40) + ".cache"
+        )
+
+    def get(self, url: str):
+        # returns (metadata as dict, body as bytes), or None if url isn't cached
+        try:
+            with open(self.get_entry_path(url), "rb") as f:
+                (meta_length,) = struct.unpack(
+                    META_LENGTH_FORMAT, f.read(struct.calcsize(META_LENGTH_FORMAT))
+                )
+                meta = json.loads(f.read(meta_length))
+                body = f.read()
+        except (FileNotFoundError, struct.error, ValueError):
+            return None
+
+        # a hash collision would be unlucky, but cheap to rule out
+        if meta.get("url") != url:
+            return None
+
+        return meta, body
+
+    def put(self, url: str, final_url: str, headers, body: bytes) -> None:
+        meta = {
+            "url": url,
+            "final_url": final_url,
+            "headers": {k: headers[k] for k in CACHED_HEADERS if k in headers},
+            "stored_at": int(time.time()),
+        }
+        meta_as_bytes = json.dumps(meta).encode("utf-8")
+
+        # write to a temp file and rename, so concurrent readers never see a partial entry
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(struct.pack(META_LENGTH_FORMAT, len(meta_as_bytes)))
+                f.write(meta_as_bytes)
+                f.write(body)
+            os.replace(temp_path, self.get_entry_path(url))
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def touch(self, url: str) -> None:
+        # keeps a revalidated entry from being pruned as stale
+        try:
+            os.utime(self.get_entry_path(url))
+        except FileNotFoundError:
+            pass
+
+    def delete(self, url: str) -> None:
+        try:
+            os.remove(self.get_entry_path(url))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,39 @@
+import re
+from typing import Dict, List, Union
+
+PLACEHOLDER_RE = re.compile(r"{{ (\w+) }}")
+
+
+# an html template with {{ name }} placeholders, parsed once into alternating static and
+# dynamic segments so that each render is a single join rather than a str.replace()
+# (and a full copy of the page) per placeholder
+class PageTemplate:
+    def __init__(self, template_text: str) -> None:
+        # segments alternate static, dynamic, static, ..., static; the static segments
+        # are the even-numbered ones and the dynamic ones hold the placeholder names
+        self.segments = PLACEHOLDER_RE.split(template_text)
+        self.placeholders = set(self.segments[1::2])
+
+    @classmethod
+    def from_file(cls, template_file: str) -> "PageTemplate":
+        with open(template_file, mode="r", encoding="utf-8") as f:
+            return cls(f.read())
+
+    def render(self, values: Dict[str, Union[str, List[str]]]) -> str:
+        # a value can be a list of strings, which are joined in place without first
+        # being concatenated into a string of their own
+        missing = self.placeholders - values.keys()
+        if missing:
+            raise ValueError(f"no value for placeholder(s) {', '.join(sorted(missing))}")
+
+        parts = []
+        for i, segment in enumerate(self.segments):
+            if i % 2 == 0:
+                parts.append(segment)
+                continue
+            value = values[segment]
+            if isinstance(value, str):
+                parts.append(value)
+            else:
+                parts.extend(value)
+        return "".join(parts)
@@ -1,10 +1,26 @@
+import copy
+import pickle
 from typing import Dict, List
 
+import msgpack
+
 import utils_text
 from Item import Item
 
 # TODO: make this a dataclass? what are the benefits?
 
+# bump STORY_OBJECT_VERSION whenever a persisted attribute is renamed, and record the rename
+# in STORY_ATTRIBUTE_RENAMES so that stories encoded under older versions still decode:
+# {version that introduced the rename: {old attribute name: new attribute name}}
+STORY_OBJECT_VERSION = 1
+STORY_ATTRIBUTE_RENAMES = {}
+
+# rebuilt every time a page is rendered, so not worth persisting
+UNPERSISTED_ATTRIBUTES = {"badges_slug", "story_card_html"}
+
+# first byte of an encoded story; pickles (protocol 2+) always start with 0x80
+ENCODING_MSGPACK_V1 = b"\x01"
+
 
 class Story(Item):
     def __init__(
@@ -20,12 +36,11 @@ class Story(Item):
         type: str,
         url: str,
     ) -> None:
-        self.story_object_version: int = 1
+        self.story_object_version: int = STORY_OBJECT_VERSION
 
         self.hn_comments_url: str = f"https://news.ycombinator.com/item?id={id}"
 
-        # TODO: indicate or group which attributes are queried during story freshening;
-        # these are the ones I can't modify their names or else the pickled Story files won't work
+        # to rename an attribute, bump STORY_OBJECT_VERSION and add the rename to STORY_ATTRIBUTE_RENAMES
 
         log_prefix = f"id={id}: "
 
@@ -61,9 +76,13 @@ class Story(Item):
         self.score: int = score
 
         self.time_of_last_firebaseio_query: int
+        self.time_of_next_firebaseio_query: int = 0
+        self.recent_activity_per_hour: float = 0.0
 
         self.linked_url_reported_content_type: str = ""
         self.linked_url_confirmed_content_type: str = ""
+        # when to acquire the story again, if fetching its url failed or was skipped
+        self.reacquire_after_ts: int = None
 
         # og:image info
         self.og_image_url: str = None
@@ -74,6 +93,7 @@ class Story(Item):
         self.downloaded_og_image_magic_result: str = None
         self.og_image_filename_details_from_url: Dict = {}
         self.thumb_aspect_hint: str = None
+        self.thumb_content_hash: str = None
 
         self.og_image_is_inline_data: bool = False
         self.og_image_inline_data_srct: str = None
@@ -112,6 +132,9 @@ class Story(Item):
         self.badges_slug: str = ""
         self.story_card_html: str = ""
 
+        # {key of the attributes they were built from: [head, tail]}; see get_story_card_static_fragments()
+        self.story_card_static_fragments: Dict[str, List[str]] = {}
+
         # what kind of content is at outbound link
         self.outbound_link_to_binary: bool = False
         self.outbound_link_to_html: bool = False
@@ -145,3 +168,73 @@ class Story(Item):
 
     def to_dict(self):
         return {key: value for key, value in self.__dict__.items()}
+
+
+blank_story_attributes = None
+
+
+def get_blank_story_attributes():
+    # attribute defaults of a story with no url; encode_story() persists only the attributes
+    # that differ from these, and decode_story() starts from them
+    global blank_story_attributes
+    if blank_story_attributes is None:
+        blank_story_attributes = vars(
+            Story(
+                by="",
+                descendants=0,
+                id=0,
+                kids=[],
+                score=0,
+                time=0,
+                title="",
+                text="",
+                type="story",
+                url="",
+            )
+        )
+    return blank_story_attributes
+
+
+def encode_story(story_object: Story) -> bytes:
+    blank_attributes = get_blank_story_attributes()
+    record = {
+        k: v
+        for k, v in vars(story_object).items()
+        if k not in UNPERSISTED_ATTRIBUTES
+        and (k not in blank_attributes or v != blank_attributes[k])
+    }
+    # always persisted, even though it matches the blank story's value
+    record["story_object_version"] = story_object.story_object_version
+
+    try:
+        return ENCODING_MSGPACK_V1 + msgpack.packb(record, use_bin_type=True)
+    except TypeError:
+        # some attribute holds a type msgpack can't encode
+        return pickle.dumps(story_object, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def decode_story(data: bytes) -> Story:
+    if data[:1] != ENCODING_MSGPACK_V1:
+        return pickle.loads(data)
+
+    record = msgpack.unpackb(data[1:], raw=False)
+
+    encoded_version = record.get("story_object_version", 1)
+    for version in sorted(STORY_ATTRIBUTE_RENAMES):
+        if version <= encoded_version:
+            continue
+        for old_name, new_name in STORY_ATTRIBUTE_RENAMES[version].items():
+            if old_name in record:
+                record[new_name] = record.pop(old_name)
+    record["story_object_version"] = STORY_OBJECT_VERSION
+
+    attributes = dict(get_blank_story_attributes())
+    for k, v in attributes.items():
+        if isinstance(v, (dict, list)) and k not in record:
+            attributes[k] = copy.copy(v)
+    attributes.update(record)
+
+    story_object = Story.__new__(Story)
+    story_object.__dict__ = attributes
+
+    return story_object
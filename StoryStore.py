@@ -0,0 +1,106 @@
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List
+
+from Story import decode_story, encode_story
+
+# SQLite caps the number of bound parameters per statement; stay well under it
+MAX_IDS_PER_QUERY = 500
+
+
+# single-file SQLite (WAL mode) store for cached Story objects, keyed by story id
+class StoryStore:
+    def __init__(self, db_file: str) -> None:
+        self.db_file = db_file
+        self.lock = threading.Lock()
+
+        # one connection shared by all worker threads; self.lock serializes access
+        self.conn = sqlite3.connect(db_file, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS stories ("
+            "id INTEGER PRIMARY KEY, "
+            "story_object_version INTEGER NOT NULL, "
+            "time_of_last_firebaseio_query INTEGER, "
+            "updated_at INTEGER NOT NULL, "
+            "data BLOB NOT NULL"
+            ")"
+        )
+        self.conn.commit()
+
+    def close(self) -> None:
+        with self.lock:
+            self.conn.close()
+
+    def get(self, story_id: int, min_version: int = 0):
+        return self.get_many([story_id], min_version=min_version).get(story_id)
+
+    def get_many(self, story_ids: Iterable[int], min_version: int = 0) -> Dict:
+        # returns {story id: Story} for the ids found at or above min_version
+        story_ids = list(story_ids)
+        story_objects = {}
+
+        for i in range(0, len(story_ids), MAX_IDS_PER_QUERY):
+            chunk = story_ids[i : i + MAX_IDS_PER_QUERY]
+            placeholders = ",".join("?" * len(chunk))
+            with self.lock:
+                rows = self.conn.execute(
+                    f"SELECT id, data FROM stories WHERE id IN ({placeholders}) "
+                    "AND story_object_version >= ?",
+                    (*chunk, min_version),
+                ).fetchall()
+
+            for story_id, data in rows:
+                story_objects[story_id] = self.decode(data)
+
+        return story_objects
+
+    def put(self, story_object) -> None:
+        self.put_many([story_object])
+
+    def put_many(self, story_objects: List) -> None:
+        now = int(time.time())
+        rows = [
+            (
+                story_object.id,
+                story_object.story_object_version,
+                getattr(story_object, "time_of_last_firebaseio_query", None),
+                now,
+                self.encode(story_object),
+            )
+            for story_object in story_objects
+        ]
+
+        with self.lock:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO stories "
+                    "(id, story_object_version, time_of_last_firebaseio_query, updated_at, data) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    rows,
+                )
+
+    def delete_older_than(self, max_age_seconds: int) -> int:
+        # returns the number of stories deleted
+        cutoff = int(time.time()) - max_age_seconds
+        with self.lock:
+            with self.conn:
+                cursor = self.conn.execute(
+                    "DELETE FROM stories WHERE updated_at < ?", (cutoff,)
+                )
+        return cursor.rowcount
+
+    def count(self) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM stories").fetchone()[0]
+
+    @staticmethod
+    def encode(story_object) -> bytes:
+        return encode_story(story_object)
+
+    @staticmethod
+    def decode(data: bytes):
+        # also decodes the pickled stories written before encode_story() existed
+        return decode_story(data)
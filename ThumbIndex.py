@@ -0,0 +1,85 @@
+import json
+import sqlite3
+import threading
+import time
+
+
+# single-file SQLite (WAL mode) index of thumbs already uploaded to S3, keyed by the
+# content hash of their source image and processing parameters
+class ThumbIndex:
+    def __init__(self, db_file: str) -> None:
+        self.db_file = db_file
+        self.lock = threading.Lock()
+
+        # one connection shared by all worker threads; self.lock serializes access
+        self.conn = sqlite3.connect(db_file, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS thumbs ("
+            "content_hash TEXT PRIMARY KEY, "
+            "uploaded_at INTEGER NOT NULL, "
+            "last_used_at INTEGER NOT NULL, "
+            "data TEXT NOT NULL"
+            ")"
+        )
+        self.conn.commit()
+
+    def close(self) -> None:
+        with self.lock:
+            self.conn.close()
+
+    def get(self, content_hash: str, max_age_seconds: int = None):
+        # returns the dict stored by put(), or None if there's no usable entry
+        now = int(time.time())
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT uploaded_at, data FROM thumbs WHERE content_hash = ?",
+                (content_hash,),
+            ).fetchone()
+            if not row:
+                return None
+
+            uploaded_at, data = row
+            if max_age_seconds is not None and uploaded_at < now - max_age_seconds:
+                return None
+
+            with self.conn:
+                self.conn.execute(
+                    "UPDATE thumbs SET last_used_at = ? WHERE content_hash = ?",
+                    (now, content_hash),
+                )
+
+        return json.loads(data)
+
+    def put(self, content_hash: str, entry: dict) -> None:
+        now = int(time.time())
+        with self.lock:
+            with self.conn:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO thumbs "
+                    "(content_hash, uploaded_at, last_used_at, data) "
+                    "VALUES (?, ?, ?, ?)",
+                    (content_hash, now, now, json.dumps(entry)),
+                )
+
+    def delete(self, content_hash: str) -> None:
+        with self.lock:
+            with self.conn:
+                self.conn.execute(
+                    "DELETE FROM thumbs WHERE content_hash = ?", (content_hash,)
+                )
+
+    def delete_uploaded_before(self, max_age_seconds: int) -> int:
+        # returns the number of entries deleted
+        cutoff = int(time.time()) - max_age_seconds
+        with self.lock:
+            with self.conn:
+                cursor = self.conn.execute(
+                    "DELETE FROM thumbs WHERE uploaded_at < ?", (cutoff,)
+                )
+        return cursor.rowcount
+
+    def count(self) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM thumbs").fetchone()[0]
@@ -0,0 +1,85 @@
+import sys
+import time
+
+from PageTemplate import PageTemplate
+
+# compares rendering a page of stories with PageTemplate against the chained
+# str.replace() calls (and per-page re-read of the template) it replaced, over
+# synthetic story cards of roughly the size the real ones are
+
+TEMPLATE_FILE = "templates/stories.html"
+
+CARD_HTML = (
+    '<tr data-story-id="{id}"><td class="story-card">'
+    + '<div class="story-title"><a href="https://example.com/{id}">story {id}</a></div>'
+    + '<div class="story-byline">{filler}</div>'
+    + "</td></tr>"
+)
+
+
+def get_values(mode, story_cards_html):
+    return {
+        "about_url": f"https://www.thnr.net/about-{mode}.html",
+        "canonical_url": "https://www.thnr.net/",
+        "header_hyperlink": "https://www.thnr.net/",
+        "short_url_display": "thnr.net",
+        "static_css_url": f"/static/styles-{mode}.css",
+        "stories": [
+            '<div class="stories-section" data-page-num="1">\n',
+            f'<div class="which-mode"><a href="/other-{mode}.html">other mode</a></div>\n',
+            *story_cards_html,
+            '<div class="html-generation-time">generated just now</div>\n',
+        ],
+    }
+
+
+def render_via_replace(values, page_template):
+    # page_template is unused; the template is read and filled in per page, as before
+    with open(TEMPLATE_FILE, mode="r", encoding="utf-8") as f:
+        page = f.read()
+    page = page.replace("{{ canonical_url }}", values["canonical_url"])
+    page = page.replace("{{ header_hyperlink }}", values["header_hyperlink"])
+    page = page.replace("{{ short_url_display }}", values["short_url_display"])
+    page = page.replace("{{ static_css_url }}", values["static_css_url"])
+    page = page.replace("{{ stories }}", "".join(values["stories"]))
+    page = page.replace("{{ about_url }}", values["about_url"])
+    page.count("data-story-id")
+    return page
+
+
+def render_via_page_template(values, page_template):
+    return page_template.render(values)
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) > 3:
+        print("Usage: bench-page-template.py [stories-per-page] [rounds]")
+        exit()
+
+    stories_per_page = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+    story_cards_html = []
+    for i in range(stories_per_page):
+        story_cards_html.append(CARD_HTML.format(id=i, filler="x" * 4000))
+        story_cards_html.append("\n")
+
+    page_template = PageTemplate.from_file(TEMPLATE_FILE)
+    pages = [get_values(mode, story_cards_html) for mode in ["lm", "dm"]]
+
+    mismatches = 0
+    for values in pages:
+        if render_via_replace(values, None) != page_template.render(values):
+            mismatches += 1
+    page_bytes = len(page_template.render(pages[0]).encode("utf-8"))
+    print(f"{stories_per_page} stories per page, {page_bytes:,} bytes per page")
+    print(f"{mismatches} mismatches")
+
+    for each_func in [render_via_replace, render_via_page_template]:
+        start_ts = time.perf_counter()
+        for _ in range(rounds):
+            for values in pages:
+                each_func(values, page_template)
+        elapsed = (time.perf_counter() - start_ts) / rounds
+        print(f"{each_func.__name__}: {1000 * elapsed:.3f} ms per page (both modes)")
@@ -0,0 +1,49 @@
+import os
+import sys
+import time
+
+import utils_mimetypes_magic
+
+# compares check_for_valid_text_encodings() with the iconv-based version it replaced,
+# over a corpus of saved pages (by default ./temp/)
+
+if __name__ == "__main__":
+
+    if len(sys.argv) > 3:
+        print("Usage: bench-text-encodings.py [corpus-dir] [rounds]")
+        exit()
+
+    corpus_dir = sys.argv[1] if len(sys.argv) > 1 else "temp"
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    corpus = []
+    for dirpath, _, filenames in os.walk(corpus_dir):
+        for filename in sorted(filenames):
+            corpus.append(os.path.join(dirpath, filename))
+    corpus_bytes = sum(os.path.getsize(x) for x in corpus)
+    print(f"corpus: {len(corpus)} files, {corpus_bytes:,} bytes in {corpus_dir}")
+
+    mismatches = 0
+    for each_file in corpus:
+        via_iconv = utils_mimetypes_magic.check_for_valid_text_encodings_via_iconv(
+            each_file
+        )
+        in_process = utils_mimetypes_magic.check_for_valid_text_encodings(each_file)
+        if via_iconv != in_process:
+            mismatches += 1
+            print(f"mismatch for {each_file}: {via_iconv=} {in_process=}")
+    print(f"{mismatches} mismatches")
+
+    for each_func in [
+        utils_mimetypes_magic.check_for_valid_text_encodings_via_iconv,
+        utils_mimetypes_magic.check_for_valid_text_encodings,
+    ]:
+        start_ts = time.perf_counter()
+        for _ in range(rounds):
+            for each_file in corpus:
+                each_func(each_file)
+        elapsed = (time.perf_counter() - start_ts) / rounds
+        print(
+            f"{each_func.__name__}: {elapsed:.3f} s per pass, "
+            + f"{1000 * elapsed / len(corpus):.2f} ms per file"
+        )
@@ -23,6 +23,24 @@ def load_settings(cur_host, settings_file):
             settings["CACHED_STORIES_DIR"] = os.path.join(
                 settings["THNR_BASE_DIR"], "cached_stories"
             )
+            settings["STORY_STORE_FILE"] = os.path.join(
+                settings["CACHED_STORIES_DIR"], "stories.sqlite3"
+            )
+            settings["THUMB_INDEX_FILE"] = os.path.join(
+                settings["CACHED_STORIES_DIR"], "thumbs.sqlite3"
+            )
+            settings["NEGATIVE_CACHE_FILE"] = os.path.join(
+                settings["CACHED_STORIES_DIR"], "negative_cache.json"
+            )
+            settings["RENDER_HISTORY_FILE"] = os.path.join(
+                settings["CACHED_STORIES_DIR"], "render_history.json"
+            )
+            settings["UPLOAD_MANIFEST_FILE"] = os.path.join(
+                settings["THNR_BASE_DIR"], "upload_manifest.json"
+            )
+            settings["HTTP_CACHE_DIR"] = os.path.join(
+                settings["THNR_BASE_DIR"], "http_cache"
+            )
             settings["COMPLETED_PAGES_DIR"] = os.path.join(
                 settings["THNR_BASE_DIR"], "completed_pages"
             )
@@ -78,6 +96,9 @@ s3_stories_path = ""
 # number of threads
 max_workers = 30
 
+# max stories fetching from the same outbound host at once
+max_workers_per_host = 3
+
 # connections settings
 delay_for_page_to_load_seconds = 4
 num_tries_for_page_retrieval = 3
@@ -91,3 +112,4 @@ reading_speed_words_per_minute = (
 # debug flags
 debug_flags = {}
 debug_flags["DEBUG_FLAG_FORCE_SINGLE_THREAD_EXECUTION"] = False
+debug_flags["DEBUG_FLAG_EXPORT_STORY_JSON"] = False
@@ -1,22 +1,24 @@
+import asyncio
 import base64
 import concurrent.futures
+import copy
 import json
 import logging
 import os
-import pickle
 import re
-import time
+import threading
 import traceback
 import warnings
 from urllib.parse import urlparse
 
-from bs4 import BeautifulSoup, XMLParsedAsHTMLWarning
+from bs4 import XMLParsedAsHTMLWarning
 
 import config
 import social_media
 import thnr_scrapers
 import thumbs
 import utils_aws
+import utils_browser
 import utils_file
 import utils_hash
 import utils_http
@@ -24,8 +26,11 @@ import utils_mimetypes_magic
 import utils_random
 import utils_text
 import utils_time
+from HtmlPage import HtmlPage
 from PageOfStories import PageOfStories
+from PageTemplate import PageTemplate
 from Story import Story
+from StoryStore import StoryStore
 from thnr_exceptions import UnsupportedStoryType
 
 logger = logging.getLogger(__name__)
@@ -44,6 +49,19 @@ badge_codes = {
 }
 
 
+REQUIRED_MINIMUM_STORY_OBJECT_VERSION = 1
+
+# bump whenever the static parts of story cards change, so that cached ones are rebuilt
+STORY_CARD_STATIC_HTML_VERSION = 1
+
+# opened on first use, once config.settings is loaded
+story_store = None
+story_store_lock = threading.Lock()
+
+# parsed on first use, once config.settings is loaded, then shared by every page and mode
+stories_page_template = None
+stories_page_template_lock = threading.Lock()
+
 skip_getting_content_type_via_head_request_for_domains = {
     "twitter.com",
     "bloomberg.com",
@@ -188,7 +206,7 @@ def asdfft1(item_id=None, pos_on_page=None):
             or not story_object.linked_url_reported_content_type
         ):
             page_source = None
-            soup = None
+            head_metadata = None
 
             page_source = utils_http.get_page_source(
                 url=story_object.url,
@@ -205,27 +223,27 @@ def asdfft1(item_id=None, pos_on_page=None):
                 else:
                     parser_to_use = "lxml"
 
+                html_page = HtmlPage(page_source, soup_parser=parser_to_use)
                 try:
-                    soup = BeautifulSoup(page_source, parser_to_use)
+                    head_metadata = html_page.head_metadata
                 except Exception as exc:
                     generic_exception_handler(
                         exc=exc,
                         include_tb=True,
-                        log_detail=f"unexpected problem making soup from {story_object.url}",
+                        log_detail=f"unexpected problem parsing the head of {story_object.url}",
                         log_prefix=log_prefix_local,
                         postscript="~Tim~",
                     )
 
-            if not page_source or not soup:
+            if not page_source or head_metadata is None:
                 return story_object
 
-            # invariant now: we have page_source and soup
+            # invariant now: we have page_source and head_metadata
 
             # check for og:image
-            og_image_url_result = soup.find("meta", {"property": "og:image"})
-            if og_image_url_result:
-                if og_image_url_result.has_attr("content"):
-                    meta_og_image_content = og_image_url_result["content"]
+            if "og:image" in head_metadata:
+                if head_metadata["og:image"] is not None:
+                    meta_og_image_content = head_metadata["og:image"]
 
                     if meta_og_image_content.startswith("data:"):
                         # content="data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAeUAAACeEAIAAADTU..."
@@ -279,7 +297,7 @@ def asdfft1(item_id=None, pos_on_page=None):
                                     story_object.og_image_inline_data_decoded_local_path = local_file_with_og_image_inline_data_decoded
 
                     else:
-                        story_object.og_image_url = og_image_url_result["content"]
+                        story_object.og_image_url = head_metadata["og:image"]
                         logger.info(
                             log_prefix_local
                             + f"found og:image url {story_object.og_image_url}"
@@ -291,7 +309,9 @@ def asdfft1(item_id=None, pos_on_page=None):
             # get reading time
             try:
                 reading_time = utils_text.get_reading_time(
-                    page_source=page_source, log_prefix=log_prefix_id
+                    page_source=page_source,
+                    page_tree=html_page.tree,
+                    log_prefix=log_prefix_id,
                 )
                 if reading_time:
                     story_object.reading_time = reading_time
@@ -315,7 +335,7 @@ def asdfft1(item_id=None, pos_on_page=None):
                 social_media.check_for_social_media_details(
                     # driver=driver,
                     story_object=story_object,
-                    page_source_soup=soup,
+                    html_page=html_page,
                 )
             except Exception as exc:
                 logger.error(
@@ -437,32 +457,26 @@ def asdfft2_preprocess_outbound_link(story_object, log_prefix: str) -> None:
     return
 
 
-generic_binary_mimetypes = set(
-    [
-        "application/octet-stream",
-        "application/data",
-        "application/binary",
-        "binary/octet",
-    ]
-)
+generic_binary_mimetypes = utils_mimetypes_magic.generic_binary_mimetypes
 
 
-def asdfft2(item_id=None, pos_on_page=None):
+def asdfft2(item_id=None, pos_on_page=None, story_as_dict=None):
     # asdfft2 = acquire story details for first time v2
+    # story_as_dict may be passed in if the caller already queried firebaseio for it
     log_prefix_id = f"id={item_id}: "
     log_prefix_local = log_prefix_id + "asdfft2: "
 
-    story_as_dict = None
-    try:
-        story_as_dict = query_firebaseio_for_story_data(item_id=item_id)
-    except Exception as exc:
-        generic_exception_handler(
-            exc=exc,
-            include_tb=True,
-            log_detail="unexpected problem querying firebaseio",
-            log_prefix=log_prefix_local,
-            raise_after=True,
-        )
+    if not story_as_dict:
+        try:
+            story_as_dict = query_firebaseio_for_story_data(item_id=item_id)
+        except Exception as exc:
+            generic_exception_handler(
+                exc=exc,
+                include_tb=True,
+                log_detail="unexpected problem querying firebaseio",
+                log_prefix=log_prefix_local,
+                raise_after=True,
+            )
 
     if not story_as_dict:
         logger.info(
@@ -513,27 +527,40 @@ def asdfft2(item_id=None, pos_on_page=None):
         story_object.url = new_url
         parsed_url = urlparse(story_object.url)
 
-    response_objects = {}
-    for each_gro_func in [
-        utils_http.get_response_object_via_requests,
-        utils_http.get_response_object_via_hrequests,
-    ]:
-        time.sleep(utils_random.random_real(0, 1))
-        ro = each_gro_func(url=story_object.url, log_prefix=log_prefix_local)
-        if ro:
-            response_objects[each_gro_func.__name__] = ro
+    known_failure = utils_http.get_known_failure(story_object.url)
+    if known_failure:
+        failure_class, story_object.reacquire_after_ts = known_failure
+        logger.info(
+            log_prefix_local
+            + f"not fetching url {story_object.url}, it or its host failed recently ({failure_class})"
+        )
+        # create story card with what little we have
+        story_object.has_thumb = False
+        populate_story_card_html_in_story_object(story_object)
+        logger.info(log_prefix_local + "saving item to disk for the first time")
+        save_story_object_to_disk(
+            story_object=story_object, log_prefix=log_prefix_local
+        )
+        return story_object
 
-        else:
-            logger.info(
-                log_prefix_local
-                + f"failed to get response object via {each_gro_func.__name__}"
-            )
+    response_objects, is_race_timed_out = utils_http.get_response_objects_via_race(
+        url=story_object.url, log_prefix=log_prefix_local
+    )
 
     if not response_objects:
         logger.info(
             log_prefix_local
             + f"failed to get any response objects for url {story_object.url} ~Tim~"
         )
+        # a slow page isn't a dead link, so it's tried again in the next run
+        if is_race_timed_out:
+            story_object.reacquire_after_ts = (
+                utils_time.get_time_now_in_epoch_seconds_int()
+            )
+        else:
+            story_object.reacquire_after_ts = utils_http.remember_failed_url(
+                story_object.url, log_prefix=log_prefix_local
+            )
         # create story card with what little we have
         story_object.has_thumb = False
         populate_story_card_html_in_story_object(story_object)
@@ -545,62 +572,63 @@ def asdfft2(item_id=None, pos_on_page=None):
 
     # invariant now: we have at least one response object
 
-    # let's download the content and determine its content type
-    local_file_with_response_content_prefix = config.settings["TEMP_DIR"] + str(
-        story_object.id
-    )
-
-    for k, v in response_objects.items():
-        utils_file.save_response_content_to_disk(
-            response=v,
-            dest_local_file=local_file_with_response_content_prefix + "-" + k[4:],
-            log_prefix=log_prefix_local,
-        )
-
     # prefer the response object from requests, because the object from hrequests sometimes handles binary files as utf-8 strings
     if "get_response_object_via_requests" in response_objects:
-        local_file_with_response_content = (
-            local_file_with_response_content_prefix + "-response_object_via_requests"
-        )
+        response_object_to_use = "get_response_object_via_requests"
     else:
         # TODO: we REALLY REALLY don't want to use hrequest's ro, because it sometimes handles binary files as utf-8 strings
         # TODO: use curl or something as a fallback to get the content, in order to avoid using the hrequests ro
         # TODO: or maybe wait 30 seconds and try again to get the content via requests
-        local_file_with_response_content = (
-            local_file_with_response_content_prefix + "-response_object_via_hrequests"
-        )
+        response_object_to_use = "get_response_object_via_hrequests"
 
-    textual_mimetype, page_source, is_wellformed_xml = (
-        utils_mimetypes_magic.get_textual_mimetype(
-            local_file=local_file_with_response_content,
-            log_prefix=log_prefix_local,
-            context={"url": story_object.url},
-        )
+    response_content = utils_file.get_response_content_as_bytes(
+        response_objects[response_object_to_use], log_prefix=log_prefix_local
     )
+    if response_content is None:
+        response_content = b""
 
-    if textual_mimetype:
-        content_type_to_use = textual_mimetype
-        story_object.is_wellformed_xml = is_wellformed_xml
+    # sniff the start of the content in memory, and only write to disk what the
+    # file-based tools below actually need
+    content_head = response_content[
+        : config.settings["SCRAPING"]["CONTENT_SNIFF_BYTES"]
+    ]
 
-    else:  # textual_mimetype is None
-        # must be binary, so figure out what kind of binary
+    local_file_with_response_content = (
+        config.settings["TEMP_DIR"]
+        + str(story_object.id)
+        + "-"
+        + response_object_to_use[4:]
+    )
 
-        # get magic type of the file
-        mimetype_via_python_magic = utils_mimetypes_magic.get_mimetype_via_python_magic(
-            local_file=local_file_with_response_content,
-            log_prefix=log_prefix_local,
+    if utils_mimetypes_magic.is_probably_binary_content(content_head):
+        logger.info(
+            log_prefix_local
+            + f"probably binary content ({len(response_content)} bytes); skipping textual checks"
         )
+        textual_mimetype, page_source, is_wellformed_xml = None, None, None
 
-        mimetype_via_file_command = utils_mimetypes_magic.get_mimetype_via_file_command(
-            local_file=local_file_with_response_content,
+    else:
+        utils_file.save_bytes_to_disk(
+            response_content,
+            dest_local_file=local_file_with_response_content,
             log_prefix=log_prefix_local,
         )
 
-        mimetype_via_exiftool = utils_mimetypes_magic.get_mimetype_via_exiftool2(
-            local_file=local_file_with_response_content,
-            log_prefix=log_prefix_local,
+        textual_mimetype, page_source, is_wellformed_xml = (
+            utils_mimetypes_magic.get_textual_mimetype(
+                local_file=local_file_with_response_content,
+                log_prefix=log_prefix_local,
+                context={"url": story_object.url},
+            )
         )
 
+    if textual_mimetype:
+        content_type_to_use = textual_mimetype
+        story_object.is_wellformed_xml = is_wellformed_xml
+
+    else:  # textual_mimetype is None
+        # must be binary, so figure out what kind of binary
+
         content_types_guessed_from_uri_extension = (
             utils_mimetypes_magic.guess_mimetype_from_uri_extension(
                 url=story_object.url,
@@ -609,20 +637,6 @@ def asdfft2(item_id=None, pos_on_page=None):
             )
         )
 
-        possible_magic_types = []
-        if mimetype_via_python_magic:
-            possible_magic_types.append(mimetype_via_python_magic)
-        if mimetype_via_file_command:
-            possible_magic_types.append(mimetype_via_file_command)
-        if mimetype_via_exiftool:
-            if isinstance(type(mimetype_via_exiftool), str):
-                possible_magic_types.append(mimetype_via_exiftool)
-            else:
-                logger.info(
-                    log_prefix_local
-                    + f"{mimetype_via_exiftool=}, type(mimetype_via_exiftool)={type(mimetype_via_exiftool)} ~Tim~"
-                )
-
         srct = set(
             x
             for x in [
@@ -654,19 +668,31 @@ def asdfft2(item_id=None, pos_on_page=None):
             )
             srct = srct.pop()
 
+        # get magic type of the file; the external tools only run if needed
+        mimetypes_via_magic = utils_mimetypes_magic.get_mimetypes_via_magic(
+            content_head=content_head,
+            local_file=local_file_with_response_content,
+            srct=srct,
+            content_types_guessed_from_uri_extension=content_types_guessed_from_uri_extension,
+            log_prefix=log_prefix_local,
+        )
+        mimetype_via_python_magic = mimetypes_via_magic["python_magic"]
+        mimetype_via_file_command = mimetypes_via_magic.get("file_command")
+
+        possible_magic_types = []
+        if mimetype_via_python_magic:
+            possible_magic_types.append(mimetype_via_python_magic)
+        if mimetype_via_file_command:
+            possible_magic_types.append(mimetype_via_file_command)
+
         all_values = set()
         all_values.update(content_types_guessed_from_uri_extension)
         all_values.update(possible_magic_types)
         if textual_mimetype:
             all_values.add(textual_mimetype)
 
-        trusted_values = set(
-            [
-                mimetype_via_python_magic,
-                mimetype_via_file_command,
-                mimetype_via_exiftool,
-            ]
-        )
+        # just libmagic's result when the in-process signals agreed
+        trusted_values = set(mimetypes_via_magic.values())
 
         if srct:
             url_slug = f"for url {story_object.url}"
@@ -766,32 +792,33 @@ def asdfft2(item_id=None, pos_on_page=None):
 
     # invariant now: content_type_to_use != None
 
-    # try make soup from page_source
+    # parse the page's head; the rest of the page is parsed only if something needs it
     if page_source and content_type_to_use in ["text/html", "application/xhtml+xml"]:
         if content_type_to_use.endswith("xml") and story_object.is_wellformed_xml:
             parser_to_use = "lxml-xml"
         else:
             parser_to_use = "lxml"
 
+        html_page = HtmlPage(page_source, soup_parser=parser_to_use)
+        head_metadata = None
         try:
-            soup = BeautifulSoup(page_source, parser_to_use)
+            head_metadata = html_page.head_metadata
         except Exception as exc:
             generic_exception_handler(
                 exc=exc,
                 include_tb=True,
-                log_detail=f"unexpected problem making soup from {story_object.url}",
+                log_detail=f"unexpected problem parsing the head of {story_object.url}",
                 log_prefix=log_prefix_local,
                 postscript="~Tim~",
             )
 
-        if not soup:
+        if head_metadata is None:
             return story_object
 
         # check for og:image
-        og_image_url_result = soup.find("meta", {"property": "og:image"})
-        if og_image_url_result:
-            if og_image_url_result.has_attr("content"):
-                meta_og_image_content = og_image_url_result["content"]
+        if "og:image" in head_metadata:
+            if head_metadata["og:image"] is not None:
+                meta_og_image_content = head_metadata["og:image"]
 
                 if meta_og_image_content.startswith("data:"):
                     # Example:
@@ -848,7 +875,7 @@ def asdfft2(item_id=None, pos_on_page=None):
                 else:
                     # Example:
                     # <meta property="og:image" content="https://www.esa.int/var/esa/storage/images/esa_multimedia/images/2024/03/webb_hubble_confirm_universe_s_expansion_rate/25971194-1-eng-GB/Webb_Hubble_confirm_Universe_s_expansion_rate_pillars.jpg">
-                    story_object.og_image_url = og_image_url_result["content"]
+                    story_object.og_image_url = head_metadata["og:image"]
                     logger.info(
                         log_prefix_local
                         + f"found og:image url {story_object.og_image_url}"
@@ -861,7 +888,9 @@ def asdfft2(item_id=None, pos_on_page=None):
         # get reading time via goose
         try:
             reading_time = utils_text.get_reading_time(
-                page_source=page_source, log_prefix=log_prefix_id
+                page_source=page_source,
+                page_tree=html_page.tree,
+                log_prefix=log_prefix_id,
             )
             if reading_time:
                 story_object.reading_time = reading_time
@@ -879,7 +908,7 @@ def asdfft2(item_id=None, pos_on_page=None):
             social_media.check_for_social_media_details(
                 # driver=driver,
                 story_object=story_object,
-                page_source_soup=soup,
+                html_page=html_page,
             )
         except Exception as exc:
             generic_exception_handler(
@@ -1055,7 +1084,7 @@ def create_badges_slug(story_id, story_type, rosters):
         return ""
 
 
-def freshen_up(story_object=None, page_package=None):
+def freshen_up(story_object=None, rosters=None):
     log_prefix_local = f"id={story_object.id}: "
 
     # by freshen up, we mean: update title, score, comment count
@@ -1078,6 +1107,38 @@ def freshen_up(story_object=None, page_package=None):
         )
         raise Exception("failed to freshen story")
 
+    apply_freshened_story_data(
+        story_object, updated_story_data_as_dict, rosters=rosters
+    )
+
+
+async def freshen_up_many_async(story_objects, rosters=None, log_prefix=""):
+    # freshens all of story_objects with one batch of concurrent firebaseio queries
+    # returns {story id: updated story data as dict, or None if its query failed}
+    log_prefix_local = log_prefix + "freshen_up_many: "
+
+    results = await utils_http.firebaseio_bulk_query_async(
+        item_ids=[x.id for x in story_objects], log_prefix=log_prefix_local
+    )
+
+    for story_object in story_objects:
+        updated_story_data_as_dict = results.get(story_object.id)
+        if updated_story_data_as_dict:
+            apply_freshened_story_data(
+                story_object, updated_story_data_as_dict, rosters=rosters
+            )
+
+    return results
+
+
+def apply_freshened_story_data(
+    story_object, updated_story_data_as_dict, rosters=None
+):
+    log_prefix_local = f"id={story_object.id}: "
+
+    previous_query_time = story_object.time_of_last_firebaseio_query
+    previous_activity = (story_object.score or 0) + (story_object.descendants or 0)
+
     story_object.time_of_last_firebaseio_query = (
         utils_time.get_time_now_in_epoch_seconds_int()
     )
@@ -1155,6 +1216,18 @@ def freshen_up(story_object=None, page_package=None):
                 + "no key for 'descendants' in non-job-story updated_story_data_as_dict"
             )
 
+    # points plus comments gained per hour since the previous query
+    hours_since_previous_query = (
+        story_object.time_of_last_firebaseio_query - previous_query_time
+    ) / 3600
+    if hours_since_previous_query > 0:
+        cur_activity = (story_object.score or 0) + (story_object.descendants or 0)
+        story_object.recent_activity_per_hour = (
+            max(0, cur_activity - previous_activity) / hours_since_previous_query
+        )
+
+    schedule_next_firebaseio_query(story_object, rosters=rosters)
+
 
 def get_content_type_from_response(response, log_prefix="", context=None):
     if response and "Content-Type" in response.headers:
@@ -1178,6 +1251,14 @@ def get_html_page_filename(story_type: str, page_number: int, light_mode: bool):
         return f"{story_type}_stories_page_{page_number}_dm.html"
 
 
+def get_page_content_hash(page_html: str, html_generation_time_slug: str) -> str:
+    # the generation time changes every run; leaving it out lets a page whose stories
+    # haven't changed skip its upload
+    return utils_hash.get_sha1_of_string(
+        page_html.replace(html_generation_time_slug, ""), length=40
+    )
+
+
 def get_pickle_filename(id):
     return f"id-{id}.pickle"
 
@@ -1268,201 +1349,427 @@ def item_factory(story_as_dict):
         return None
 
 
-def page_package_processor(page_package: PageOfStories, context: dict = None):
-    ppp_unique_id = utils_hash.get_sha1_of_current_time(
-        salt=utils_random.random_real(0, 1)
+def schedule_next_firebaseio_query(story_object, rosters=None):
+    # the refresh interval grows with the story's age, shrinks with its recent
+    # activity (points plus comments per hour), and is capped for stories on a
+    # volatile roster such as top or new
+    log_prefix_local = f"id={story_object.id}: "
+
+    schedule = config.settings["REFRESH_SCHEDULING"]
+    now = utils_time.get_time_now_in_epoch_seconds_int()
+
+    age_in_minutes = max(0, now - (story_object.time or now)) // 60
+    interval_in_minutes = age_in_minutes * schedule["AGE_FACTOR"]
+
+    activity_per_hour = getattr(story_object, "recent_activity_per_hour", 0.0)
+    interval_in_minutes /= (
+        1 + activity_per_hour / schedule["ACTIVITY_PER_HOUR_TO_HALVE_INTERVAL"]
     )
 
-    log_prefix_local = f"ppp={ppp_unique_id} page={page_package.page_number}: "
+    interval_in_minutes = min(
+        max(interval_in_minutes, schedule["MIN_MINUTES"]), schedule["MAX_MINUTES"]
+    )
 
-    sup_slug = f"sup={context['supervisor_id']} "
+    if is_on_volatile_roster(story_object.id, rosters):
+        interval_in_minutes = min(
+            interval_in_minutes, schedule["MAX_MINUTES_ON_VOLATILE_ROSTERS"]
+        )
+
+    story_object.time_of_next_firebaseio_query = (
+        story_object.time_of_last_firebaseio_query + int(interval_in_minutes * 60)
+    )
 
     logger.info(
-        sup_slug
-        + log_prefix_local
-        + f"len(story_ids)={len(page_package.story_ids)} story_ids={page_package.story_ids}"
+        log_prefix_local
+        + f"next firebaseio query in {int(interval_in_minutes)} minutes (age {age_in_minutes} minutes, activity {activity_per_hour:.1f}/hour)"
     )
 
-    page_processor_start_ts = utils_time.get_time_now_in_epoch_seconds_float()
 
-    # customize links and labels
-    # light mode
-    other_stories_links_lm = ""
-    other_stories_links_dm = ""
-    for each_story_type in page_package.rosters.keys():
-        if each_story_type == page_package.story_type:
-            continue
-        other_stories_links_lm += f'<a class="other-story-type" href="{get_story_page_url(each_story_type, 1, light_mode=True)}">{each_story_type}</a>\n'
-        other_stories_links_dm += f'<a class="other-story-type" href="{get_story_page_url(each_story_type, 1, light_mode=False)}">{each_story_type}</a>\n'
-    other_stories_links_lm = (
-        f'<div class="next-page-link-tray">{other_stories_links_lm}</div>'
+def is_on_volatile_roster(story_id, rosters=None):
+    if not rosters:
+        return False
+    return any(
+        story_id in rosters.get(x, [])
+        for x in config.settings["REFRESH_SCHEDULING"]["VOLATILE_ROSTERS"]
     )
-    other_stories_links_dm = (
-        f'<div class="next-page-link-tray">{other_stories_links_dm}</div>'
+
+
+def is_due_for_freshening(story_object, rosters=None):
+    now = utils_time.get_time_now_in_epoch_seconds_int()
+    minutes_ago_since_last_firebaseio_update = (
+        now - story_object.time_of_last_firebaseio_query
+    ) // 60
+
+    time_of_next_firebaseio_query = getattr(
+        story_object, "time_of_next_firebaseio_query", 0
+    )
+
+    if not time_of_next_firebaseio_query:
+        # stories cached before refresh scheduling existed
+        return (
+            minutes_ago_since_last_firebaseio_update
+            >= config.settings["MINUTES_BEFORE_REFRESHING_STORY_METADATA"]
+        )
+
+    # a story scheduled while it was only on, e.g., best may since have reached top
+    if is_on_volatile_roster(story_object.id, rosters) and (
+        minutes_ago_since_last_firebaseio_update
+        >= config.settings["REFRESH_SCHEDULING"]["MAX_MINUTES_ON_VOLATILE_ROSTERS"]
+    ):
+        return True
+
+    return now >= time_of_next_firebaseio_query
+
+
+def is_due_for_reacquisition(story_object):
+    # a story saved without its url (a failed or skipped fetch) is acquired again, as if it
+    # weren't cached, once that fetch is due to be retried
+    reacquire_after_ts = getattr(story_object, "reacquire_after_ts", None)
+    return bool(
+        reacquire_after_ts
+        and utils_time.get_time_now_in_epoch_seconds_int() >= reacquire_after_ts
     )
 
-    page_html = ""
 
-    num_stories_on_page = None
+def get_story_store():
+    global story_store
+    with story_store_lock:
+        if not story_store:
+            story_store = StoryStore(config.settings["STORY_STORE_FILE"])
+    return story_store
+
+
+def get_stories_page_template():
+    global stories_page_template
+    with stories_page_template_lock:
+        if not stories_page_template:
+            stories_page_template = PageTemplate.from_file(
+                os.path.join(config.settings["TEMPLATES_SERVICE_DIR"], "stories.html")
+            )
+    return stories_page_template
+
+
+def load_cached_story_object(cur_id, log_prefix=""):
+    return load_cached_story_objects([cur_id], log_prefix=log_prefix).get(cur_id)
+
 
-    for rank, cur_id in enumerate(page_package.story_ids):
-        log_prefix_id = f"id={cur_id}: "
-        log_prefix_rank_cur_id_loop = log_prefix_id + f"ppp={ppp_unique_id}: "
+def acquire_story(
+    cur_id,
+    rank,
+    ppp_unique_id="",
+    story_object=None,
+    story_as_dict=None,
+    rosters=None,
+):
+    # freshens a cached story_object if it's due, or else acquires the story for the first time
+    # returns (story_object, we_have_to_save_story_object); story_object is None if the story is to be discarded
+    log_prefix_id = f"id={cur_id}: "
+    log_prefix_rank_cur_id_loop = log_prefix_id + f"ppp={ppp_unique_id}: "
 
-        # logger.info(id_log_prefix + f"page:rank={page_package.page_number}:{rank}")
+    we_have_to_save_story_object = True
 
+    if story_object and is_due_for_reacquisition(story_object):
+        logger.info(
+            log_prefix_rank_cur_id_loop
+            + f"cached story was saved without fetching {story_object.url}; acquiring it again"
+        )
         story_object = None
-        we_have_to_save_story_object = True
 
-        # check for locally cached story
-        cached_filename = os.path.join(
-            config.settings["CACHED_STORIES_DIR"], get_pickle_filename(cur_id)
+    if story_object:
+        minutes_ago_since_last_firebaseio_update = (
+            utils_time.get_time_now_in_epoch_seconds_int()
+            - story_object.time_of_last_firebaseio_query
+        ) // 60
+
+        time_ago_since_last_firebaseio_update_display_for_log = (
+            utils_text.add_singular_plural(
+                minutes_ago_since_last_firebaseio_update,
+                "minute",
+                force_int=True,
+            )
+            + " ago"
         )
-        if not os.path.exists(cached_filename):
-            logger.info(log_prefix_rank_cur_id_loop + "no cached story found")
 
-        else:
-            with open(cached_filename, mode="rb") as file:
-                story_object = pickle.load(file)
+        logger.info(
+            log_prefix_rank_cur_id_loop
+            + f"cached story found (last updated from firebaseio.com {time_ago_since_last_firebaseio_update_display_for_log})"
+        )
 
-            required_minimum_version = 1
-            if story_object.story_object_version < required_minimum_version:
-                logger.info(
-                    log_prefix_rank_cur_id_loop
-                    + f"cached story found, but its story_object_version {story_object.story_object_version} is below the minimum of {required_minimum_version}"
-                )
-                story_object = None  # reset so we know to invoke asdfft1()
+        if not is_due_for_freshening(story_object, rosters=rosters):
+            # too soon to refreshen
+            logger.info(
+                log_prefix_rank_cur_id_loop
+                + f"re-using cached story (last updated from firebaseio.com {time_ago_since_last_firebaseio_update_display_for_log})"
+            )
+            we_have_to_save_story_object = False
 
-            else:
-                minutes_ago_since_last_firebaseio_update = (
-                    utils_time.get_time_now_in_epoch_seconds_int()
-                    - story_object.time_of_last_firebaseio_query
-                ) // 60
-
-                time_ago_since_last_firebaseio_update_display_for_log = (
-                    utils_text.add_singular_plural(
-                        minutes_ago_since_last_firebaseio_update,
-                        "minute",
-                        force_int=True,
-                    )
-                    + " ago"
-                )
+        else:
+            logger.info(log_prefix_rank_cur_id_loop + "try to freshen cached story")
 
+            try:
+                freshen_up(story_object=story_object, rosters=rosters)
                 logger.info(
-                    log_prefix_rank_cur_id_loop
-                    + f"cached story found (last updated from firebaseio.com {time_ago_since_last_firebaseio_update_display_for_log})"
+                    log_prefix_rank_cur_id_loop + "successfully freshened story"
                 )
 
-                if (
-                    minutes_ago_since_last_firebaseio_update
-                    < config.settings["MINUTES_BEFORE_REFRESHING_STORY_METADATA"]
-                ):
-                    # too soon to refreshen
+            except Exception as exc:
+                short_exc_name = exc.__class__.__name__
+                exc_name = exc.__class__.__module__ + "." + short_exc_name
+                exc_msg = str(exc)
+
+                if exc_msg == "failed to freshen story":
                     logger.info(
                         log_prefix_rank_cur_id_loop
-                        + f"re-using cached story (last updated from firebaseio.com {time_ago_since_last_firebaseio_update_display_for_log})"
+                        + "failed to freshen story; will re-use cached story"
                     )
                     we_have_to_save_story_object = False
 
                 else:
-                    logger.info(
-                        log_prefix_rank_cur_id_loop + "try to freshen cached story"
+                    exc_slug = f"{exc_name}: {exc_msg}"
+                    logger.error(
+                        log_prefix_id
+                        + "freshen_up: "
+                        + "unexpected exception: "
+                        + exc_slug
                     )
+                    tb_str = traceback.format_exc()
+                    logger.error(log_prefix_id + "freshen_up: " + tb_str)
 
-                    try:
-                        freshen_up(story_object=story_object, page_package=page_package)
-                        logger.info(
-                            log_prefix_rank_cur_id_loop + "successfully freshened story"
-                        )
+    if not story_object:
+        try:
+            story_object = asdfft2(
+                item_id=cur_id, pos_on_page=rank, story_as_dict=story_as_dict
+            )
 
-                    except Exception as exc:
-                        short_exc_name = exc.__class__.__name__
-                        exc_name = exc.__class__.__module__ + "." + short_exc_name
-                        exc_msg = str(exc)
-
-                        if exc_msg == "failed to freshen story":
-                            logger.info(
-                                log_prefix_rank_cur_id_loop
-                                + "failed to freshen story; will re-use cached story"
-                            )
-                            we_have_to_save_story_object = False
-
-                        else:
-                            exc_slug = f"{exc_name}: {exc_msg}"
-                            logger.error(
-                                log_prefix_id
-                                + "freshen_up: "
-                                + "unexpected exception: "
-                                + exc_slug
-                            )
-                            tb_str = traceback.format_exc()
-                            logger.error(log_prefix_id + "freshen_up: " + tb_str)
-
-        if not story_object:
-            try:
-                story_object = asdfft2(item_id=cur_id, pos_on_page=rank)
+        except UnsupportedStoryType as exc:
+            exc_short_name = exc.__class__.__name__
+            exc_name = f"{exc.__class__.__module__}.{exc_short_name}"
+            exc_msg = str(exc)
+            exc_slug = f"{exc_name}: {exc_msg}"
+            logger.info(log_prefix_rank_cur_id_loop + exc_slug)
+            logger.info(log_prefix_rank_cur_id_loop + "discarding this story")
+            return None, False
 
-            except UnsupportedStoryType as exc:
-                exc_short_name = exc.__class__.__name__
-                exc_name = f"{exc.__class__.__module__}.{exc_short_name}"
-                exc_msg = str(exc)
-                exc_slug = f"{exc_name}: {exc_msg}"
-                logger.info(log_prefix_rank_cur_id_loop + exc_slug)
-                logger.info(log_prefix_rank_cur_id_loop + "discarding this story")
-                continue  # to next cur_id
+        except Exception as exc:
+            exc_short_name = exc.__class__.__name__
+            exc_name = f"{exc.__class__.__module__}.{exc_short_name}"
+            exc_msg = str(exc)
+            exc_slug = f"{exc_name}: {exc_msg}"
+            logger.error(
+                log_prefix_rank_cur_id_loop + "asdfft: unexpected exception: " + exc_slug
+            )
+            tb_str = traceback.format_exc()
+            logger.error(log_prefix_rank_cur_id_loop + tb_str)
+            logger.info(log_prefix_rank_cur_id_loop + "discarding this story")
+            return None, False
 
-            except Exception as exc:
-                exc_short_name = exc.__class__.__name__
-                exc_name = f"{exc.__class__.__module__}.{exc_short_name}"
-                exc_msg = str(exc)
-                exc_slug = f"{exc_name}: {exc_msg}"
-                logger.error(
-                    log_prefix_rank_cur_id_loop
-                    + "asdfft: unexpected exception: "
-                    + exc_slug
-                )
-                tb_str = traceback.format_exc()
-                logger.error(log_prefix_rank_cur_id_loop + tb_str)
-                logger.info(log_prefix_rank_cur_id_loop + "discarding this story")
-                continue  # to next cur_id
+        if story_object:
+            schedule_next_firebaseio_query(story_object, rosters=rosters)
 
-        if not story_object:
-            logger.info(log_prefix_rank_cur_id_loop + "couldn't get story details")
-            logger.info(log_prefix_rank_cur_id_loop + "discarding this story")
-            continue  # to next cur_id
+    if not story_object:
+        logger.info(log_prefix_rank_cur_id_loop + "couldn't get story details")
+        logger.info(log_prefix_rank_cur_id_loop + "discarding this story")
+        return None, False
+
+    return story_object, we_have_to_save_story_object
+
+
+def prepare_story_card(story_object, page_package: PageOfStories, ppp_unique_id=""):
+    # badges depend on the page's story type, so this is done per page
+    log_prefix_rank_cur_id_loop = f"id={story_object.id}: ppp={ppp_unique_id}: "
+    log_prefix_local = f"ppp={ppp_unique_id} page={page_package.page_number}: "
+
+    # update badge
+    story_object.badges_slug = create_badges_slug(
+        story_object.id, page_package.story_type, page_package.rosters
+    )
 
-        # if not story_object.has_thumb:
-        #     logger.info(log_prefix_local + "story card will not have a thumbnail")
+    populate_story_card_html_in_story_object(story_object)
 
-        # update badge
-        story_object.badges_slug = create_badges_slug(
-            story_object.id, page_package.story_type, page_package.rosters
+    if not story_object.story_card_html:
+        logger.info(
+            log_prefix_local
+            + log_prefix_rank_cur_id_loop
+            + "couldn't create story_card_html"
+        )
+        logger.info(
+            log_prefix_local + log_prefix_rank_cur_id_loop + "discarding this story"
         )
+        return False
 
-        populate_story_card_html_in_story_object(story_object)
+    logger.info(log_prefix_rank_cur_id_loop + "successfully created story_card_html")
+    return True
 
-        if not story_object.story_card_html:
-            logger.info(
+
+def acquire_and_save_story(
+    cur_id,
+    rank,
+    ppp_unique_id="",
+    story_object=None,
+    story_as_dict=None,
+    rosters=None,
+):
+    story_object, we_have_to_save_story_object = acquire_story(
+        cur_id,
+        rank,
+        ppp_unique_id=ppp_unique_id,
+        story_object=story_object,
+        story_as_dict=story_as_dict,
+        rosters=rosters,
+    )
+
+    if story_object and we_have_to_save_story_object:
+        # so that the static parts of its story card are saved with it
+        get_story_card_static_fragments(story_object)
+        save_story_object_to_disk(
+            story_object=story_object, log_prefix=f"id={cur_id}: "
+        )
+
+    return story_object
+
+
+def wait_for_thumb_uploads(story_objects, log_prefix=""):
+    # returns the ids of stories whose thumb isn't in S3 (yet); a story whose thumb upload
+    # failed loses its thumb, and is saved that way
+    log_prefix_local = log_prefix + "wait_for_thumb_uploads: "
+
+    upload_future_by_story_id = {}
+    for story_object in story_objects:
+        if story_object.has_thumb:
+            upload_future = thumbs.get_thumb_upload_future(story_object)
+            if upload_future:
+                upload_future_by_story_id[story_object.id] = upload_future
+    if not upload_future_by_story_id:
+        return set()
+
+    _, not_done = concurrent.futures.wait(
+        set(upload_future_by_story_id.values()),
+        timeout=config.settings["S3_UPLOADS"]["PAGE_THUMBS_TIMEOUT_S"],
+    )
+
+    story_ids_without_uploaded_thumb = set()
+    for story_object in story_objects:
+        upload_future = upload_future_by_story_id.get(story_object.id)
+        if not upload_future:
+            continue
+
+        if upload_future in not_done:
+            # it may still make it, so the story keeps its thumb for later pages
+            logger.error(
                 log_prefix_local
-                + log_prefix_rank_cur_id_loop
-                + "couldn't create story_card_html"
-            )
-            logger.info(
-                log_prefix_local + log_prefix_rank_cur_id_loop + "discarding this story"
-            )
-            continue  # to next cur_id
-        else:
-            logger.info(
-                log_prefix_rank_cur_id_loop + "successfully created story_card_html"
+                + f"id={story_object.id}: thumb still uploading; leaving it off this page ~Tim~"
             )
+            story_ids_without_uploaded_thumb.add(story_object.id)
 
-        if we_have_to_save_story_object:
-            save_story_object_to_disk(
-                story_object=story_object, log_prefix=log_prefix_id
+        elif upload_future.exception():
+            logger.error(
+                log_prefix_local
+                + f"id={story_object.id}: thumb upload failed; dropping the thumb ~Tim~"
             )
-
-        page_html += story_object.story_card_html
-        page_html += "\n"  # so html source looks pretty
+            story_object.has_thumb = False
+            story_object.image_slug = ""
+            populate_story_card_html_in_story_object(story_object)
+            save_story_object_to_disk(
+                story_object=story_object, log_prefix=log_prefix_local
+            )
+            story_ids_without_uploaded_thumb.add(story_object.id)
+
+    return story_ids_without_uploaded_thumb
+
+
+def page_package_processor(page_package: PageOfStories, context: dict = None):
+    ppp_unique_id = utils_hash.get_sha1_of_current_time(
+        salt=utils_random.random_real(0, 1)
+    )
+
+    log_prefix_local = f"ppp={ppp_unique_id} page={page_package.page_number}: "
+
+    sup_slug = f"sup={context['supervisor_id']} "
+
+    logger.info(
+        sup_slug
+        + log_prefix_local
+        + f"story_type={page_package.story_type} len(story_ids)={len(page_package.story_ids)} story_ids={page_package.story_ids}"
+    )
+
+    page_processor_start_ts = utils_time.get_time_now_in_epoch_seconds_float()
+
+    # stories already acquired for an earlier page in this run are re-used
+    shared_story_objects = context.setdefault("shared_story_objects", {})
+
+    acquired_story_objects = []
+    for cur_id in page_package.story_ids:
+        if cur_id in shared_story_objects:
+            story_object = shared_story_objects[cur_id]
+        else:
+            story_object = load_cached_story_object(
+                cur_id, log_prefix=f"ppp={ppp_unique_id}: "
+            )
+            story_object = acquire_and_save_story(
+                cur_id,
+                context["story_ranks"][cur_id],
+                ppp_unique_id=ppp_unique_id,
+                story_object=story_object,
+                rosters=page_package.rosters,
+            )
+            shared_story_objects[cur_id] = story_object
+
+        if story_object:
+            acquired_story_objects.append(story_object)
+
+    # thumbs upload in the background; make sure this page's are in S3 before the page is
+    story_ids_without_uploaded_thumb = wait_for_thumb_uploads(
+        acquired_story_objects, log_prefix=sup_slug + log_prefix_local
+    )
+
+    story_objects = []
+    for story_object in acquired_story_objects:
+        # shallow copy, since badges and story card html differ between story types
+        story_object = copy.copy(story_object)
+        if story_object.id in story_ids_without_uploaded_thumb:
+            story_object.has_thumb = False
+            story_object.image_slug = ""
+        if prepare_story_card(story_object, page_package, ppp_unique_id=ppp_unique_id):
+            story_objects.append(story_object)
+
+    return ship_page_of_stories(
+        page_package=page_package,
+        story_objects=story_objects,
+        ppp_unique_id=ppp_unique_id,
+        page_processor_start_ts=page_processor_start_ts,
+        context=context,
+    )
+
+
+def ship_page_of_stories(
+    page_package: PageOfStories,
+    story_objects,
+    ppp_unique_id,
+    page_processor_start_ts,
+    context: dict = None,
+):
+    # story_objects must already be in rank order with their story card html populated
+    log_prefix_local = f"ppp={ppp_unique_id} page={page_package.page_number}: "
+
+    sup_slug = f"sup={context['supervisor_id']} "
+
+    # customize links and labels
+    # light mode
+    other_stories_links_lm = ""
+    other_stories_links_dm = ""
+    for each_story_type in page_package.rosters.keys():
+        if each_story_type == page_package.story_type:
+            continue
+        other_stories_links_lm += f'<a class="other-story-type" href="{get_story_page_url(each_story_type, 1, light_mode=True)}">{each_story_type}</a>\n'
+        other_stories_links_dm += f'<a class="other-story-type" href="{get_story_page_url(each_story_type, 1, light_mode=False)}">{each_story_type}</a>\n'
+    other_stories_links_lm = (
+        f'<div class="next-page-link-tray">{other_stories_links_lm}</div>'
+    )
+    other_stories_links_dm = (
+        f'<div class="next-page-link-tray">{other_stories_links_dm}</div>'
+    )
+
+    num_stories_on_page = len(story_objects)
 
     label_next_page = f"page {page_package.page_number + 1}"
     if page_package.is_first_page:
@@ -1544,11 +1851,36 @@ def page_package_processor(page_package: PageOfStories, context: dict = None):
         f'<div class="page-header-label">page {page_package.page_number} of {page_package.story_type}</div>\n'
         "</div>\n"
         "</div>\n\n"
-        '<div class="which-mode"><a href="{{ which_mode_url }}">{{ which_mode_label }}</a></div>\n'
-        "<table>\n"
     )
 
-    stories_channel_contents_bottom_section = "</table>\n</div>\n"
+    which_mode_lm = (
+        '<div class="which-mode"><a href="'
+        + get_story_page_url(
+            page_package.story_type,
+            page_package.page_number,
+            light_mode=False,
+            from_other_mode=True,
+        )
+        + '">dark mode</a></div>\n'
+    )
+    which_mode_dm = (
+        '<div class="which-mode"><a href="'
+        + get_story_page_url(
+            page_package.story_type,
+            page_package.page_number,
+            light_mode=True,
+            from_other_mode=True,
+        )
+        + '">light mode</a></div>\n'
+    )
+
+    # the story cards are the bulk of the page and are the same in both modes, so
+    # both pages are rendered from this one list of parts
+    story_cards_html = ["<table>\n"]
+    for story_object in story_objects:
+        story_cards_html.append(story_object.story_card_html)
+        story_cards_html.append("\n")  # so html source looks pretty
+    story_cards_html.append("</table>\n</div>\n")
 
     html_generation_end_ts = utils_time.get_time_now_in_epoch_seconds_float()
     now_in_epoch_seconds = int(html_generation_end_ts)
@@ -1559,55 +1891,24 @@ def page_package_processor(page_package: PageOfStories, context: dict = None):
     )
     html_generation_time_slug = f'<div id="html-generation-time" class="html-generation-time" data-html-generation-time-in-epoch-seconds="{now_in_epoch_seconds}">This page was generated in {how_long_to_generate_page_html} at {now_in_utc_readable}<span id="how-long-ago"></span>.</div>\n'
 
-    # prepare light mode page
-    stories_channel_contents_top_plus_page_html_plus_bottom = (
-        stories_channel_contents_top_section
-        + page_html
-        + stories_channel_contents_bottom_section
-    )
+    stories_page_template = get_stories_page_template()
 
-    stories_channel_contents_lm = (
-        stories_channel_contents_top_plus_page_html_plus_bottom
-        + more_button_lm
-        + html_generation_time_slug
-    )
-
-    with open(
-        os.path.join(config.settings["TEMPLATES_SERVICE_DIR"], "stories.html"),
-        "r",
-        encoding="utf-8",
-    ) as f:
-        stories_html_page_template_lm = f.read()
-
-    stories_html_page_template_lm = stories_html_page_template_lm.replace(
-        "{{ canonical_url }}", config.settings["CANONICAL_URL"]["LM"]
-    )
-    stories_html_page_template_lm = stories_html_page_template_lm.replace(
-        "{{ header_hyperlink }}", config.settings["HEADER_HYPERLINK"]["LM"]
-    )
-    stories_html_page_template_lm = stories_html_page_template_lm.replace(
-        "{{ short_url_display }}", config.settings["SHORT_URL_DISPLAY"]
-    )
-    stories_html_page_template_lm = stories_html_page_template_lm.replace(
-        "{{ static_css_url }}", f"{config.settings['CSS_URL']}styles.css"
-    )
-    stories_html_page_template_lm = stories_html_page_template_lm.replace(
-        "{{ stories }}", stories_channel_contents_lm
-    )
-    stories_html_page_template_lm = stories_html_page_template_lm.replace(
-        "{{ about_url }}", config.settings["ABOUT_HTML_URL"]["LM"]
-    )
-    stories_html_page_template_lm = stories_html_page_template_lm.replace(
-        "{{ which_mode_url }}",
-        get_story_page_url(
-            page_package.story_type,
-            page_package.page_number,
-            light_mode=False,
-            from_other_mode=True,
-        ),
-    )
-    stories_html_page_template_lm = stories_html_page_template_lm.replace(
-        "{{ which_mode_label }}", "dark mode"
+    # prepare light mode page
+    stories_html_page_lm = stories_page_template.render(
+        {
+            "about_url": config.settings["ABOUT_HTML_URL"]["LM"],
+            "canonical_url": config.settings["CANONICAL_URL"]["LM"],
+            "header_hyperlink": config.settings["HEADER_HYPERLINK"]["LM"],
+            "short_url_display": config.settings["SHORT_URL_DISPLAY"],
+            "static_css_url": f"{config.settings['CSS_URL']}styles.css",
+            "stories": [
+                stories_channel_contents_top_section,
+                which_mode_lm,
+                *story_cards_html,
+                more_button_lm,
+                html_generation_time_slug,
+            ],
+        }
     )
 
     filename_lm = get_html_page_filename(
@@ -1615,88 +1916,45 @@ def page_package_processor(page_package: PageOfStories, context: dict = None):
     )
     full_path_lm = os.path.join(config.settings["COMPLETED_PAGES_DIR"], filename_lm)
 
-    upload_attempts_remaining = 3
-    delay_between_upload_attempts = 8
-    while True:
-        if upload_attempts_remaining == 0:
-            logger.error(
-                log_prefix_local
-                + f"failed to upload page {page_package.page_number} of {page_package.story_type} ~Tim~"
-            )
-            return None
-
-        try:
-            with open(full_path_lm, mode="w", encoding="utf-8") as f:
-                f.write(stories_html_page_template_lm)
-                f.close()
-
-            utils_aws.upload_page_of_stories(
-                page_filename=filename_lm, log_prefix=sup_slug + log_prefix_local
-            )
-            break
-        except Exception as exc:
-            upload_attempts_remaining -= 1
-            exc_name = exc.__class__.__name__
-            exc_msg = str(exc)
-            exc_slug = f"{exc_name}: {exc_msg}"
-            logger.error(
-                log_prefix_local + exc_slug + f" {upload_attempts_remaining=} ~Tim~"
-            )
-            time.sleep(delay_between_upload_attempts)
-            delay_between_upload_attempts *= 2
+    # retries (with jittered backoff) happen inside the uploader
+    try:
+        with open(full_path_lm, mode="w", encoding="utf-8") as f:
+            f.write(stories_html_page_lm)
 
-    num_stories_on_page = stories_html_page_template_lm.count("data-story-id")
+        utils_aws.upload_page_of_stories(
+            page_filename=filename_lm,
+            content_hash=get_page_content_hash(
+                stories_html_page_lm, html_generation_time_slug
+            ),
+            log_prefix=sup_slug + log_prefix_local,
+        )
+    except Exception as exc:
+        exc_name = exc.__class__.__name__
+        exc_msg = str(exc)
+        exc_slug = f"{exc_name}: {exc_msg}"
+        logger.error(log_prefix_local + exc_slug + " ~Tim~")
+        logger.error(
+            log_prefix_local
+            + f"failed to upload page {page_package.page_number} of {page_package.story_type} ~Tim~"
+        )
+        return None
 
     # prepare dark mode page
-    stories_channel_contents_dm = (
-        stories_channel_contents_top_plus_page_html_plus_bottom
-        + more_button_dm
-        + html_generation_time_slug
-    )
-
-    with open(
-        os.path.join(config.settings["TEMPLATES_SERVICE_DIR"], "stories.html"),
-        mode="r",
-        encoding="utf-8",
-    ) as f:
-        stories_html_page_template_dm = f.read()
-
-    stories_html_page_template_dm = stories_html_page_template_dm.replace(
-        "{{ canonical_url }}",
-        config.settings["CANONICAL_URL"]["DM"],
-    )
-    stories_html_page_template_dm = stories_html_page_template_dm.replace(
-        "{{ header_hyperlink }}",
-        config.settings["HEADER_HYPERLINK"]["DM"],
-    )
-    stories_html_page_template_dm = stories_html_page_template_dm.replace(
-        "{{ short_url_display }}",
-        config.settings["SHORT_URL_DISPLAY"],
-    )
-    stories_html_page_template_dm = stories_html_page_template_dm.replace(
-        "{{ static_css_url }}",
-        f"{config.settings['CSS_URL']}styles-dm.css",
-    )
-    stories_html_page_template_dm = stories_html_page_template_dm.replace(
-        "{{ about_url }}", config.settings["ABOUT_HTML_URL"]["DM"]
-    )
-    stories_html_page_template_dm = stories_html_page_template_dm.replace(
-        "{{ stories }}", stories_channel_contents_dm
-    )
-    stories_html_page_template_dm = stories_html_page_template_dm.replace(
-        "{{ about_url }}", config.settings["ABOUT_HTML_URL"]["DM"]
-    )
-    stories_html_page_template_dm = stories_html_page_template_dm.replace(
-        "{{ which_mode_url }}",
-        get_story_page_url(
-            page_package.story_type,
-            page_package.page_number,
-            light_mode=True,
-            from_other_mode=True,
-        ),
-    )
-    stories_html_page_template_dm = stories_html_page_template_dm.replace(
-        "{{ which_mode_label }}", "light mode"
+    stories_html_page_dm = stories_page_template.render(
+        {
+            "about_url": config.settings["ABOUT_HTML_URL"]["DM"],
+            "canonical_url": config.settings["CANONICAL_URL"]["DM"],
+            "header_hyperlink": config.settings["HEADER_HYPERLINK"]["DM"],
+            "short_url_display": config.settings["SHORT_URL_DISPLAY"],
+            "static_css_url": f"{config.settings['CSS_URL']}styles-dm.css",
+            "stories": [
+                stories_channel_contents_top_section,
+                which_mode_dm,
+                *story_cards_html,
+                more_button_dm,
+                html_generation_time_slug,
+            ],
+        }
     )
 
     filename_dm = get_html_page_filename(
@@ -1706,10 +1964,14 @@ def page_package_processor(page_package: PageOfStories, context: dict = None):
 
     try:
         with open(full_path_dm, mode="w", encoding="utf-8") as f:
-            f.write(stories_html_page_template_dm)
+            f.write(stories_html_page_dm)
 
         utils_aws.upload_page_of_stories(
-            page_filename=filename_dm, log_prefix=sup_slug + log_prefix_local
+            page_filename=filename_dm,
+            content_hash=get_page_content_hash(
+                stories_html_page_dm, html_generation_time_slug
+            ),
+            log_prefix=sup_slug + log_prefix_local,
         )
     except Exception as exc:
         exc_name = exc.__class__.__name__
@@ -1734,14 +1996,46 @@ def page_package_processor(page_package: PageOfStories, context: dict = None):
     return page_package.page_number
 
 
-def populate_story_card_html_in_story_object(story_object):
-    # slugs must begin and end with <div> tags
+def get_story_card_static_key(story_object):
+    # everything the static fragments of a story card are built from; when any of it
+    # changes (e.g., the title is edited or a thumb is found), the fragments are rebuilt
+    return utils_hash.get_sha1_of_string(
+        "\x00".join(
+            str(x)
+            for x in [
+                STORY_CARD_STATIC_HTML_VERSION,
+                config.settings["SLUGS"]["MAX_SUBSTRING_LENGTH"],
+                story_object.id,
+                story_object.title,
+                story_object.title_hyperlink,
+                story_object.image_slug,
+                story_object.github_languages_slug,
+                story_object.story_content_type_slug,
+                story_object.has_outbound_url,
+                story_object.hostname_dict["slug"],
+                story_object.by,
+                story_object.reading_time,
+                story_object.pdf_page_count,
+            ]
+        ),
+        length=40,
+    )
 
-    data_separator_slug = f'<div class="data-separator">{config.settings["SYMBOLS"]["DATA_SEPARATOR"]}</div>'
 
-    story_card_html = ""
+def get_story_card_static_fragments(story_object):
+    # returns [head, tail]: the parts of the story card before and after the badges,
+    # score, comments and time ago, which are the only parts that change between runs
+    static_key = get_story_card_static_key(story_object)
 
-    story_card_html += (
+    # the dict is shared with shallow copies of story_object, so a story on several
+    # pages builds its fragments once, and they're saved along with the story
+    if not hasattr(story_object, "story_card_static_fragments"):
+        story_object.story_card_static_fragments = {}
+    static_fragments = story_object.story_card_static_fragments.get(static_key)
+    if static_fragments:
+        return static_fragments
+
+    head = (
         f'<tr data-story-id="{story_object.id}"><td>'
         + '<table class="story-details">'
         + "<tr><td>"
@@ -1749,19 +2043,17 @@ def populate_story_card_html_in_story_object(story_object):
     )
 
     if story_object.image_slug:
-        story_card_html += story_object.image_slug
+        head += story_object.image_slug
 
-    story_card_html += "</td></tr>"
+    head += "</td></tr>"
 
     if story_object.github_languages_slug:
-        story_card_html += (
-            "<tr><td>" + story_object.github_languages_slug + "</td></tr>"
-        )
+        head += "<tr><td>" + story_object.github_languages_slug + "</td></tr>"
 
-    story_card_html += '<tr><td><div class="title-and-domain-bar">'
-    story_card_html += '<div class="title-part">'
+    head += '<tr><td><div class="title-and-domain-bar">'
+    head += '<div class="title-part">'
 
-    story_card_html += (
+    head += (
         f'<a href="{story_object.title_hyperlink}">'
         + utils_text.insert_possible_line_breaks(
             story_object.title.replace("<", "&lt;")
@@ -1770,53 +2062,29 @@ def populate_story_card_html_in_story_object(story_object):
     )
 
     if story_object.story_content_type_slug:
-        story_card_html += story_object.story_content_type_slug
+        head += story_object.story_content_type_slug
 
-    story_card_html += "</div>"
+    head += "</div>"
 
     if story_object.has_outbound_url:
-        story_card_html += (
+        head += (
             '<div class="domain-part">' + story_object.hostname_dict["slug"] + "</div>"
         )
 
-    story_card_html += "</div></td></tr>"
-
-    story_card_html += '<tr><td><div class="badges-points-comments-time-author-bar">'
-
-    if story_object.badges_slug:
-        story_card_html += story_object.badges_slug + data_separator_slug
-
-    story_card_html += (
-        '<div class="story-score">'
-        + utils_text.add_singular_plural(story_object.score, "point")
-        + "</div>"
-        + data_separator_slug
-    )
+    head += "</div></td></tr>"
 
-    story_card_html += (
-        '<div class="story-descendants">'
-        + f'<a href="{story_object.hn_comments_url}">'
-        + utils_text.add_singular_plural(story_object.descendants, "comment")
-        + "</a></div>"
-        + data_separator_slug
-    )
-
-    story_card_html += (
-        f'<div class="story-time-ago" title="{story_object.publication_time_ISO_8601}">'
-        + utils_time.how_long_ago_human_readable(story_object.time)
-        + "&nbsp;</div>"
-    )
+    head += '<tr><td><div class="badges-points-comments-time-author-bar">'
 
-    story_card_html += (
+    tail = (
         f'<div class="story-byline">by <a href="https://news.ycombinator.com/user?id={story_object.by}">'
         + story_object.by
         + "</a></div>"
     )
 
-    story_card_html += "</div></td></tr>"
+    tail += "</div></td></tr>"
 
     if story_object.reading_time:
-        story_card_html += (
+        tail += (
             "<tr><td>"
             + '<div class="reading-time-bar"><div class="estimated-reading-time">⏱️&nbsp;'
             + utils_text.add_singular_plural(
@@ -1826,7 +2094,7 @@ def populate_story_card_html_in_story_object(story_object):
         )
 
     if story_object.pdf_page_count:
-        story_card_html += (
+        tail += (
             '<tr><td><div class="reading-time-bar">'
             + '<div class="estimated-reading-time">📄&nbsp;'
             + utils_text.add_singular_plural(
@@ -1835,7 +2103,49 @@ def populate_story_card_html_in_story_object(story_object):
             + "</div></div></td></tr>"
         )
 
-    story_card_html += "</table></td></tr>"
+    tail += "</table></td></tr>"
+
+    # only the current fragments are kept
+    static_fragments = [head, tail]
+    story_object.story_card_static_fragments.clear()
+    story_object.story_card_static_fragments[static_key] = static_fragments
+    return static_fragments
+
+
+def populate_story_card_html_in_story_object(story_object):
+    # slugs must begin and end with <div> tags
+
+    data_separator_slug = f'<div class="data-separator">{config.settings["SYMBOLS"]["DATA_SEPARATOR"]}</div>'
+
+    head, tail = get_story_card_static_fragments(story_object)
+
+    story_card_html = head
+
+    if story_object.badges_slug:
+        story_card_html += story_object.badges_slug + data_separator_slug
+
+    story_card_html += (
+        '<div class="story-score">'
+        + utils_text.add_singular_plural(story_object.score, "point")
+        + "</div>"
+        + data_separator_slug
+    )
+
+    story_card_html += (
+        '<div class="story-descendants">'
+        + f'<a href="{story_object.hn_comments_url}">'
+        + utils_text.add_singular_plural(story_object.descendants, "comment")
+        + "</a></div>"
+        + data_separator_slug
+    )
+
+    story_card_html += (
+        f'<div class="story-time-ago" title="{story_object.publication_time_ISO_8601}">'
+        + utils_time.how_long_ago_human_readable(story_object.time)
+        + "&nbsp;</div>"
+    )
+
+    story_card_html += tail
 
     story_object.story_card_html = story_card_html
 
@@ -1847,89 +2157,318 @@ def query_firebaseio_for_story_data(item_id=None):
     )
 
 
+def load_cached_story_objects(story_ids, log_prefix=""):
+    # one query for all of story_ids; stories below the minimum story_object_version count as not cached
+    cached_story_objects = get_story_store().get_many(
+        story_ids, min_version=REQUIRED_MINIMUM_STORY_OBJECT_VERSION
+    )
+    for cur_id in story_ids:
+        if cur_id not in cached_story_objects:
+            logger.info(log_prefix + f"id={cur_id}: no cached story found")
+    return cached_story_objects
+
+
 def save_story_object_to_disk(story_object=None, log_prefix=""):
-    log_prefix += "save_story_object_to_disk: "
-    try:
-        with open(
-            os.path.join(
-                config.settings["CACHED_STORIES_DIR"],
-                get_pickle_filename(story_object.id),
-            ),
-            mode="wb",
-        ) as file:
-            pickle.dump(story_object, file)
-    except Exception as exc:
-        exc_name = f"{exc.__class__.__module__}.{exc.__class__.__name__}"
-        exc_msg = str(exc)
-        exc_slug = f"{exc_name}: {exc_msg}"
-        logger.info(log_prefix + exc_slug)
+    save_story_objects_to_disk([story_object], log_prefix=log_prefix)
+
+
+def save_story_objects_to_disk(story_objects, log_prefix=""):
+    log_prefix += "save_story_objects_to_disk: "
+    if not story_objects:
+        return
 
     try:
-        with open(
-            os.path.join(
-                config.settings["CACHED_STORIES_DIR"],
-                f"id-{story_object.id}.json",
-            ),
-            mode="w",
-            encoding="utf-8",
-        ) as f:
-            f.write(json.dumps(story_object.to_dict(), indent=4, sort_keys=True))
+        get_story_store().put_many(story_objects)
     except Exception as exc:
         exc_name = f"{exc.__class__.__module__}.{exc.__class__.__name__}"
         exc_msg = str(exc)
         exc_slug = f"{exc_name}: {exc_msg}"
         logger.info(log_prefix + exc_slug)
 
+    if not config.debug_flags["DEBUG_FLAG_EXPORT_STORY_JSON"]:
+        return
 
-def supervisor(cur_story_type):
-    unique_id = utils_hash.get_sha1_of_current_time(salt=utils_random.random_real(0, 1))
-    log_prefix = f"sup={unique_id}: "
+    # human-readable copy for debugging only; the story store is the real cache
+    for story_object in story_objects:
+        try:
+            with open(
+                os.path.join(
+                    config.settings["CACHED_STORIES_DIR"],
+                    f"id-{story_object.id}.json",
+                ),
+                mode="w",
+                encoding="utf-8",
+            ) as f:
+                f.write(json.dumps(story_object.to_dict(), indent=4, sort_keys=True))
+        except Exception as exc:
+            exc_name = f"{exc.__class__.__module__}.{exc.__class__.__name__}"
+            exc_msg = str(exc)
+            exc_slug = f"{exc_name}: {exc_msg}"
+            logger.info(log_prefix + f"id={story_object.id}: " + exc_slug)
 
-    supervisor_start_ts = utils_time.get_time_now_in_epoch_seconds_float()
 
-    logger.info(
-        log_prefix
-        + f"started at {utils_time.convert_epoch_seconds_to_utc(int(supervisor_start_ts))}"
-    )
+def get_host_for_story(story_object=None, story_as_dict=None):
+    # hostname (minus www) of the story's outbound url, or None if it has none
+    if story_object:
+        if not story_object.has_outbound_url:
+            return None
+        return story_object.hostname_dict["minus_www"]
 
-    rosters = {}
-    for roster_story_type in config.settings["SCRAPING"]["STORY_ROSTERS"]:
-        try:
-            rosters[roster_story_type] = thnr_scrapers.get_roster_for_story_type(
-                roster_story_type=roster_story_type, log_prefix=log_prefix
-            )
-            if rosters[roster_story_type]:
+    if story_as_dict and story_as_dict.get("url"):
+        _, domain_minus_www = utils_text.get_domains_from_url(story_as_dict["url"])
+        return domain_minus_www
+
+    return None
+
+
+def get_host_semaphore(host, context):
+    # only ever called from the event loop thread, so no lock is needed
+    host_semaphores = context["host_semaphores"]
+    if host not in host_semaphores:
+        host_semaphores[host] = asyncio.Semaphore(config.max_workers_per_host)
+    return host_semaphores[host]
+
+
+def get_story_ranks(page_packages):
+    # a story's rank is its best (lowest) position on any page it appears on
+    story_ranks = {}
+    for each_page_package in page_packages:
+        for rank, cur_id in enumerate(each_page_package.story_ids):
+            if cur_id not in story_ranks or rank < story_ranks[cur_id]:
+                story_ranks[cur_id] = rank
+    return story_ranks
+
+
+def get_story_task(cur_id, ppp_unique_id, context):
+    # each story is acquired once per run, however many pages (of however many story types) it appears on
+    story_tasks = context["story_tasks"]
+    if cur_id not in story_tasks:
+        story_tasks[cur_id] = asyncio.create_task(
+            acquire_story_async(cur_id, ppp_unique_id, context)
+        )
+    return story_tasks[cur_id]
+
+
+async def acquire_story_async(cur_id, ppp_unique_id, context: dict):
+    log_prefix_rank_cur_id_loop = f"id={cur_id}: ppp={ppp_unique_id}: "
+    rank = context["story_ranks"][cur_id]
+
+    story_as_dict = None
+    story_object = context["cached_story_objects"].get(cur_id)
+    if story_object and is_due_for_reacquisition(story_object):
+        story_object = None
+
+    if not story_object:
+        async with context["story_semaphore"]:
+            try:
+                story_as_dict = await asyncio.to_thread(
+                    query_firebaseio_for_story_data, item_id=cur_id
+                )
+            except Exception as exc:
+                exc_name = f"{exc.__class__.__module__}.{exc.__class__.__name__}"
+                exc_slug = f"{exc_name}: {exc}"
                 logger.info(
-                    log_prefix
-                    + f"ingested roster for {roster_story_type} stories; length: {len(rosters[roster_story_type])}"
+                    log_prefix_rank_cur_id_loop
+                    + "unexpected problem querying firebaseio: "
+                    + exc_slug
                 )
-            else:
+                logger.info(log_prefix_rank_cur_id_loop + "discarding this story")
+                return None
+
+            if not story_as_dict:
                 logger.info(
-                    log_prefix
-                    + f"failed to ingest roster for {roster_story_type} stories ~Tim~"
+                    log_prefix_rank_cur_id_loop
+                    + "failed to receive story details from firebaseio.com"
                 )
-        except Exception as exc:
-            logger.info(
-                log_prefix
-                + f"failed to ingest roster for {roster_story_type} stories: {exc} ~Tim~"
+                logger.info(log_prefix_rank_cur_id_loop + "discarding this story")
+                return None
+
+    # only stories acquired for the first time fetch their outbound url,
+    # so only those count against the per-host limit
+    host = None
+    if not story_object:
+        host = get_host_for_story(story_as_dict=story_as_dict)
+
+    if host:
+        async with get_host_semaphore(host, context):
+            async with context["story_semaphore"]:
+                return await asyncio.to_thread(
+                    acquire_and_save_story,
+                    cur_id,
+                    rank,
+                    ppp_unique_id=ppp_unique_id,
+                    story_as_dict=story_as_dict,
+                    rosters=context["rosters"],
+                )
+
+    async with context["story_semaphore"]:
+        return await asyncio.to_thread(
+            acquire_and_save_story,
+            cur_id,
+            rank,
+            ppp_unique_id=ppp_unique_id,
+            story_object=story_object,
+            story_as_dict=story_as_dict,
+            rosters=context["rosters"],
+        )
+
+
+async def load_and_freshen_cached_story_objects(story_ids, context: dict):
+    # cached stories that are due get freshened in one batch of concurrent
+    # firebaseio queries instead of one query per story
+    log_prefix = f"sup={context['supervisor_id']}: "
+
+    cached_story_objects = await asyncio.to_thread(
+        load_cached_story_objects, story_ids
+    )
+
+    # these go through acquire_story_async() like new stories, which also puts them under
+    # their host's limit
+    story_ids_to_reacquire = [
+        story_id
+        for story_id, x in cached_story_objects.items()
+        if is_due_for_reacquisition(x)
+    ]
+    for story_id in story_ids_to_reacquire:
+        del cached_story_objects[story_id]
+
+    story_objects_to_freshen = [
+        x
+        for x in cached_story_objects.values()
+        if is_due_for_freshening(x, rosters=context["rosters"])
+    ]
+    logger.info(
+        log_prefix
+        + f"found {len(cached_story_objects) + len(story_ids_to_reacquire)} cached stories; "
+        + f"{len(story_objects_to_freshen)} due for freshening, {len(story_ids_to_reacquire)} to acquire again"
+    )
+
+    if story_objects_to_freshen:
+        results = await freshen_up_many_async(
+            story_objects_to_freshen, rosters=context["rosters"], log_prefix=log_prefix
+        )
+
+        # stories whose query failed stay due and get another try in acquire_story()
+        freshened_story_objects = [
+            x for x in story_objects_to_freshen if results.get(x.id)
+        ]
+        await asyncio.to_thread(
+            save_story_objects_to_disk, freshened_story_objects, log_prefix=log_prefix
+        )
+
+    return cached_story_objects
+
+
+async def process_story_async(cur_id, ppp_unique_id, context: dict):
+    story_object = await get_story_task(cur_id, ppp_unique_id, context)
+    if not story_object:
+        return None
+
+    # shallow copy, since badges and story card html differ between story types
+    return copy.copy(story_object)
+
+
+async def process_page_package_async(page_package: PageOfStories, context: dict):
+    ppp_unique_id = utils_hash.get_sha1_of_current_time(
+        salt=utils_random.random_real(0, 1)
+    )
+
+    log_prefix_local = f"ppp={ppp_unique_id} page={page_package.page_number}: "
+
+    sup_slug = f"sup={context['supervisor_id']} "
+
+    logger.info(
+        sup_slug
+        + log_prefix_local
+        + f"story_type={page_package.story_type} len(story_ids)={len(page_package.story_ids)} story_ids={page_package.story_ids}"
+    )
+
+    page_processor_start_ts = utils_time.get_time_now_in_epoch_seconds_float()
+
+    results = await asyncio.gather(
+        *[
+            process_story_async(cur_id, ppp_unique_id, context)
+            for cur_id in page_package.story_ids
+        ],
+        return_exceptions=True,
+    )
+
+    acquired_story_objects = []
+    for cur_id, res in zip(page_package.story_ids, results):
+        if isinstance(res, Exception):
+            exc_name = f"{res.__class__.__module__}.{res.__class__.__name__}"
+            logger.error(
+                f"id={cur_id}: ppp={ppp_unique_id}: unexpected exception: {exc_name}: {res}"
             )
+            logger.info(f"id={cur_id}: ppp={ppp_unique_id}: discarding this story")
+        elif res:
+            acquired_story_objects.append(res)
+
+    # thumbs upload in the background; make sure this page's are in S3 before the page is
+    story_ids_without_uploaded_thumb = await asyncio.to_thread(
+        wait_for_thumb_uploads,
+        acquired_story_objects,
+        log_prefix=sup_slug + log_prefix_local,
+    )
 
-    if len(rosters[cur_story_type]) == 0:
-        logger.info(
-            log_prefix
-            + f"failed to ingest roster '{cur_story_type}' after {config.settings['SCRAPING']['NUM_RETRIES_FOR_HN_FEEDS']} tries. will proceed with empty roster. ~Tim~"
+    story_objects = []
+    for story_object in acquired_story_objects:
+        if story_object.id in story_ids_without_uploaded_thumb:
+            story_object.has_thumb = False
+            story_object.image_slug = ""
+        if prepare_story_card(story_object, page_package, ppp_unique_id=ppp_unique_id):
+            story_objects.append(story_object)
+
+    return await asyncio.to_thread(
+        ship_page_of_stories,
+        page_package=page_package,
+        story_objects=story_objects,
+        ppp_unique_id=ppp_unique_id,
+        page_processor_start_ts=page_processor_start_ts,
+        context=context,
+    )
+
+
+async def run_story_engine(page_packages, context: dict):
+    # every story is its own task, limited by config.max_workers overall and by
+    # config.max_workers_per_host per outbound host; each page ships as soon as
+    # all of its stories are done
+    loop = asyncio.get_running_loop()
+
+    # extra threads so that shipping a page never waits behind story work
+    loop.set_default_executor(
+        concurrent.futures.ThreadPoolExecutor(
+            max_workers=config.max_workers + len(page_packages)
+        )
+    )
+
+    engine_context = dict(context)
+    engine_context["story_semaphore"] = asyncio.Semaphore(config.max_workers)
+    engine_context["host_semaphores"] = {}
+    engine_context["story_tasks"] = {}
+    engine_context["cached_story_objects"] = (
+        await load_and_freshen_cached_story_objects(
+            list(context["story_ranks"].keys()), engine_context
         )
-        rosters[roster_story_type] = []
+    )
+
+    return await asyncio.gather(
+        *[
+            process_page_package_async(each_page_package, engine_context)
+            for each_page_package in page_packages
+        ],
+        return_exceptions=True,
+    )
+
 
+def build_page_packages(story_type, rosters):
     page_packages = []
     cur_page_number = 1
     cur_story_ids = []
-    cur_roster = list(rosters[cur_story_type])
+    cur_roster = list(rosters[story_type])
     is_first_page = True
     is_last_page = False
 
-    pages_in_progress = set()
-
     while cur_roster:
         while (
             cur_roster
@@ -1941,7 +2480,7 @@ def supervisor(cur_story_type):
                 is_last_page = True
 
         cur_page_package = PageOfStories(
-            cur_story_type,
+            story_type,
             cur_page_number,
             list(cur_story_ids),
             dict(rosters),
@@ -1949,42 +2488,107 @@ def supervisor(cur_story_type):
             is_last_page,
         )
 
-        pages_in_progress.add(cur_page_number)
-
         page_packages.append(cur_page_package)
         cur_page_number += 1
         cur_story_ids.clear()
         is_first_page = False
 
+    return page_packages
+
+
+def supervisor(cur_story_type):
+    # cur_story_type "all" renders every story type's pages in one run, processing
+    # each story once no matter how many rosters it's on
+    unique_id = utils_hash.get_sha1_of_current_time(salt=utils_random.random_real(0, 1))
+    log_prefix = f"sup={unique_id}: "
+
+    supervisor_start_ts = utils_time.get_time_now_in_epoch_seconds_float()
+
+    logger.info(
+        log_prefix
+        + f"started at {utils_time.convert_epoch_seconds_to_utc(int(supervisor_start_ts))}"
+    )
+
+    rosters = {}
+    for roster_story_type in config.settings["SCRAPING"]["STORY_ROSTERS"]:
+        try:
+            rosters[roster_story_type] = thnr_scrapers.get_roster_for_story_type(
+                roster_story_type=roster_story_type, log_prefix=log_prefix
+            )
+            if rosters[roster_story_type]:
+                logger.info(
+                    log_prefix
+                    + f"ingested roster for {roster_story_type} stories; length: {len(rosters[roster_story_type])}"
+                )
+            else:
+                logger.info(
+                    log_prefix
+                    + f"failed to ingest roster for {roster_story_type} stories ~Tim~"
+                )
+        except Exception as exc:
+            logger.info(
+                log_prefix
+                + f"failed to ingest roster for {roster_story_type} stories: {exc} ~Tim~"
+            )
+
+    if cur_story_type == "all":
+        story_types_to_render = list(config.settings["SCRAPING"]["STORY_ROSTERS"])
+    else:
+        story_types_to_render = [cur_story_type]
+
+    for roster_story_type in config.settings["SCRAPING"]["STORY_ROSTERS"]:
+        if not rosters.get(roster_story_type):
+            if roster_story_type in story_types_to_render:
+                logger.info(
+                    log_prefix
+                    + f"failed to ingest roster '{roster_story_type}' after {config.settings['SCRAPING']['NUM_RETRIES_FOR_HN_FEEDS']} tries. will proceed with empty roster. ~Tim~"
+                )
+            rosters[roster_story_type] = []
+
+    page_packages = []
+    for each_story_type in story_types_to_render:
+        page_packages += build_page_packages(each_story_type, rosters)
+
+    pages_in_progress = set(
+        (each_page_package.story_type, each_page_package.page_number)
+        for each_page_package in page_packages
+    )
+
+    story_ranks = get_story_ranks(page_packages)
+    num_story_ids_on_pages = sum(len(x.story_ids) for x in page_packages)
+    logger.info(
+        log_prefix
+        + f"{num_story_ids_on_pages} stories on {len(page_packages)} pages of {story_types_to_render}; {len(story_ranks)} unique stories to process"
+    )
+
+    context = {
+        "supervisor_id": unique_id,
+        "story_ranks": story_ranks,
+        "rosters": rosters,
+    }
+
     if config.debug_flags["DEBUG_FLAG_FORCE_SINGLE_THREAD_EXECUTION"]:
         for each_page in page_packages:
             res = page_package_processor(
                 page_package=each_page,
-                context={"supervisor_id": unique_id},
+                context=context,
             )
             if res:
-                pages_in_progress.remove(res)
+                pages_in_progress.remove((each_page.story_type, res))
     else:
-        page_processing_job_futures = []
-
-        with concurrent.futures.ThreadPoolExecutor(
-            max_workers=config.max_workers
-        ) as executor:
-            for each_page_package in page_packages:
-                page_processing_job_futures.append(
-                    executor.submit(
-                        page_package_processor,
-                        page_package=each_page_package,
-                        context={"supervisor_id": unique_id},
-                    )
-                )
+        page_results = asyncio.run(run_story_engine(page_packages, context=context))
 
-        concurrent.futures.wait(page_processing_job_futures)
-
-        for future in page_processing_job_futures:
-            future_result = future.result()
-            if future_result:
-                pages_in_progress.remove(int(future_result))
+        for each_page_package, page_result in zip(page_packages, page_results):
+            if isinstance(page_result, Exception):
+                exc_name = f"{page_result.__class__.__module__}.{page_result.__class__.__name__}"
+                logger.error(
+                    log_prefix
+                    + f"page {each_page_package.page_number} of {each_page_package.story_type}: unexpected exception: {exc_name}: {page_result} ~Tim~"
+                )
+            elif page_result:
+                pages_in_progress.remove(
+                    (each_page_package.story_type, int(page_result))
+                )
 
     if pages_in_progress:
         logger.warning(
@@ -1993,6 +2597,20 @@ def supervisor(cur_story_type):
     else:
         logger.info(log_prefix + "shipped all pages")
 
+    utils_http.log_session_pool_stats(log_prefix=log_prefix)
+    utils_http.log_host_scheduler_stats(log_prefix=log_prefix)
+    utils_http.log_http_cache_stats(log_prefix=log_prefix)
+    utils_http.log_render_decision_stats(log_prefix=log_prefix)
+    utils_http.save_render_history(log_prefix=log_prefix)
+    utils_http.log_negative_cache_stats(log_prefix=log_prefix)
+    utils_http.save_negative_cache(log_prefix=log_prefix)
+    thumbs.log_image_pipeline_stats(log_prefix=log_prefix)
+    thumbs.shutdown_image_pipeline()
+    utils_aws.shutdown_uploader(log_prefix=log_prefix)
+    utils_aws.log_upload_stats(log_prefix=log_prefix)
+    utils_browser.log_browser_pool_stats(log_prefix=log_prefix)
+    utils_browser.shutdown()
+
     supervisor_end_ts = utils_time.get_time_now_in_epoch_seconds_float()
 
     h, m, s, s_frac = utils_time.convert_time_duration_to_hms(
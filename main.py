@@ -169,8 +169,6 @@ def main():
         logger.error(log_prefix + f"{tb_str}")
         exit_code = 1
 
-    delay = 60
-
     for handler in logging.getLogger().handlers:
         if hasattr(handler, "stop"):
             handler.stop()
@@ -178,12 +176,6 @@ def main():
     for handler in downstream_handlers_objects:
         handler.close()
 
-    logger.info(
-        log_prefix
-        + f"Pausing for {delay} seconds before exiting (to let Node/Playwright tidy up)."
-    )
-    time.sleep(delay)
-
     logger.info(log_prefix + f"Now exiting with exit code {exit_code}")
 
     return exit_code
@@ -22,12 +22,16 @@ utility_account_username=tim
 project_base_dir="/srv/timbos-hn-reader/"
 all_logs_dir="${project_base_dir}logs/"
 CACHED_STORIES_DIR="${project_base_dir}cached_stories/"
+HTTP_CACHE_DIR="${project_base_dir}http_cache/"
+python_bin_dir="${project_base_dir}.venv/bin/"
+SETTINGS_FILE="${project_base_dir}settings.yaml"
 combined_log_identifier="combined"
 LOGFILE_ARCHIVE_DEST_DIR=/mnt/synology/logs/thnr2.home.arpa
 LOG_PREFIX_LOCAL="midnight-maint.sh:"
 
 # retention settings
 DAYS_TO_KEEP_CACHED_STORIES=3
+DAYS_TO_KEEP_HTTP_CACHE=7
 DAYS_TO_KEEP_LOGS=3
 
 CUR_YEAR_AND_DOY=$(get-cur-year-and-doy)
@@ -70,6 +74,29 @@ while IFS= read -r file; do
 done < <(find "${CACHED_STORIES_DIR}" -maxdepth 1 -name "*.json" -type f -mtime "+${DAYS_TO_KEEP_CACHED_STORIES}")
 write-log-message loop info "${LOG_PREFIX_LOCAL} Deleted ${num_json} .json files"
 
+# prune stories not updated in the story store within the retention period
+write-log-message loop info "${LOG_PREFIX_LOCAL} Pruning story store of stories older than ${DAYS_TO_KEEP_CACHED_STORIES} days"
+if STORE_PRUNE_OUTPUT=$(sudo -u "${utility_account_username}" "${python_bin_dir}python" "${project_base_dir}story-store-maint.py" "${server_name}" "${SETTINGS_FILE}" prune "${DAYS_TO_KEEP_CACHED_STORIES}" 2>&1); then
+    write-log-message loop info "${LOG_PREFIX_LOCAL} Pruned story store: ${STORE_PRUNE_OUTPUT//$'\n'/ }"
+else
+    write-log-message loop error "${LOG_PREFIX_LOCAL} Failed to prune story store: ${STORE_PRUNE_OUTPUT//$'\n'/ }"
+fi
+
+# delete http cache entries that haven't been fetched or revalidated within the retention period
+write-log-message loop info "${LOG_PREFIX_LOCAL} Deleting http cache entries older than ${DAYS_TO_KEEP_HTTP_CACHE} days"
+
+num_http_cache=0
+if [[ -d "${HTTP_CACHE_DIR}" ]]; then
+    while IFS= read -r file; do
+        if ! rm "${file}"; then
+            write-log-message loop error "${LOG_PREFIX_LOCAL} Failed to delete ${file}"
+        else
+            ((num_http_cache += 1))
+        fi
+    done < <(find "${HTTP_CACHE_DIR}" -maxdepth 1 \( -name "*.cache" -o -name "*.tmp" \) -type f -mtime "+${DAYS_TO_KEEP_HTTP_CACHE}")
+fi
+write-log-message loop info "${LOG_PREFIX_LOCAL} Deleted ${num_http_cache} http cache entries"
+
 # archive old logs
 write-log-message loop info "${LOG_PREFIX_LOCAL} Archiving logs older than ${DAYS_TO_KEEP_LOGS} days"
 # find "${all_logs_dir}" -maxdepth 1 -name "*.log" -mtime "+${DAYS_TO_KEEP_LOGS}" -exec rsync -a --no-owner --no-group --remove-source-files {} "${LOGFILE_ARCHIVE_DEST_DIR}" \;
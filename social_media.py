@@ -1,6 +1,5 @@
 import logging
 
-import requests
 import urllib3
 from bs4 import BeautifulSoup
 from sortedcontainers import SortedSet
@@ -31,9 +30,10 @@ ARTICLE_SYMBOL = "📄"
 # TODO: see /srv/timbos-hn-reader/temp/warnings5.txt for more YouTube parsing fails and gaps
 
 
-def check_for_social_media_details(
-    driver=None, story_object=None, page_source_soup=None
-):
+def check_for_social_media_details(driver=None, story_object=None, html_page=None):
+    # html_page is an HtmlPage; its soup is only built for sites whose details are in the
+    # page's body
+
     # TODO: add more sites based on # https://hackernews-insight.vercel.app/domain-analysis
 
     #
@@ -43,7 +43,7 @@ def check_for_social_media_details(
         story_object.social_media["account_name_slug"] = get_arstechnica_account_slug(
             arstechnica_url=story_object.url,
             story_object=story_object,
-            page_source_soup=page_source_soup,
+            page_source_soup=html_page.soup,
         )
 
         if story_object.social_media["account_name_slug"]:
@@ -58,7 +58,7 @@ def check_for_social_media_details(
         story_object.social_media["account_name_slug"] = get_bloomberg_account_slug(
             bloomberg_url=story_object.url,
             story_object=story_object,
-            page_source_soup=page_source_soup,
+            page_source_soup=html_page.soup,
         )
 
         if story_object.social_media["account_name_slug"]:
@@ -83,16 +83,23 @@ def check_for_social_media_details(
             ]
 
         story_object.gh_repo_lang_stats = ""
-        a_data_pjax_repo = page_source_soup.find(
+        a_data_pjax_repo = html_page.soup.find(
             "a", {"data-pjax": "#repo-content-pjax-container"}
         )
         if a_data_pjax_repo and a_data_pjax_repo.has_attr("href"):
             repo_url_path = a_data_pjax_repo["href"]
             repo_url = f"https://github.com{repo_url_path}"
+
+            # when the story links to the repo's front page, it's already been fetched
             gh_repo_lang_stats = get_github_repo_languages(
                 driver=driver,
                 repo_url=repo_url,
                 story_id=story_object.id,
+                page_source_soup=(
+                    html_page.soup
+                    if repo_url.rstrip("/") == story_object.url.rstrip("/")
+                    else None
+                ),
             )
             if gh_repo_lang_stats:
                 story_object.gh_repo_lang_stats = gh_repo_lang_stats
@@ -105,7 +112,7 @@ def check_for_social_media_details(
         story_object.social_media["account_name_slug"] = get_github_gist_account_slug(
             github_gist_url=story_object.url,
             story_object=story_object,
-            page_source_soup=page_source_soup,
+            page_source_soup=html_page.soup,
         )
 
         if story_object.social_media["account_name_slug"]:
@@ -122,7 +129,7 @@ def check_for_social_media_details(
     #     ] = get_theguardian_account_slug(
     #         theguardian_url=story_object.url,
     #         story_object=story_object,
-    #         page_source_soup=page_source_soup,
+    #         page_source_soup=html_page.soup,
     #     )
 
     #     if story_object.social_media["account_name_slug"]:
@@ -158,7 +165,7 @@ def check_for_social_media_details(
         story_object.social_media["account_name_slug"] = get_nytimes_article_slug(
             nytimes_url=story_object.url,
             story_object=story_object,
-            page_source_soup=page_source_soup,
+            page_source_soup=html_page.soup,
         )
 
         if story_object.social_media["account_name_slug"]:
@@ -202,11 +209,9 @@ def check_for_social_media_details(
                     "account_name_slug"
                 ]
 
-        meta_name_author = page_source_soup.find("head meta", {"name": "author"})
-        if meta_name_author and meta_name_author.has_attr("content"):
-            story_object.social_media["account_name_display"] = meta_name_author[
-                "content"
-            ]
+        meta_name_author = html_page.head_metadata.get("author")
+        if meta_name_author:
+            story_object.social_media["account_name_display"] = meta_name_author
 
     #
     # techcrunch.com
@@ -215,7 +220,7 @@ def check_for_social_media_details(
         story_object.social_media["account_name_slug"] = get_techcrunch_account_slug(
             techcrunch_url=story_object.url,
             story_object=story_object,
-            page_source_soup=page_source_soup,
+            page_source_soup=html_page.soup,
         )
 
         if story_object.social_media["account_name_slug"]:
@@ -260,7 +265,7 @@ def check_for_social_media_details(
         story_object.social_media["account_name_slug"] = get_wikipedia_article_slug(
             wikipedia_url=story_object.url,
             story_object=story_object,
-            page_source_soup=page_source_soup,
+            page_source_soup=html_page.soup,
         )
 
         if story_object.social_media["account_name_slug"]:
@@ -474,17 +479,22 @@ def create_github_languages_slug(story_object):
     )
 
 
-def get_github_repo_languages(driver=None, repo_url=None, story_id=None):
+def get_github_repo_languages(
+    driver=None, repo_url=None, story_id=None, page_source_soup=None
+):
     log_prefix = f"id={story_id}: " if story_id else "n/a"
 
-    page_source = utils_http.get_page_source(
-        # driver=driver,
-        url=repo_url,
-        log_prefix=log_prefix,
-    )
+    if page_source_soup:
+        soup = page_source_soup
+    else:
+        page_source = utils_http.get_page_source(
+            # driver=driver,
+            url=repo_url,
+            log_prefix=log_prefix,
+        )
+        soup = BeautifulSoup(page_source, "html.parser") if page_source else None
 
-    if page_source:
-        soup = BeautifulSoup(page_source, "html.parser")
+    if soup:
         h2_languages = soup.find("h2", string="Languages")
 
         if h2_languages:
@@ -881,7 +891,9 @@ def get_youtube_channel_slug(youtube_url: str, story_object=None):
         # TODO: convert this to use my existing endpoint_query_via_requests() function
         api_query_url = f"https://youtube.googleapis.com/youtube/v3/videos?part=snippet&id={video_id}&key={secrets_file.google_api_key}"
         try:
-            with requests.get(
+            with utils_http.host_slot(api_query_url), utils_http.get_session_for_url(
+                api_query_url
+            ).get(
                 api_query_url,
                 allow_redirects=True,
                 verify=False,
@@ -914,7 +926,9 @@ def get_youtube_channel_slug(youtube_url: str, story_object=None):
         # TODO: convert this to use my existing endpoint_query_via_requests() function
         api_query_url = f"https://youtube.googleapis.com/youtube/v3/channels?part=snippet&id={channel_id}&key={secrets_file.google_api_key}"
         try:
-            with requests.get(
+            with utils_http.host_slot(api_query_url), utils_http.get_session_for_url(
+                api_query_url
+            ).get(
                 api_query_url,
                 allow_redirects=True,
                 verify=False,
@@ -944,7 +958,9 @@ def get_youtube_channel_slug(youtube_url: str, story_object=None):
         # TODO: convert this to use my existing endpoint_query_via_requests() function
         url = f"https://youtube.googleapis.com/youtube/v3/playlists?part=snippet&id={playlist_id}&key={secrets_file.google_api_key}"
         try:
-            with requests.get(
+            with utils_http.host_slot(url), utils_http.get_session_for_url(
+                url
+            ).get(
                 url,
                 allow_redirects=True,
                 verify=False,
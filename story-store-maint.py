@@ -0,0 +1,79 @@
+import os
+import pickle
+import sys
+
+import config
+from StoryStore import StoryStore
+
+BATCH_SIZE = 500
+
+
+def import_pickles(story_store, delete_after_import=False):
+    # imports every id-{id}.pickle file in CACHED_STORIES_DIR into the story store
+    cached_stories_dir = config.settings["CACHED_STORIES_DIR"]
+
+    num_imported = 0
+    num_failed = 0
+    batch = []
+    imported_files = []
+
+    def flush():
+        nonlocal num_imported
+        story_store.put_many(batch)
+        num_imported += len(batch)
+        if delete_after_import:
+            for each_file in imported_files:
+                os.remove(each_file)
+        batch.clear()
+        imported_files.clear()
+
+    with os.scandir(cached_stories_dir) as entries:
+        for entry in entries:
+            if not (entry.name.startswith("id-") and entry.name.endswith(".pickle")):
+                continue
+
+            try:
+                with open(entry.path, mode="rb") as file:
+                    story_object = pickle.load(file)
+            except Exception as exc:
+                num_failed += 1
+                print(f"failed to load {entry.path}: {exc.__class__.__name__}: {exc}")
+                continue
+
+            batch.append(story_object)
+            imported_files.append(entry.path)
+            if len(batch) >= BATCH_SIZE:
+                flush()
+                print(f"imported {num_imported} stories so far")
+
+    if batch:
+        flush()
+
+    print(
+        f"imported {num_imported} stories into {story_store.db_file}; {num_failed} pickle files failed to load"
+    )
+
+
+def prune(story_store, days):
+    num_deleted = story_store.delete_older_than(days * 86_400)
+    print(f"deleted {num_deleted} stories older than {days} days")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 4 or sys.argv[3] not in ["import-pickles", "prune"]:
+        print(
+            "Usage: story-store-maint.py <host> <settings-file> import-pickles [--delete]\n"
+            "       story-store-maint.py <host> <settings-file> prune <days>"
+        )
+        exit(1)
+
+    config.load_settings(sys.argv[1], sys.argv[2])
+    story_store = StoryStore(config.settings["STORY_STORE_FILE"])
+
+    if sys.argv[3] == "import-pickles":
+        import_pickles(story_store, delete_after_import="--delete" in sys.argv[4:])
+    else:
+        prune(story_store, int(sys.argv[4]))
+
+    print(f"story store now holds {story_store.count()} stories")
+    story_store.close()
@@ -0,0 +1,14 @@
+import os
+
+import config
+
+SETTINGS_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "settings.yaml"
+)
+
+
+def load_settings():
+    # the production settings, as the thnr host sees them; tests point any directories
+    # they write to at temp dirs of their own
+    if not config.settings:
+        config.load_settings("thnr", SETTINGS_FILE)
@@ -0,0 +1,162 @@
+import asyncio
+import threading
+import time
+import types
+import unittest
+from unittest import mock
+
+import HostScheduler as host_scheduler_module
+from HostScheduler import HostScheduler
+
+
+def make_scheduler(rate_per_s=2, burst=4, max_concurrent=10, overall=100, hosts=None):
+    return HostScheduler(
+        {
+            "DEFAULT": {
+                "BURST": burst,
+                "MAX_CONCURRENT": max_concurrent,
+                "RATE_PER_S": rate_per_s,
+            },
+            "HOSTS": hosts or {},
+            "MAX_CONCURRENT": overall,
+        }
+    )
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+class TestHostSchedulerLimits(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch.object(
+            host_scheduler_module,
+            "time",
+            types.SimpleNamespace(monotonic=self.clock.monotonic),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def take(self, scheduler, host):
+        # try_acquire() for host, then release right away if a slot was taken
+        with scheduler.cond:
+            bucket_name = scheduler.get_bucket_name(host)
+            retry_after_s = scheduler.try_acquire(scheduler.get_host_state(bucket_name))
+        if retry_after_s == 0:
+            scheduler.release(bucket_name)
+        return retry_after_s
+
+    def test_burst_then_rate(self):
+        scheduler = make_scheduler(rate_per_s=2, burst=4)
+
+        self.assertEqual([self.take(scheduler, "a.com") for _ in range(4)], [0] * 4)
+        self.assertAlmostEqual(self.take(scheduler, "a.com"), 0.5)
+
+        self.clock.now += 0.5
+        self.assertEqual(self.take(scheduler, "a.com"), 0)
+        self.assertAlmostEqual(self.take(scheduler, "a.com"), 0.5)
+
+    def test_tokens_refill_only_up_to_burst(self):
+        scheduler = make_scheduler(rate_per_s=2, burst=4)
+        self.take(scheduler, "a.com")
+
+        self.clock.now += 3600
+        self.assertEqual([self.take(scheduler, "a.com") for _ in range(4)], [0] * 4)
+        self.assertAlmostEqual(self.take(scheduler, "a.com"), 0.5)
+
+    def test_hosts_have_separate_buckets(self):
+        scheduler = make_scheduler(rate_per_s=1, burst=1)
+
+        self.assertEqual(self.take(scheduler, "a.com"), 0)
+        self.assertEqual(self.take(scheduler, "b.com"), 0)
+        self.assertAlmostEqual(self.take(scheduler, "a.com"), 1)
+
+    def test_listed_domain_covers_its_subdomains(self):
+        scheduler = make_scheduler(
+            rate_per_s=100,
+            burst=100,
+            hosts={"substack.com": {"BURST": 1, "MAX_CONCURRENT": 1, "RATE_PER_S": 1}},
+        )
+
+        self.assertEqual(scheduler.get_bucket_name("one.substack.com"), "substack.com")
+        self.assertEqual(
+            scheduler.get_bucket_name("a.b.example.com"), "a.b.example.com"
+        )
+        self.assertEqual(self.take(scheduler, "one.substack.com"), 0)
+        self.assertAlmostEqual(self.take(scheduler, "two.substack.com"), 1)
+
+    def test_max_concurrent_per_host(self):
+        scheduler = make_scheduler(burst=10, max_concurrent=2)
+        bucket_names = [scheduler.acquire("a.com") for _ in range(2)]
+
+        self.assertIsNone(self.take(scheduler, "a.com"))
+        self.assertEqual(self.take(scheduler, "b.com"), 0)
+
+        scheduler.release(bucket_names[0])
+        self.assertEqual(self.take(scheduler, "a.com"), 0)
+
+    def test_max_concurrent_overall(self):
+        scheduler = make_scheduler(burst=10, max_concurrent=10, overall=2)
+        scheduler.acquire("a.com")
+        bucket_name = scheduler.acquire("b.com")
+
+        self.assertIsNone(self.take(scheduler, "c.com"))
+
+        scheduler.release(bucket_name)
+        self.assertEqual(self.take(scheduler, "c.com"), 0)
+
+
+class TestHostSchedulerWaiting(unittest.TestCase):
+    def test_acquire_waits_for_a_token(self):
+        scheduler = make_scheduler(rate_per_s=20, burst=1)
+
+        start_ts = time.monotonic()
+        for _ in range(3):
+            with scheduler.slot("a.com"):
+                pass
+        elapsed_s = time.monotonic() - start_ts
+
+        self.assertGreaterEqual(elapsed_s, 0.09)
+        stats = scheduler.get_stats()
+        self.assertEqual(stats["stats"]["requests"], 3)
+        self.assertEqual(stats["stats"]["requests_delayed"], 2)
+        self.assertEqual(stats["in_flight"], 0)
+
+    def test_acquire_waits_for_a_request_to_finish(self):
+        scheduler = make_scheduler(burst=10, max_concurrent=1)
+        bucket_name = scheduler.acquire("a.com")
+        threading.Timer(0.05, scheduler.release, args=[bucket_name]).start()
+
+        with scheduler.slot("a.com"):
+            self.assertEqual(scheduler.get_stats()["in_flight"], 1)
+
+        self.assertEqual(scheduler.get_stats()["stats"]["peak_waiting"], 1)
+
+    def test_slot_async(self):
+        scheduler = make_scheduler(burst=10, max_concurrent=2)
+        peak_in_flight = 0
+
+        async def fetch():
+            nonlocal peak_in_flight
+            async with scheduler.slot_async("a.com"):
+                peak_in_flight = max(peak_in_flight, scheduler.get_stats()["in_flight"])
+                await asyncio.sleep(0.02)
+
+        async def main():
+            await asyncio.gather(*[fetch() for _ in range(6)])
+
+        asyncio.run(main())
+
+        self.assertEqual(peak_in_flight, 2)
+        stats = scheduler.get_stats()
+        self.assertEqual(stats["stats"]["requests"], 6)
+        self.assertEqual((stats["in_flight"], stats["waiting"]), (0, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import unittest
+
+from HtmlPage import FEED_CHUNK_CHARS, HtmlPage, get_meta_tags
+
+HEAD = (
+    "<!DOCTYPE html><html><head>"
+    '<meta charset="utf-8">'
+    "<title>A page</title>"
+    '<meta property="og:image" content="https://example.com/og.png">'
+    '<meta property="og:image" content="https://example.com/second.png">'
+    '<meta name="twitter:card" content="summary_large_image">'
+    '<meta name="author" content="Someone">'
+    '<meta name="description" content="not kept">'
+    '<meta property="og:title">'
+    "</head>"
+)
+
+
+class TestGetMetaTags(unittest.TestCase):
+    def test_keeps_og_twitter_and_author_tags(self):
+        self.assertEqual(
+            get_meta_tags(HEAD),
+            {
+                "og:image": "https://example.com/og.png",
+                "twitter:card": "summary_large_image",
+                "author": "Someone",
+                "og:title": None,
+            },
+        )
+
+    def test_tag_split_across_chunks(self):
+        padding = "<!-- " + "x" * (FEED_CHUNK_CHARS - 40) + " -->"
+        html = (
+            "<html><head>"
+            + padding
+            + '<meta property="og:image" content="https://example.com/og.png">'
+            + "</head><body></body></html>"
+        )
+        self.assertEqual(
+            get_meta_tags(html), {"og:image": "https://example.com/og.png"}
+        )
+
+    def test_no_elements(self):
+        self.assertEqual(get_meta_tags(""), {})
+        self.assertEqual(get_meta_tags("just text"), {})
+
+
+class TestHtmlPage(unittest.TestCase):
+    def test_head_metadata_parses_only_the_head(self):
+        page = HtmlPage(
+            HEAD
+            + "<body>"
+            + '<meta property="og:description" content="in the body">'
+            + "<p>text</p></body></html>"
+        )
+
+        self.assertEqual(page.head_metadata["og:image"], "https://example.com/og.png")
+        self.assertNotIn("og:description", page.head_metadata)
+        self.assertIsNone(page._soup)
+        self.assertIsNone(page._tree)
+
+    def test_og_image_in_body(self):
+        page = HtmlPage(
+            '<html><head><meta name="twitter:card" content="summary"></head>'
+            + '<body><meta property="og:image" content="https://example.com/og.png">'
+            + "</body></html>"
+        )
+
+        self.assertEqual(
+            page.head_metadata,
+            {"twitter:card": "summary", "og:image": "https://example.com/og.png"},
+        )
+
+    def test_head_without_closing_tag(self):
+        page = HtmlPage(
+            "<html><head>"
+            + '<meta property="og:image" content="https://example.com/og.png">'
+            + '<body><meta property="og:title" content="in the body"></body></html>'
+        )
+
+        self.assertEqual(page.head_metadata, {"og:image": "https://example.com/og.png"})
+
+    def test_page_without_head(self):
+        page = HtmlPage(
+            '<meta property="og:image" content="https://example.com/og.png"><p>hi</p>'
+        )
+        self.assertEqual(page.head_metadata, {"og:image": "https://example.com/og.png"})
+
+    def test_soup_is_built_once(self):
+        page = HtmlPage(HEAD + "<body><p>text</p></body></html>")
+
+        self.assertEqual(page.soup.find("p").text, "text")
+        self.assertIs(page.soup, page.soup)
+
+
+if __name__ == "__main__":
+    unittest.main()
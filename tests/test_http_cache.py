@@ -0,0 +1,184 @@
+import tempfile
+import unittest
+from unittest import mock
+
+import requests
+
+import config
+from HttpCache import HttpCache
+from tests import load_settings
+
+
+def setUpModule():
+    load_settings()
+
+
+def make_response(url, status_code, headers=None, body=b""):
+    response = requests.models.Response()
+    response.url = url
+    response.status_code = status_code
+    response.headers = requests.structures.CaseInsensitiveDict(headers or {})
+    response._content = body
+    response._content_consumed = True
+    return response
+
+
+class FakeSession:
+    # answers each get() with the next of responses, and remembers the request headers
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.request_headers = []
+
+    def get(self, url, headers=None, **kwargs):
+        self.request_headers.append(dict(headers or {}))
+        return self.responses.pop(0)
+
+
+class TestHttpCache(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache = HttpCache(self.temp_dir.name)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_put_and_get(self):
+        url = "https://example.com/page"
+        headers = requests.structures.CaseInsensitiveDict(
+            {"ETag": '"v1"', "Content-Type": "text/html", "Content-Length": "5"}
+        )
+        self.cache.put(url, url + "?final", headers, b"hello")
+
+        meta, body = self.cache.get(url)
+
+        self.assertEqual(body, b"hello")
+        self.assertEqual(meta["final_url"], url + "?final")
+        # requests has already decoded the body, so its length isn't kept
+        self.assertEqual(meta["headers"], {"content-type": "text/html", "etag": '"v1"'})
+
+    def test_missing_and_deleted_entries(self):
+        url = "https://example.com/page"
+        self.assertIsNone(self.cache.get(url))
+
+        self.cache.put(url, url, {"etag": '"v1"'}, b"hello")
+        self.cache.delete(url)
+
+        self.assertIsNone(self.cache.get(url))
+
+    def test_truncated_entry_is_a_miss(self):
+        url = "https://example.com/page"
+        with open(self.cache.get_entry_path(url), "wb") as f:
+            f.write(b"\x00\x00")
+        self.assertIsNone(self.cache.get(url))
+
+
+class TestConditionalGet(unittest.TestCase):
+    def setUp(self):
+        import utils_http
+
+        self.utils_http = utils_http
+        self.temp_dir = tempfile.TemporaryDirectory()
+        patchers = [
+            mock.patch.dict(config.settings, {"HTTP_CACHE_DIR": self.temp_dir.name}),
+            mock.patch.object(utils_http, "http_cache", None),
+            mock.patch.object(
+                utils_http, "http_cache_stats", utils_http.collections.Counter()
+            ),
+            # a fresh token bucket per test, so earlier tests don't slow later ones down
+            mock.patch.object(utils_http, "host_scheduler", None),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(self.temp_dir.cleanup)
+
+    def conditional_get(self, url, session):
+        with mock.patch.object(
+            self.utils_http, "get_session_for_url", return_value=session
+        ):
+            return self.utils_http.conditional_get(url)
+
+    def test_304_is_served_from_cache_as_200(self):
+        url = "https://example.com/page"
+        headers = {
+            "ETag": '"v1"',
+            "Last-Modified": "Wed, 01 Nov 2023 00:00:00 GMT",
+            "Content-Type": "text/html; charset=utf-8",
+        }
+        session = FakeSession(
+            [
+                make_response(url, 200, headers, b"<html>v1</html>"),
+                make_response(url, 304, {"ETag": '"v1"'}),
+            ]
+        )
+
+        first = self.conditional_get(url, session)
+        second = self.conditional_get(url, session)
+
+        self.assertEqual(first.content, b"<html>v1</html>")
+        self.assertNotIn("If-None-Match", session.request_headers[0])
+        self.assertEqual(session.request_headers[1]["If-None-Match"], '"v1"')
+        self.assertEqual(
+            session.request_headers[1]["If-Modified-Since"],
+            "Wed, 01 Nov 2023 00:00:00 GMT",
+        )
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.content, b"<html>v1</html>")
+        self.assertEqual(second.headers["content-type"], "text/html; charset=utf-8")
+        self.assertEqual(second.encoding, "utf-8")
+        self.assertEqual(self.utils_http.http_cache_stats["revalidated"], 1)
+        self.assertEqual(
+            self.utils_http.http_cache_stats["bytes_saved"], len(b"<html>v1</html>")
+        )
+
+    def test_changed_page_replaces_cached_copy(self):
+        url = "https://example.com/page"
+        session = FakeSession(
+            [
+                make_response(url, 200, {"ETag": '"v1"'}, b"v1"),
+                make_response(url, 200, {"ETag": '"v2"'}, b"v2"),
+            ]
+        )
+
+        self.conditional_get(url, session)
+        second = self.conditional_get(url, session)
+
+        self.assertEqual(second.content, b"v2")
+        meta, body = self.utils_http.get_http_cache().get(url)
+        self.assertEqual((meta["headers"]["etag"], body), ('"v2"', b"v2"))
+
+    def test_uncacheable_responses_are_not_stored(self):
+        url = "https://example.com/page"
+        session = FakeSession(
+            [
+                make_response(
+                    url, 200, {"Content-Type": "text/html"}, b"no validators"
+                ),
+                make_response(
+                    url, 200, {"ETag": '"v1"', "Cache-Control": "no-store"}, b"private"
+                ),
+            ]
+        )
+
+        self.conditional_get(url, session)
+        self.conditional_get(url, session)
+
+        self.assertIsNone(self.utils_http.get_http_cache().get(url))
+
+    def test_error_drops_cached_copy(self):
+        url = "https://example.com/page"
+        session = FakeSession(
+            [
+                make_response(url, 200, {"ETag": '"v1"'}, b"v1"),
+                make_response(url, 404),
+            ]
+        )
+
+        self.conditional_get(url, session)
+        self.assertEqual(self.conditional_get(url, session).status_code, 404)
+
+        self.assertIsNone(self.utils_http.get_http_cache().get(url))
+
+
+if __name__ == "__main__":
+    unittest.main()
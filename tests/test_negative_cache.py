@@ -0,0 +1,200 @@
+import collections
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import config
+from tests import load_settings
+
+
+def setUpModule():
+    load_settings()
+
+
+class TestNegativeCache(unittest.TestCase):
+    def setUp(self):
+        import utils_http
+
+        self.utils_http = utils_http
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.negative_cache_file = os.path.join(
+            self.temp_dir.name, "negative_cache.json"
+        )
+        # each test starts from an empty cache and nothing remembered from earlier tests
+        patchers = [
+            mock.patch.dict(
+                config.settings, {"NEGATIVE_CACHE_FILE": self.negative_cache_file}
+            ),
+            mock.patch.object(utils_http, "negative_cache", None),
+            mock.patch.object(
+                utils_http, "negative_cache_stats", collections.Counter()
+            ),
+            mock.patch.object(
+                utils_http, "consecutive_failures_by_host", collections.Counter()
+            ),
+            mock.patch.object(utils_http, "hosts_with_open_circuit", {}),
+            mock.patch.object(utils_http, "last_failure_class_by_url", {}),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(self.temp_dir.cleanup)
+
+    def get_ttl_minutes(self, failure_class):
+        return self.utils_http.get_negative_cache_ttl_s(failure_class) // 60
+
+    def test_ttl_fallback(self):
+        ttl_minutes = config.settings["SCRAPING"]["NEGATIVE_CACHE"]["TTL_MINUTES"]
+
+        self.assertEqual(self.get_ttl_minutes("http_404"), ttl_minutes["http_404"])
+        self.assertEqual(self.get_ttl_minutes("http_418"), ttl_minutes["http_4xx"])
+        self.assertEqual(self.get_ttl_minutes("http_503"), ttl_minutes["http_5xx"])
+        self.assertEqual(self.get_ttl_minutes("dns"), ttl_minutes["dns"])
+        self.assertEqual(self.get_ttl_minutes("mystery"), ttl_minutes["other"])
+
+    def test_failure_classes(self):
+        requests = self.utils_http.requests
+        get_failure_class = self.utils_http.get_failure_class
+
+        self.assertEqual(get_failure_class(requests.exceptions.SSLError("x")), "tls")
+        self.assertEqual(
+            get_failure_class(requests.exceptions.ReadTimeout("x")), "timeout"
+        )
+        self.assertEqual(
+            get_failure_class(
+                requests.exceptions.ConnectionError(
+                    "[Errno -2] Name or service not known"
+                )
+            ),
+            "dns",
+        )
+        self.assertEqual(
+            get_failure_class(requests.exceptions.ConnectionError("reset")),
+            "connection",
+        )
+        self.assertEqual(
+            get_failure_class(requests.exceptions.MissingSchema("x")), "invalid_url"
+        )
+        self.assertIsNone(get_failure_class(ValueError("not a fetch failure")))
+        self.assertEqual(
+            self.utils_http.get_failure_class_for_status_code(404), "http_404"
+        )
+        self.assertIsNone(self.utils_http.get_failure_class_for_status_code(200))
+
+    def test_failed_url_is_remembered_and_saved(self):
+        url = "https://dead.example.com/gone"
+        self.utils_http.note_fetch_failure(url, "http_404")
+
+        retry_after_ts = self.utils_http.remember_failed_url(url)
+
+        self.assertEqual(
+            self.utils_http.get_known_failure(url), ("http_404", retry_after_ts)
+        )
+        self.assertAlmostEqual(
+            retry_after_ts - time.time(),
+            self.utils_http.get_negative_cache_ttl_s("http_404"),
+            delta=5,
+        )
+        self.assertIsNone(
+            self.utils_http.get_known_failure("https://dead.example.com/other")
+        )
+
+        self.utils_http.save_negative_cache()
+        self.utils_http.negative_cache = None
+
+        self.assertEqual(
+            self.utils_http.get_known_failure(url), ("http_404", retry_after_ts)
+        )
+
+    def test_url_without_a_classified_failure_is_other(self):
+        url = "https://dead.example.com/gone"
+        self.utils_http.remember_failed_url(url)
+        self.assertEqual(self.utils_http.get_known_failure(url)[0], "other")
+
+    def test_expired_and_host_entries_are_not_loaded(self):
+        now = int(time.time())
+        with open(self.negative_cache_file, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "entries": {
+                        "url:https://a.example.com/": ["http_404", now + 3600],
+                        "url:https://b.example.com/": ["http_404", now - 1],
+                        "host:c.example.com": ["timeout", now + 3600],
+                    }
+                },
+                f,
+            )
+
+        self.assertEqual(
+            self.utils_http.get_known_failure("https://a.example.com/"),
+            ("http_404", now + 3600),
+        )
+        self.assertIsNone(self.utils_http.get_known_failure("https://b.example.com/"))
+        self.assertIsNone(
+            self.utils_http.get_known_host_failure("https://c.example.com/x")
+        )
+
+    def test_circuit_opens_for_the_run_only(self):
+        num_failures = config.settings["SCRAPING"]["NEGATIVE_CACHE"][
+            "CIRCUIT_BREAKER_FAILURES"
+        ]
+        for i in range(num_failures - 1):
+            self.utils_http.note_fetch_failure(
+                f"https://slow.example.com/{i}", "timeout"
+            )
+        self.assertIsNone(
+            self.utils_http.get_known_host_failure("https://slow.example.com/x")
+        )
+
+        self.utils_http.note_fetch_failure("https://slow.example.com/last", "timeout")
+
+        self.assertEqual(
+            self.utils_http.get_known_host_failure("https://slow.example.com/x"),
+            "timeout",
+        )
+        failure_class, _ = self.utils_http.get_known_failure(
+            "https://slow.example.com/y"
+        )
+        self.assertEqual(failure_class, "timeout")
+
+        self.utils_http.remember_failed_url("https://dead.example.com/gone")
+        self.utils_http.save_negative_cache()
+        with open(self.negative_cache_file, encoding="utf-8") as f:
+            self.assertEqual(
+                list(json.load(f)["entries"]), ["url:https://dead.example.com/gone"]
+            )
+
+    def test_success_resets_the_count_of_failures(self):
+        num_failures = config.settings["SCRAPING"]["NEGATIVE_CACHE"][
+            "CIRCUIT_BREAKER_FAILURES"
+        ]
+        for i in range(num_failures - 1):
+            self.utils_http.note_fetch_failure(
+                f"https://flaky.example.com/{i}", "timeout"
+            )
+        self.utils_http.note_fetch_success("https://flaky.example.com/ok")
+        self.utils_http.note_fetch_failure("https://flaky.example.com/again", "timeout")
+
+        self.assertIsNone(
+            self.utils_http.get_known_host_failure("https://flaky.example.com/x")
+        )
+
+    def test_url_level_failures_dont_open_circuits(self):
+        num_failures = config.settings["SCRAPING"]["NEGATIVE_CACHE"][
+            "CIRCUIT_BREAKER_FAILURES"
+        ]
+        for i in range(num_failures + 1):
+            self.utils_http.note_fetch_failure(
+                f"https://a.example.com/{i}", "http_404"
+            )
+
+        self.assertIsNone(
+            self.utils_http.get_known_host_failure("https://a.example.com/x")
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+import pickle
+import unittest
+from unittest import mock
+
+import Story
+from Story import Story as StoryClass
+from Story import decode_story, encode_story
+from tests import load_settings
+
+
+def setUpModule():
+    load_settings()
+
+
+def make_story(**kwargs):
+    story_kwargs = {
+        "by": "pg",
+        "descendants": 12,
+        "id": 40000001,
+        "kids": [40000002, 40000003],
+        "score": 99,
+        "time": 1700000000,
+        "title": "A story",
+        "text": "",
+        "type": "story",
+        "url": "https://example.com/a/story",
+    }
+    story_kwargs.update(kwargs)
+    return StoryClass(**story_kwargs)
+
+
+class TestStoryEncoding(unittest.TestCase):
+    def test_round_trip(self):
+        story_object = make_story()
+        story_object.og_image_url = "https://example.com/og.png"
+        story_object.og_image_dict = {"width": "1200"}
+        story_object.pdf_page_count = 3
+
+        decoded = decode_story(encode_story(story_object))
+
+        self.assertEqual(vars(decoded), vars(story_object))
+
+    def test_is_msgpack(self):
+        data = encode_story(make_story())
+        self.assertEqual(data[:1], Story.ENCODING_MSGPACK_V1)
+
+    def test_unpersisted_attributes_are_dropped(self):
+        story_object = make_story()
+        story_object.story_card_html = "<tr>...</tr>"
+        story_object.badges_slug = "<span>...</span>"
+
+        decoded = decode_story(encode_story(story_object))
+
+        self.assertEqual(decoded.story_card_html, "")
+        self.assertEqual(decoded.badges_slug, "")
+
+    def test_defaults_are_not_shared_between_decoded_stories(self):
+        data = encode_story(make_story())
+        first, second = decode_story(data), decode_story(data)
+
+        first.story_card_static_fragments["key"] = ["head", "tail"]
+
+        self.assertEqual(second.story_card_static_fragments, {})
+        self.assertEqual(
+            Story.get_blank_story_attributes()["story_card_static_fragments"], {}
+        )
+
+    def test_unencodable_story_falls_back_on_pickle(self):
+        story_object = make_story()
+        story_object.og_image_dict = {"size": {1, 2}}
+
+        data = encode_story(story_object)
+
+        self.assertNotEqual(data[:1], Story.ENCODING_MSGPACK_V1)
+        self.assertEqual(vars(decode_story(data)), vars(story_object))
+
+    def test_pickled_story_still_decodes(self):
+        story_object = make_story()
+        data = pickle.dumps(story_object, protocol=pickle.HIGHEST_PROTOCOL)
+        self.assertEqual(vars(decode_story(data)), vars(story_object))
+
+    def test_renamed_attribute_is_carried_over(self):
+        story_object = make_story()
+        story_object.thumb_aspect_hint = "wide"
+        data = encode_story(story_object)
+
+        with mock.patch.object(Story, "STORY_OBJECT_VERSION", 2), mock.patch.object(
+            Story, "STORY_ATTRIBUTE_RENAMES", {2: {"thumb_aspect_hint": "thumb_shape"}}
+        ):
+            decoded = decode_story(data)
+
+        self.assertEqual(decoded.thumb_shape, "wide")
+        # what's left under the old name is just the blank story's default
+        self.assertIsNone(decoded.thumb_aspect_hint)
+        self.assertEqual(decoded.story_object_version, 2)
+
+    def test_rename_from_an_older_version_is_not_applied_again(self):
+        story_object = make_story()
+        story_object.thumb_aspect_hint = "wide"
+        story_object.story_object_version = 2
+
+        with mock.patch.object(Story, "STORY_OBJECT_VERSION", 2), mock.patch.object(
+            Story, "STORY_ATTRIBUTE_RENAMES", {2: {"thumb_aspect_hint": "thumb_shape"}}
+        ):
+            decoded = decode_story(encode_story(story_object))
+
+        self.assertEqual(decoded.thumb_aspect_hint, "wide")
+        self.assertFalse(hasattr(decoded, "thumb_shape"))
+
+
+if __name__ == "__main__":
+    unittest.main()
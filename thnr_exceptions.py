@@ -12,6 +12,10 @@ class FailedAfterRetrying(Exception):
     pass
 
 
+class ResponseBodyTooLarge(Exception):
+    pass
+
+
 class ServerReturnedEmptyDocumentError(Exception):
     def __init__(self, message="server returned an empty document"):
         self.message = message
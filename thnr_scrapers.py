@@ -119,7 +119,7 @@ def download_og_image2(
 
     get_response = None
     try:
-        with requests.get(
+        with utils_http.conditional_get(
             allow_redirects=True,
             headers={"User-Agent": config.settings["SCRAPING"]["UA_STR"]},
             timeout=config.settings["SCRAPING"]["REQUESTS_GET_TIMEOUT_S"],
@@ -250,7 +250,7 @@ def download_og_image1(
 
     get_response = None
     try:
-        with requests.get(
+        with utils_http.conditional_get(
             url=cur_url,
             allow_redirects=True,
             verify=False,
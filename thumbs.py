@@ -1,25 +1,41 @@
 import collections
+import concurrent.futures
+import concurrent.futures.process
+import functools
+import json
 import logging
+import logging.handlers
+import math
+import multiprocessing
 import os
 import re
 import shutil
-import subprocess
-import tempfile
+import threading
 import time
 import traceback
 from urllib.parse import unquote, urlparse
 
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+
 import wand.exceptions
-from pypdf import PdfReader, PdfWriter
+import wand.resource
+from pypdf import PdfReader
 from wand.color import Color
 from wand.drawing import Drawing
 from wand.image import Image
 
 import config
 import utils_aws
+import utils_delegates
 import utils_file
+import utils_hash
 import utils_mimetypes_magic
 import utils_text
+from ThumbIndex import ThumbIndex
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -157,6 +173,29 @@ ignore_og_images_with_these_exact_filenames = {
     "placeholder.png",
 }
 
+# Wand/ImageMagick work runs in its own pool of processes, so that story threads waiting
+# on the network never queue behind CPU-bound trims, resizes and webp encodes
+image_pipeline_executor = None
+image_pipeline_executor_lock = threading.Lock()
+image_pipeline_log_listener = None
+image_pipeline_stats = collections.Counter()
+image_pipeline_stats_lock = threading.Lock()
+
+# thumbs are named by the content hash of their source image and processing settings, so
+# an image shared by many stories (e.g., a site's default og:image) is made and uploaded once.
+# Bump THUMB_PROCESSING_VERSION whenever a change to the processing code alters its output.
+THUMB_PROCESSING_VERSION = 1
+thumb_index = None
+thumb_index_lock = threading.Lock()
+thumb_content_hash_locks = collections.defaultdict(threading.Lock)
+thumb_content_hash_locks_lock = threading.Lock()
+
+# the upload of each thumb made in this run, by content hash. A thumb is indexed only once
+# it's in S3; until then, stories sharing its image reuse it from here, and their pages
+# wait on the same upload
+thumb_uploads = {}
+thumb_uploads_lock = threading.Lock()
+
 
 def image_url_is_disqualified(url: str, mimetype_via_magic=None, log_prefix="") -> bool:
     log_prefix_local = log_prefix + "image_url_is_disqualified: "
@@ -258,26 +297,43 @@ def can_populate_a_shortcode(story_object, img_loading):
             log_prefix + f"using prepared image shortcode {prepared_image_shortcode}"
         )
 
-        # load prepared image as image
-        thumb_filename = get_webp_filename(story_object, "extralarge")
-        shutil.copyfile(
-            os.path.join(
-                config.settings["PREPARED_THUMBS_SERVICE_DIR"],
-                f"prepared-{prepared_image_shortcode}-extralarge.webp",
-            ),
-            os.path.join(config.settings["TEMP_DIR"], thumb_filename),
+        # a prepared image is uploaded once under its content hash and shared after that
+        prepared_thumb_full_path = os.path.join(
+            config.settings["PREPARED_THUMBS_SERVICE_DIR"],
+            f"prepared-{prepared_image_shortcode}-extralarge.webp",
         )
-        try:
-            utils_aws.upload_thumb(thumb_filename=thumb_filename)
-        except Exception as exc:
-            logger.error(
-                log_prefix + f"failed to upload thumb (prepared image) to S3: {exc}"
-            )
-            return False
-
-        utils_file.delete_file(
-            os.path.join(config.settings["TEMP_DIR"], thumb_filename)
+        story_object.thumb_content_hash = get_thumb_content_hash(
+            prepared_thumb_full_path,
+            {
+                "version": THUMB_PROCESSING_VERSION,
+                "prepared_image_shortcode": prepared_image_shortcode,
+            },
         )
+        with get_thumb_content_hash_lock(story_object.thumb_content_hash):
+            if not reuse_indexed_thumb(story_object, log_prefix=log_prefix):
+                # load prepared image as image
+                rendered_thumb = {
+                    "size": "extralarge",
+                    "filename": get_webp_filename(story_object, "extralarge"),
+                }
+                shutil.copyfile(
+                    prepared_thumb_full_path,
+                    os.path.join(
+                        config.settings["TEMP_DIR"], rendered_thumb["filename"]
+                    ),
+                )
+                try:
+                    upload_future = save_thumb_where_it_should_go(
+                        rendered_thumb, story_object
+                    )
+                except Exception as exc:
+                    logger.error(
+                        log_prefix
+                        + f"failed to upload thumb (prepared image) to S3: {exc}"
+                    )
+                    return False
+
+                index_thumb(story_object, [rendered_thumb], [upload_future])
 
         story_object.image_slug = create_img_slug_html(story_object, img_loading)
         logger.info(
@@ -302,6 +358,29 @@ def create_img_slug_html(story_object, img_loading="lazy"):
     )
 
 
+def delete_thumbs_of_dropped_job(content_hash, job_future) -> None:
+    # done callback for an image pipeline job whose result was dropped: nothing uploads (and
+    # so deletes) the thumbs its worker saved in TEMP_DIR. Another story may be making the
+    # same thumb, so they're deleted once it's done, unless it queued them for upload; the
+    # wait happens in a thread of its own, not in the pool's result handling thread
+    if job_future.cancelled() or job_future.exception():
+        return
+
+    def delete_thumbs():
+        with get_thumb_content_hash_lock(content_hash):
+            with thumb_uploads_lock:
+                if content_hash in thumb_uploads:
+                    return
+            for rendered_thumb in job_future.result()["rendered_thumbs"]:
+                utils_file.delete_file(
+                    os.path.join(config.settings["TEMP_DIR"], rendered_thumb["filename"])
+                )
+
+    threading.Thread(
+        target=delete_thumbs, name="delete_thumbs_of_dropped_job", daemon=True
+    ).start()
+
+
 def draw_dogear(pdf_page_img, log_prefix=""):
     # logger.info(log_prefix + "entering draw_dogear()")
 
@@ -374,63 +453,6 @@ def draw_dogear(pdf_page_img, log_prefix=""):
         return pdf_page_img
 
 
-def fix_multipage_pdf(story_object):
-    log_prefix_local = f"id={story_object.id}: fix_multipage_pdf: "
-    file_url_slug = (
-        f"file={story_object.downloaded_orig_thumb_full_path}, url={story_object.url}"
-    )
-
-    try:
-        with open(
-            story_object.downloaded_orig_thumb_full_path, mode="rb"
-        ) as pdf_file_stream:
-            pdf_file = PdfReader(pdf_file_stream, strict=False)
-
-            story_object.pdf_page_count = len(pdf_file.pages)
-
-            if story_object.pdf_page_count == 1:
-                logger.info(log_prefix_local + "PDF is 1 page; nothing to do!")
-            elif story_object.pdf_page_count > 1:
-                with tempfile.NamedTemporaryFile(
-                    delete=False,
-                    dir=config.settings["TEMP_DIR"],
-                    prefix=f"{story_object.id}-",
-                    suffix=".pdf",
-                ) as temp_pdf:
-                    outfile = PdfWriter()
-                    outfile.add_page(pdf_file.pages[0])
-                    outfile.write(temp_pdf)
-                    temp_pdf_path = temp_pdf.name
-
-                shutil.copyfile(
-                    temp_pdf_path, story_object.downloaded_orig_thumb_full_path
-                )
-
-                story_object.thumb_aspect_hint = "PDF page"
-                logger.info(
-                    log_prefix_local
-                    + f"successfully discarded all but first page of PDF. {file_url_slug}"
-                )
-            else:
-                logger.error(
-                    log_prefix_local
-                    + f"unexpected {story_object.pdf_page_count=}. {file_url_slug}"
-                )
-
-    except Exception as exc:
-        exc_name = f"{exc.__class__.__module__}.{exc.__class__.__name__}"
-        exc_msg = str(exc)
-        exc_slug = f"{exc_name}: {exc_msg}"
-        logger.info(
-            log_prefix_local
-            + f"failed to discard all but first page of PDF."
-            + exc_slug
-            + f"{file_url_slug} ~Tim~"
-        )
-        logger.info(log_prefix_local + traceback.format_exc())
-        raise exc
-
-
 def get_altered_img(img, aspect=None, force_aspect=None):
     if not aspect and not force_aspect:
         return None
@@ -551,6 +573,85 @@ def get_cropped_image(img, crop_distance_in_px):
     return cropped_image
 
 
+def get_combined_upload_future(upload_futures) -> concurrent.futures.Future:
+    # a future that's done once all of upload_futures are, holding the first exception
+    # among them, if any
+    combined_future = concurrent.futures.Future()
+    num_remaining = [len(upload_futures)]
+    num_remaining_lock = threading.Lock()
+
+    def on_upload_done(_):
+        with num_remaining_lock:
+            num_remaining[0] -= 1
+            if num_remaining[0]:
+                return
+        for upload_future in upload_futures:
+            if upload_future.exception():
+                combined_future.set_exception(upload_future.exception())
+                return
+        combined_future.set_result(True)
+
+    if not upload_futures:
+        combined_future.set_result(True)
+    for upload_future in upload_futures:
+        upload_future.add_done_callback(on_upload_done)
+    return combined_future
+
+
+def get_ghostscript_dpi_for_thumbs(page_width_pt=None):
+    # resolution at which the page comes out wide enough for the largest thumb, with
+    # headroom for the margins that get trimmed; PDF points are 1/72 inch
+    pdf_raster_settings = config.settings["THUMBS"]["PDF_RASTER"]
+    target_width_px = (
+        max(config.settings["THUMBS"]["WIDTH_PX"].values())
+        * pdf_raster_settings["OVERSAMPLE_FACTOR"]
+    )
+    if not page_width_pt or page_width_pt <= 0:
+        page_width_pt = pdf_raster_settings["DEFAULT_PAGE_WIDTH_PT"]
+
+    dpi = math.ceil(target_width_px * 72 / page_width_pt)
+    return max(pdf_raster_settings["MIN_DPI"], min(dpi, pdf_raster_settings["MAX_DPI"]))
+
+
+def get_image_pipeline_executor():
+    global image_pipeline_executor, image_pipeline_log_listener
+    with image_pipeline_executor_lock:
+        if not image_pipeline_executor:
+            pipeline_settings = config.settings["IMAGE_PIPELINE"]
+            num_workers = pipeline_settings["WORKERS"] or os.cpu_count() or 1
+
+            # spawn rather than fork: this process is multi-threaded, and fork isn't
+            # available on Windows anyway
+            mp_context = multiprocessing.get_context("spawn")
+
+            # records logged in the workers are handed to this process's root handlers
+            if not image_pipeline_log_listener:
+                image_pipeline_log_listener = logging.handlers.QueueListener(
+                    mp_context.Queue(),
+                    *logging.getLogger().handlers,
+                    respect_handler_level=True,
+                )
+                image_pipeline_log_listener.start()
+
+            image_pipeline_executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=num_workers,
+                mp_context=mp_context,
+                initializer=init_image_pipeline_worker,
+                initargs=(
+                    dict(config.settings),
+                    image_pipeline_log_listener.queue,
+                    pipeline_settings["MEMORY_LIMIT_MB"],
+                    utils_delegates.get_shared_delegate_slots(mp_context),
+                ),
+                max_tasks_per_child=pipeline_settings["MAX_TASKS_PER_WORKER"],
+            )
+            logger.info(
+                f"started image pipeline with {num_workers} worker processes, "
+                + f"{pipeline_settings['MEMORY_LIMIT_MB']} MB each"
+            )
+    return image_pipeline_executor
+
+
 def get_image_to_use(
     story_object,
     downloaded_img,
@@ -652,7 +753,109 @@ def get_image_to_use(
     return image_to_use
 
 
+def get_pdf_first_page_size(story_object):
+    # returns (width, height) in points of the PDF's first page as it will be displayed,
+    # and records the page count. Ghostscript renders only the first page, so the PDF
+    # itself is left as is.
+    log_prefix_local = f"id={story_object.id}: get_pdf_first_page_size: "
+    file_url_slug = (
+        f"file={story_object.downloaded_orig_thumb_full_path}, url={story_object.url}"
+    )
+
+    try:
+        with open(
+            story_object.downloaded_orig_thumb_full_path, mode="rb"
+        ) as pdf_file_stream:
+            pdf_file = PdfReader(pdf_file_stream, strict=False)
+
+            story_object.pdf_page_count = len(pdf_file.pages)
+
+            if story_object.pdf_page_count < 1:
+                raise ValueError(f"unexpected {story_object.pdf_page_count=}")
+
+            if story_object.pdf_page_count > 1:
+                story_object.thumb_aspect_hint = "PDF page"
+
+            first_page = pdf_file.pages[0]
+            page_width = float(first_page.mediabox.width)
+            page_height = float(first_page.mediabox.height)
+            if (first_page.rotation or 0) % 180 == 90:
+                page_width, page_height = page_height, page_width
+
+            logger.info(
+                log_prefix_local
+                + f"PDF has {story_object.pdf_page_count} page(s); first page is {page_width:.0f}x{page_height:.0f} pt"
+            )
+            return page_width, page_height
+
+    except Exception as exc:
+        exc_name = f"{exc.__class__.__module__}.{exc.__class__.__name__}"
+        exc_msg = str(exc)
+        exc_slug = f"{exc_name}: {exc_msg}"
+        logger.info(
+            log_prefix_local
+            + f"failed to read first page of PDF."
+            + exc_slug
+            + f"{file_url_slug} ~Tim~"
+        )
+        logger.info(log_prefix_local + traceback.format_exc())
+        raise exc
+
+
+def get_thumb_content_hash(source_file: str, processing_params: dict) -> str:
+    with open(source_file, mode="rb") as f:
+        source_bytes = f.read()
+    params_as_bytes = json.dumps(processing_params, sort_keys=True).encode("utf-8")
+    return utils_hash.get_sha1_of_bytes(source_bytes + params_as_bytes)[:24]
+
+
+def get_thumb_content_hash_lock(content_hash: str) -> threading.Lock:
+    with thumb_content_hash_locks_lock:
+        return thumb_content_hash_locks[content_hash]
+
+
+def get_thumb_index():
+    global thumb_index
+    with thumb_index_lock:
+        if not thumb_index:
+            thumb_index = ThumbIndex(config.settings["THUMB_INDEX_FILE"])
+            num_deleted = thumb_index.delete_uploaded_before(
+                config.settings["THUMB_CACHE"]["MAX_AGE_DAYS"] * 86_400
+            )
+            logger.info(
+                f"thumb index holds {thumb_index.count()} thumbs; dropped {num_deleted} stale entries"
+            )
+    return thumb_index
+
+
+def get_thumb_processing_params(mimetype, no_trim, webp_compression_quality) -> dict:
+    # everything besides the source image that decides what the thumb looks like
+    return {
+        "version": THUMB_PROCESSING_VERSION,
+        "mimetype": mimetype,
+        "no_trim": no_trim,
+        "webp_compression_quality": webp_compression_quality,
+        "width_px": config.settings["THUMBS"]["WIDTH_PX"]["EXTRALARGE"],
+        "bg_color": config.settings["THUMBS"]["BG_COLOR_FOR_TRANSPARENT_THUMBS"],
+        "pdf_raster": config.settings["THUMBS"]["PDF_RASTER"],
+        "min_dim_px": config.settings["OG_IMAGE"]["MIN_DIM_PX"],
+        "wand": config.settings["WAND"],
+    }
+
+
+def get_thumb_upload_future(story_object):
+    # the upload of the story's thumb, if it was made in this run; None otherwise
+    thumb_content_hash = getattr(story_object, "thumb_content_hash", None)
+    with thumb_uploads_lock:
+        thumb_upload = thumb_uploads.get(thumb_content_hash)
+    return thumb_upload["future"] if thumb_upload else None
+
+
 def get_webp_filename(story_object, size):
+    # stories from before content-addressed thumbs don't have the attribute
+    thumb_content_hash = getattr(story_object, "thumb_content_hash", None)
+    if thumb_content_hash:
+        return f"thumb-{thumb_content_hash}-{size}.webp"
     return f"thumb-{story_object.id}-{size}.webp"
 
 
@@ -702,14 +905,87 @@ def handle_exception(exc: Exception = None, log_prefix="", context=None):
     return
 
 
+def index_thumb(story_object, rendered_thumbs, upload_futures) -> None:
+    # indexed once every size is uploaded; if an upload fails, the thumb isn't indexed,
+    # and the next story with the same image makes it again
+    content_hash = story_object.thumb_content_hash
+    indexed_thumb = {
+        "rendered_thumbs": rendered_thumbs,
+        "pdf_page_count": story_object.pdf_page_count,
+        "thumb_aspect_hint": story_object.thumb_aspect_hint,
+    }
+    upload_future = get_combined_upload_future(upload_futures)
+    with thumb_uploads_lock:
+        thumb_uploads[content_hash] = {
+            "future": upload_future,
+            "indexed_thumb": indexed_thumb,
+        }
+
+    def index_thumb_once_uploaded(upload_future):
+        if upload_future.exception():
+            logger.error(
+                f"id={story_object.id}: upload of thumb failed; not indexing {content_hash} ~Tim~"
+            )
+            return
+        get_thumb_index().put(content_hash, indexed_thumb)
+
+    upload_future.add_done_callback(index_thumb_once_uploaded)
+
+
+def init_image_pipeline_worker(settings, log_queue, memory_limit_mb, delegate_slots):
+    config.settings.update(settings)
+
+    # ghostscript runs in the workers, so its slots have to be shared among them
+    utils_delegates.use_delegate_slots(delegate_slots)
+
+    root_logger = logging.getLogger()
+    root_logger.handlers = [logging.handlers.QueueHandler(log_queue)]
+    root_logger.setLevel(logging.INFO)
+
+    # ImageMagick spills to its disk cache at half the cap, and the data segment limit
+    # turns a runaway decode into an exception in this worker rather than an OOM kill
+    memory_limit_bytes = memory_limit_mb * 1024 * 1024
+    wand.resource.limits["memory"] = memory_limit_bytes // 2
+    wand.resource.limits["map"] = memory_limit_bytes // 2
+    if resource:
+        resource.setrlimit(
+            resource.RLIMIT_DATA, (memory_limit_bytes, memory_limit_bytes)
+        )
+
+
+def log_image_pipeline_stats(log_prefix=""):
+    log_prefix_local = log_prefix + "image pipeline: "
+    with image_pipeline_stats_lock:
+        stats = dict(image_pipeline_stats)
+
+    num_lookups = stats.get("thumb_cache_hits", 0) + stats.get("thumb_cache_misses", 0)
+    if num_lookups:
+        logger.info(
+            log_prefix_local
+            + f"thumb cache: {stats.get('thumb_cache_hits', 0)} of {num_lookups} thumbs "
+            + "reused without decoding, encoding or uploading"
+        )
+
+    num_jobs = stats.get("jobs", 0)
+    if not num_jobs:
+        logger.info(log_prefix_local + "no jobs")
+        return
+
+    logger.info(
+        log_prefix_local
+        + f"{num_jobs} jobs ({stats.get('jobs_with_thumb', 0)} with a thumb, "
+        + f"{stats.get('jobs_failed', 0)} failed, {stats.get('jobs_timed_out', 0)} timed out); "
+        + f"avg {stats.get('ms_waited', 0) / num_jobs:.0f} ms per job from submit to result; "
+        + f"{stats.get('pools_restarted', 0)} pool restarts"
+    )
+
+
 def populate_image_slug_in_story_object(
     story_object, img_loading="lazy", force_im6=False
 ) -> None:
     log_prefix_id = f"id={story_object.id}: "
     log_prefix = log_prefix_id + "populate_image_slug: "
-    force_aspect = None
     no_trim = False
-    no_pad = False
 
     # - elsewhere, create way of invoking specific version of imagemagick, so we can fall back to version 6 in case of the pamcmyk32 error
 
@@ -765,18 +1041,161 @@ def populate_image_slug_in_story_object(
     if og_image_domain_minus_www in domains_that_receive_higher_quality_resizing:
         WEBP_EXTRALARGE_THUMB_COMPRESSION_QUALITY = 100
 
-    # if multipage PDF, keep only first page
+    # a thumb already made from the same image with the same settings is reused as is;
+    # stories sharing an image that's still being processed wait for it instead
+    story_object.thumb_content_hash = get_thumb_content_hash(
+        story_object.downloaded_orig_thumb_full_path,
+        get_thumb_processing_params(
+            mimetype, no_trim, WEBP_EXTRALARGE_THUMB_COMPRESSION_QUALITY
+        ),
+    )
+    with get_thumb_content_hash_lock(story_object.thumb_content_hash):
+        if reuse_indexed_thumb(story_object, log_prefix=log_prefix):
+            # the downloaded og:image isn't needed after all
+            utils_file.delete_file(story_object.downloaded_orig_thumb_full_path)
+            return
+
+        # everything from here on is CPU-bound Wand/ImageMagick work, done in the image pipeline
+        result = run_image_pipeline_job(
+            story_object,
+            mimetype=mimetype,
+            no_trim=no_trim,
+            webp_compression_quality=WEBP_EXTRALARGE_THUMB_COMPRESSION_QUALITY,
+            img_loading=img_loading,
+            force_im6=force_im6,
+            log_prefix=log_prefix,
+        )
+        if not result:
+            story_object.has_thumb = False
+            return
+
+        story_object.downloaded_orig_thumb_full_path = result[
+            "downloaded_orig_thumb_full_path"
+        ]
+        story_object.pdf_page_count = result["pdf_page_count"]
+        story_object.thumb_aspect_hint = result["thumb_aspect_hint"]
+        story_object.has_thumb = result["has_thumb"]
+
+        upload_futures = []
+        for rendered_thumb in result["rendered_thumbs"]:
+            try:
+                upload_futures.append(
+                    save_thumb_where_it_should_go(rendered_thumb, story_object)
+                )
+            except Exception:
+                # save_thumb_where_it_should_go() has logged why
+                story_object.has_thumb = False
+
+        if story_object.has_thumb:
+            index_thumb(
+                story_object,
+                result["rendered_thumbs"],
+                upload_futures,
+            )
+
+
+def rasterize_pdf_using_ghostscript(story_object, page_width_pt=None):
+    # renders only the first page, at just enough resolution for the largest thumb;
+    # returns the path of the PNG, or None if Ghostscript produced nothing
+    log_prefix = f"id={story_object.id}: "
+    pdf_filename_full_path = story_object.downloaded_orig_thumb_full_path
+    cur_unix_time = int(time.time())
+    pdf2png_filename = f"pdf2png-{story_object.id}-{cur_unix_time}.png"
+    pdf2png_filename_full_path = os.path.join(
+        config.settings["TEMP_DIR"], pdf2png_filename
+    )
+
+    dpi = get_ghostscript_dpi_for_thumbs(page_width_pt)
+
+    cmd = []
+    cmd.append(
+        f"{config.settings['DELEGATES']['GHOSTSCRIPT_BINARY'][config.settings['cur_host']]}"
+    )
+    cmd.append("-dBATCH")
+    cmd.append("-dNOPAUSE")
+    cmd.append("-dQUIET")
+    cmd.append("-dSAFER")
+    cmd.append("-dFirstPage=1")
+    cmd.append("-dLastPage=1")
+    cmd.append("-dTextAlphaBits=4")
+    cmd.append("-dGraphicsAlphaBits=4")
+    cmd.append("-sDEVICE=png16m")
+    cmd.append(f"-r{dpi}")
+    cmd.append(f"-sOutputFile={pdf2png_filename_full_path}")
+    cmd.append(f"{pdf_filename_full_path}")
+
+    # logger.info(log_prefix + f"rasterize_pdf_using_ghostscript(): cmd={cmd}")
+
+    p = utils_delegates.run_delegate(cmd, delegate_name="ghostscript")
+
+    # logger.info(log_prefix + f"after subprocess: {p}")
+
+    if p.returncode != 0:
+        logger.error(
+            log_prefix
+            + f"subprocess had non-zero return code {p.returncode} ; cmd={cmd}"
+        )
+    # else:
+    #     logger.info(log_prefix + "subprocess returned successfully")
+
+    if not os.path.exists(pdf2png_filename_full_path):
+        logger.error(log_prefix + f"ghostscript produced no image; cmd={cmd}")
+        return None
+
+    # add page outline and dogear
+    try:
+        with Image(filename=pdf2png_filename_full_path) as pdf2png:
+            logger.info(
+                log_prefix
+                + f"rasterized first page of PDF at {dpi} dpi to {pdf2png.width}x{pdf2png.height} px"
+            )
+            border_hw = int(pdf2png.width / 350)
+            pdf2png.border("white", 5 * border_hw, 5 * border_hw)
+            # pdf2png.border('white', 4 * border_hw, 4 * border_hw)
+            pdf2png = draw_dogear(pdf2png, log_prefix=log_prefix)
+            pdf2png.save(filename=pdf2png_filename_full_path)
+    except Exception as exc:
+        logger.error(
+            log_prefix + f"failed to add page outline and dogear; error: {str(exc)}"
+        )
+    return pdf2png_filename_full_path
+
+
+def render_thumbs(
+    story_object,
+    rendered_thumbs,
+    mimetype,
+    no_trim=False,
+    webp_compression_quality=50,
+    img_loading="lazy",
+    force_im6=False,
+) -> None:
+    # turns the downloaded og:image (or PDF) into webp thumbs in TEMP_DIR, appending a
+    # dict for each to rendered_thumbs; sets story_object.has_thumb
+    log_prefix = f"id={story_object.id}: render_thumbs: "
+    force_aspect = None
+    no_pad = False
+
+    # if PDF, rasterize only its first page before ImageMagick ever opens the file
     if mimetype == "application/pdf":
         # TODO: in future, we want to know for certain that the application/pdf mimetype is true for the file
         try:
-            fix_multipage_pdf(story_object)
-            no_pad = True
+            page_width_pt, _ = get_pdf_first_page_size(story_object)
         except Exception as exc:
-            # detailed error logging happens in fix_multipage_pdf()
+            # detailed error logging happens in get_pdf_first_page_size()
             # we keep it there in case we want to (in future) take additional actions to respond to errors in that function
             story_object.has_thumb = False
             return
 
+        png2pdf_filename_full_path = rasterize_pdf_using_ghostscript(
+            story_object, page_width_pt=page_width_pt
+        )
+        if not png2pdf_filename_full_path:
+            story_object.has_thumb = False
+            return
+        story_object.downloaded_orig_thumb_full_path = png2pdf_filename_full_path
+        no_pad = True
+
     image_format = None
 
     try:
@@ -843,6 +1262,9 @@ def populate_image_slug_in_story_object(
                 png2pdf_filename_full_path = rasterize_pdf_using_ghostscript(
                     story_object
                 )
+                if not png2pdf_filename_full_path:
+                    story_object.has_thumb = False
+                    return
                 story_object.downloaded_orig_thumb_full_path = (
                     png2pdf_filename_full_path
                 )
@@ -903,14 +1325,16 @@ def populate_image_slug_in_story_object(
             with Image(image=image_to_use) as extralarge_thumb:
                 with extralarge_thumb.convert("webp") as webp_image:
                     webp_image.compression_quality = (
-                        WEBP_EXTRALARGE_THUMB_COMPRESSION_QUALITY
+                        webp_compression_quality
                     )
                     webp_image.transform(
                         resize=f"{config.settings['THUMBS']['WIDTH_PX']['EXTRALARGE']}x"
                     )
                     try:
-                        save_thumb_where_it_should_go(
-                            webp_image, story_object, "extralarge"
+                        rendered_thumbs.append(
+                            save_thumb_to_temp_dir(
+                                webp_image, story_object, "extralarge"
+                            )
                         )
                     except Exception as exc:
                         story_object.has_thumb = False
@@ -963,70 +1387,150 @@ def populate_image_slug_in_story_object(
         return
 
 
-def rasterize_pdf_using_ghostscript(story_object):
-    log_prefix = f"id={story_object.id}: "
-    pdf_filename_full_path = story_object.downloaded_orig_thumb_full_path
-    cur_unix_time = int(time.time())
-    pdf2png_filename = f"pdf2png-{story_object.id}-{cur_unix_time}.png"
-    pdf2png_filename_full_path = os.path.join(
-        config.settings["TEMP_DIR"], pdf2png_filename
+def render_thumbs_in_worker(
+    story_object,
+    mimetype,
+    no_trim=False,
+    webp_compression_quality=50,
+    img_loading="lazy",
+    force_im6=False,
+):
+    # runs in an image pipeline worker. Changes to this copy of story_object stay in
+    # this process, so the fields the story thread needs are handed back.
+    rendered_thumbs = []
+    render_thumbs(
+        story_object,
+        rendered_thumbs,
+        mimetype,
+        no_trim=no_trim,
+        webp_compression_quality=webp_compression_quality,
+        img_loading=img_loading,
+        force_im6=force_im6,
     )
+    return {
+        "has_thumb": story_object.has_thumb,
+        "downloaded_orig_thumb_full_path": story_object.downloaded_orig_thumb_full_path,
+        "pdf_page_count": story_object.pdf_page_count,
+        "thumb_aspect_hint": story_object.thumb_aspect_hint,
+        "rendered_thumbs": rendered_thumbs,
+    }
+
+
+def reuse_indexed_thumb(story_object, log_prefix="") -> bool:
+    # a thumb still uploading is reused too, unless its upload has already failed
+    with thumb_uploads_lock:
+        thumb_upload = thumb_uploads.get(story_object.thumb_content_hash)
+    if thumb_upload and not (
+        thumb_upload["future"].done() and thumb_upload["future"].exception()
+    ):
+        indexed_thumb = thumb_upload["indexed_thumb"]
+    else:
+        indexed_thumb = get_thumb_index().get(
+            story_object.thumb_content_hash,
+            max_age_seconds=config.settings["THUMB_CACHE"]["MAX_AGE_DAYS"] * 86_400,
+        )
+    with image_pipeline_stats_lock:
+        if indexed_thumb:
+            image_pipeline_stats["thumb_cache_hits"] += 1
+        else:
+            image_pipeline_stats["thumb_cache_misses"] += 1
+    if not indexed_thumb:
+        return False
 
-    cmd = []
-    cmd.append(
-        f"{config.settings['DELEGATES']['GHOSTSCRIPT_BINARY'][config.settings['cur_host']]}"
+    story_object.pdf_page_count = indexed_thumb["pdf_page_count"]
+    story_object.thumb_aspect_hint = indexed_thumb["thumb_aspect_hint"]
+    story_object.has_thumb = True
+    logger.info(
+        log_prefix
+        + f"reusing {get_webp_filename(story_object, 'extralarge')}, already made from the same image"
     )
-    cmd.append("-dBATCH")
-    cmd.append("-dNOPAUSE")
-    cmd.append("-dQUIET")
-    cmd.append("-sDEVICE=png16m")
-    cmd.append("-r600")
-    cmd.append(f"-sOutputFile={pdf2png_filename_full_path}")
-    cmd.append(f"{pdf_filename_full_path}")
+    return True
 
-    # logger.info(log_prefix + f"rasterize_pdf_using_ghostscript(): cmd={cmd}")
 
-    p = subprocess.run(cmd, capture_output=True)
+def run_image_pipeline_job(story_object, log_prefix="", **kwargs):
+    # returns the result of render_thumbs_in_worker(), or None if the job never finished
+    global image_pipeline_executor
+    log_prefix_local = log_prefix + "run_image_pipeline_job: "
 
-    # logger.info(log_prefix + f"after subprocess: {p}")
+    if config.debug_flags["DEBUG_FLAG_FORCE_SINGLE_THREAD_EXECUTION"]:
+        return render_thumbs_in_worker(story_object, **kwargs)
 
-    if p.returncode != 0:
-        logger.error(
-            log_prefix
-            + f"subprocess had non-zero return code {p.returncode} ; cmd={cmd}"
+    executor = get_image_pipeline_executor()
+    start_ts = time.monotonic()
+    result = None
+    try:
+        future = executor.submit(render_thumbs_in_worker, story_object, **kwargs)
+        result = future.result(
+            timeout=config.settings["IMAGE_PIPELINE"]["JOB_TIMEOUT_S"]
         )
-    # else:
-    #     logger.info(log_prefix + "subprocess returned successfully")
 
-    # add page outline and dogear
-    try:
-        pdf2png = Image(filename=pdf2png_filename_full_path)
-        border_hw = int(pdf2png.width / 350)
-        pdf2png.border("white", 5 * border_hw, 5 * border_hw)
-        # pdf2png.border('white', 4 * border_hw, 4 * border_hw)
-        pdf2png = draw_dogear(pdf2png, log_prefix=log_prefix)
-        pdf2png.save(filename=pdf2png_filename_full_path)
-        return pdf2png_filename_full_path
-    except Exception as exc:
+    except concurrent.futures.TimeoutError:
+        # the worker can't be interrupted; it finishes the job and its result is dropped
+        logger.error(log_prefix_local + "timed out waiting for image pipeline ~Tim~")
+        future.add_done_callback(
+            functools.partial(
+                delete_thumbs_of_dropped_job, story_object.thumb_content_hash
+            )
+        )
+        with image_pipeline_stats_lock:
+            image_pipeline_stats["jobs_timed_out"] += 1
+
+    except concurrent.futures.process.BrokenProcessPool as exc:
+        # a worker died (e.g., killed for memory); later jobs get a fresh pool, with fresh
+        # delegate slots in case the worker died holding one
         logger.error(
-            log_prefix + f"failed to add page outline and dogear; error: {str(exc)}"
+            log_prefix_local + f"image pipeline worker died: {str(exc)} ~Tim~"
         )
-        return pdf_filename_full_path
+        with image_pipeline_executor_lock:
+            if image_pipeline_executor is executor:
+                image_pipeline_executor = None
+                utils_delegates.reset_shared_delegate_slots()
+        executor.shutdown(wait=False)
+        with image_pipeline_stats_lock:
+            image_pipeline_stats["jobs_failed"] += 1
+            image_pipeline_stats["pools_restarted"] += 1
+
+    except Exception as exc:
+        exc_name = f"{exc.__class__.__module__}.{exc.__class__.__name__}"
+        exc_msg = str(exc)
+        exc_slug = f"{exc_name}: {exc_msg}"
+        logger.error(log_prefix_local + exc_slug + " ~Tim~")
+        with image_pipeline_stats_lock:
+            image_pipeline_stats["jobs_failed"] += 1
 
+    with image_pipeline_stats_lock:
+        image_pipeline_stats["jobs"] += 1
+        image_pipeline_stats["ms_waited"] += int(1000 * (time.monotonic() - start_ts))
+        if result and result["has_thumb"]:
+            image_pipeline_stats["jobs_with_thumb"] += 1
 
-def save_thumb_where_it_should_go(webp_image, story_object, size):
-    log_prefix = f"id={story_object.id}: save_thumb_where_it_should_go: "
+    return result
+
+
+def save_thumb_to_temp_dir(webp_image, story_object, size):
+    # runs in an image pipeline worker; the story thread uploads the file afterward
     thumb_filename = get_webp_filename(story_object, size)
     webp_image.save(filename=os.path.join(config.settings["TEMP_DIR"], thumb_filename))
+    return {
+        "size": size,
+        "filename": thumb_filename,
+        "width": webp_image.width,
+        "height": webp_image.height,
+    }
+
+
+def save_thumb_where_it_should_go(rendered_thumb, story_object):
+    # queues the upload and returns its future; the thumb is deleted from TEMP_DIR afterward
+    log_prefix = f"id={story_object.id}: save_thumb_where_it_should_go: "
+    thumb_filename = rendered_thumb["filename"]
     try:
-        utils_aws.upload_thumb(thumb_filename=thumb_filename)
+        return utils_aws.upload_thumb(thumb_filename=thumb_filename)
     except Exception as exc:
-        logger.error(log_prefix + f"failed to upload thumb to S3: {str(exc)}")
-        raise exc
-    finally:
+        logger.error(log_prefix + f"failed to queue upload of thumb to S3: {str(exc)}")
         utils_file.delete_file(
             os.path.join(config.settings["TEMP_DIR"], thumb_filename)
         )
+        raise exc
 
 
 def shortcode_if_og_image_url_contains_certain_substring(og_image_url: str):
@@ -1034,3 +1538,14 @@ def shortcode_if_og_image_url_contains_certain_substring(og_image_url: str):
         if each_substring in og_image_url:
             return prepared_images_roster_by_url_substring[each_substring]
     return None
+
+
+def shutdown_image_pipeline() -> None:
+    global image_pipeline_executor, image_pipeline_log_listener
+    with image_pipeline_executor_lock:
+        if image_pipeline_executor:
+            image_pipeline_executor.shutdown(wait=True)
+            image_pipeline_executor = None
+        if image_pipeline_log_listener:
+            image_pipeline_log_listener.stop()
+            image_pipeline_log_listener = None
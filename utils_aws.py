@@ -1,20 +1,29 @@
+import concurrent.futures
 import io
 import json
 import logging
+import math
 import os
+import queue
+import random
 import sys
+import tempfile
+import threading
 import time
 import traceback
-from collections import ChainMap
+from collections import ChainMap, Counter
 from typing import Dict, List, Set
 
 import boto3
 import boto3.session
 import botocore
+from boto3.s3.transfer import TransferConfig
 from botocore.errorfactory import ClientError
 
 import config
 import secrets_file
+import utils_file
+import utils_hash
 from thnr_exceptions import *
 
 logger = logging.getLogger(__name__)
@@ -28,6 +37,31 @@ s3_resource = boto3_session.resource("s3", config=s3_config)
 bucket_cdn = s3_resource.Bucket(secrets_file.aws_s3_bucket_name_cdn)
 bucket_html = s3_resource.Bucket(secrets_file.aws_s3_bucket_name_html)
 
+# uploads run on a pool of background threads sharing one S3 client (clients are
+# thread-safe, unlike the resources above), so callers needn't wait on S3 at all
+s3_client = None
+s3_client_lock = threading.Lock()
+upload_queue = None
+upload_workers = []
+upload_workers_lock = threading.Lock()
+pending_uploads = set()
+pending_uploads_lock = threading.Lock()
+upload_stats = Counter()
+upload_stats_lock = threading.Lock()
+
+# content hash and upload time of each object already in S3, so that an unchanged page
+# or thumb isn't uploaded again; kept on local disk and optionally mirrored to S3
+UPLOAD_MANIFEST_S3_KEY = "manifests/upload_manifest.json"
+upload_manifest = None
+upload_manifest_lock = threading.Lock()
+
+# errors worth another try; anything else (e.g., access denied) fails the upload at once
+retryable_upload_exceptions = (
+    boto3.exceptions.S3UploadFailedError,
+    botocore.exceptions.ConnectionError,
+    botocore.exceptions.HTTPClientError,
+)
+
 
 # def does_object_exist(full_s3_key):
 #     try:
@@ -60,6 +94,284 @@ bucket_html = s3_resource.Bucket(secrets_file.aws_s3_bucket_name_html)
 #         return False
 
 
+def enqueue_upload(
+    full_s3_key=None,
+    full_local_filename=None,
+    extra_args=None,
+    bucket=None,
+    delete_local_file=False,
+    content_hash=None,
+    max_age_if_unchanged_s=None,
+) -> concurrent.futures.Future:
+    # queues the upload and returns at once (unless the queue is full); the future's
+    # result is True, or it holds the exception from the upload's last attempt.
+    # With max_age_if_unchanged_s, the upload is skipped if the upload manifest shows the
+    # same content (the file's SHA1, unless content_hash is given) uploaded within that time.
+    if not extra_args:
+        extra_args = {
+            "Tagging": "Activity=UploadFile",
+        }
+
+    future = concurrent.futures.Future()
+
+    if max_age_if_unchanged_s is not None:
+        if not content_hash:
+            with open(full_local_filename, mode="rb") as f:
+                content_hash = utils_hash.get_sha1_of_bytes(f.read())
+
+        if is_unchanged_upload(full_s3_key, content_hash, max_age_if_unchanged_s):
+            num_bytes = os.path.getsize(full_local_filename)
+            with upload_stats_lock:
+                upload_stats["skipped_unchanged"] += 1
+                upload_stats["bytes_saved"] += num_bytes
+                upload_stats["requests_saved"] += get_num_upload_requests(num_bytes)
+            if delete_local_file:
+                utils_file.delete_file(full_local_filename)
+            future.set_result(True)
+            return future
+
+    with pending_uploads_lock:
+        pending_uploads.add(future)
+    future.add_done_callback(forget_pending_upload)
+
+    upload_job = {
+        "full_s3_key": full_s3_key,
+        "full_local_filename": full_local_filename,
+        "extra_args": extra_args,
+        "bucket_name": bucket.name,
+        "delete_local_file": delete_local_file,
+        "content_hash": content_hash,
+    }
+    get_upload_queue().put((future, upload_job))
+    return future
+
+
+def flush_uploads(timeout=None, log_prefix="") -> int:
+    # barrier: waits for every upload queued before this call (not ones queued during it);
+    # returns how many of them failed
+    log_prefix_local = log_prefix + "flush_uploads: "
+    with pending_uploads_lock:
+        uploads_to_wait_for = list(pending_uploads)
+    if not uploads_to_wait_for:
+        return 0
+
+    done, not_done = concurrent.futures.wait(uploads_to_wait_for, timeout=timeout)
+    num_failed = sum(1 for future in done if future.exception()) + len(not_done)
+    if num_failed:
+        logger.error(
+            log_prefix_local
+            + f"{num_failed} of {len(uploads_to_wait_for)} uploads failed or didn't finish ~Tim~"
+        )
+    return num_failed
+
+
+def forget_pending_upload(future):
+    with pending_uploads_lock:
+        pending_uploads.discard(future)
+
+
+def get_num_upload_requests(num_bytes: int) -> int:
+    # a single PUT, or a multipart upload's create, parts and complete
+    s3_uploads_settings = config.settings["S3_UPLOADS"]
+    if num_bytes < s3_uploads_settings["MULTIPART_THRESHOLD_MB"] * 1024 * 1024:
+        return 1
+    return 2 + math.ceil(
+        num_bytes / (s3_uploads_settings["MULTIPART_CHUNKSIZE_MB"] * 1024 * 1024)
+    )
+
+
+def get_s3_client():
+    global s3_client
+    with s3_client_lock:
+        if not s3_client:
+            s3_uploads_settings = config.settings["S3_UPLOADS"]
+            s3_client = boto3_session.client(
+                "s3",
+                config=s3_config.merge(
+                    botocore.config.Config(
+                        max_pool_connections=max(
+                            25,
+                            s3_uploads_settings["WORKERS"]
+                            * s3_uploads_settings["MULTIPART_CONCURRENCY"],
+                        ),
+                    )
+                ),
+            )
+    return s3_client
+
+
+def get_transfer_config():
+    s3_uploads_settings = config.settings["S3_UPLOADS"]
+    return TransferConfig(
+        multipart_threshold=s3_uploads_settings["MULTIPART_THRESHOLD_MB"] * 1024 * 1024,
+        multipart_chunksize=s3_uploads_settings["MULTIPART_CHUNKSIZE_MB"] * 1024 * 1024,
+        max_concurrency=s3_uploads_settings["MULTIPART_CONCURRENCY"],
+    )
+
+
+def get_upload_manifest() -> Dict:
+    # {s3 key: [content hash, upload time in epoch seconds]}; call with upload_manifest_lock held
+    global upload_manifest
+    if upload_manifest is not None:
+        return upload_manifest
+
+    manifest_settings = config.settings["S3_UPLOADS"]["MANIFEST"]
+    manifest_as_dict = None
+    try:
+        with open(
+            config.settings["UPLOAD_MANIFEST_FILE"], mode="r", encoding="utf-8"
+        ) as f:
+            manifest_as_dict = json.load(f)
+    except (FileNotFoundError, ValueError):
+        if manifest_settings["MIRROR_TO_S3"]:
+            try:
+                manifest_as_dict = get_json_from_s3_as_dict(UPLOAD_MANIFEST_S3_KEY)
+            except Exception as exc:
+                logger.info(f"no upload manifest in S3 either: {str(exc)}")
+
+    # entries past every max age can never save an upload again
+    oldest_usable = int(time.time()) - 3600 * max(
+        manifest_settings["MAX_AGE_HOURS_PAGES"],
+        manifest_settings["MAX_AGE_HOURS_THUMBS"],
+    )
+    upload_manifest = {
+        k: v
+        for k, v in (manifest_as_dict or {}).get("uploads", {}).items()
+        if v[1] >= oldest_usable
+    }
+    return upload_manifest
+
+
+def get_upload_queue():
+    global upload_queue
+    with upload_workers_lock:
+        if upload_queue is None:
+            s3_uploads_settings = config.settings["S3_UPLOADS"]
+            upload_queue = queue.Queue(maxsize=s3_uploads_settings["MAX_QUEUED"])
+            for i in range(s3_uploads_settings["WORKERS"]):
+                upload_worker = threading.Thread(
+                    target=run_upload_worker,
+                    args=(upload_queue,),
+                    name=f"s3_upload_{i}",
+                    daemon=True,
+                )
+                upload_worker.start()
+                upload_workers.append(upload_worker)
+    return upload_queue
+
+
+def is_unchanged_upload(full_s3_key, content_hash, max_age_s) -> bool:
+    with upload_manifest_lock:
+        entry = get_upload_manifest().get(full_s3_key)
+    return bool(
+        entry and entry[0] == content_hash and entry[1] >= int(time.time()) - max_age_s
+    )
+
+
+def log_upload_stats(log_prefix=""):
+    log_prefix_local = log_prefix + "s3 uploads: "
+    with upload_stats_lock:
+        stats = dict(upload_stats)
+    logger.info(
+        log_prefix_local
+        + f"{stats.get('uploads', 0)} uploaded ({stats.get('bytes', 0) / 1_000_000:.1f} MB), "
+        + f"{stats.get('failures', 0)} failed, {stats.get('retries', 0)} retries"
+    )
+    logger.info(
+        log_prefix_local
+        + f"{stats.get('skipped_unchanged', 0)} unchanged uploads skipped, saving "
+        + f"{stats.get('bytes_saved', 0) / 1_000_000:.1f} MB and {stats.get('requests_saved', 0)} requests"
+    )
+
+
+def record_upload(full_s3_key, content_hash) -> None:
+    with upload_manifest_lock:
+        get_upload_manifest()[full_s3_key] = [content_hash, int(time.time())]
+
+
+def run_upload_worker(upload_queue):
+    while True:
+        future, upload_job = upload_queue.get()
+        try:
+            if future is None:
+                return
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                upload_file_with_retries(
+                    full_s3_key=upload_job["full_s3_key"],
+                    full_local_filename=upload_job["full_local_filename"],
+                    extra_args=upload_job["extra_args"],
+                    bucket_name=upload_job["bucket_name"],
+                )
+                if upload_job["content_hash"]:
+                    record_upload(upload_job["full_s3_key"], upload_job["content_hash"])
+                future.set_result(True)
+            except Exception as exc:
+                future.set_exception(exc)
+            finally:
+                if upload_job["delete_local_file"]:
+                    utils_file.delete_file(upload_job["full_local_filename"])
+        finally:
+            upload_queue.task_done()
+
+
+def save_upload_manifest(log_prefix="") -> None:
+    log_prefix_local = log_prefix + "save_upload_manifest: "
+    with upload_manifest_lock:
+        if upload_manifest is None:
+            return
+        manifest_as_dict = {
+            "time_saved": int(time.time()),
+            "uploads": dict(upload_manifest),
+        }
+
+    # write to a temp file and rename, so an interrupted run can't leave a partial manifest
+    manifest_dir = os.path.dirname(config.settings["UPLOAD_MANIFEST_FILE"])
+    fd, temp_path = tempfile.mkstemp(dir=manifest_dir, suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode="w", encoding="utf-8") as f:
+            json.dump(manifest_as_dict, f)
+        os.replace(temp_path, config.settings["UPLOAD_MANIFEST_FILE"])
+    except Exception as exc:
+        utils_file.delete_file(temp_path)
+        logger.error(log_prefix_local + f"failed to save upload manifest: {str(exc)}")
+        return
+
+    if config.settings["S3_UPLOADS"]["MANIFEST"]["MIRROR_TO_S3"]:
+        extra_args = {
+            "ContentType": "application/json",
+            "Tagging": "Activity=UploadManifest",
+        }
+        if not upload_dict_to_s3_as_json(
+            d=manifest_as_dict,
+            full_s3_key=UPLOAD_MANIFEST_S3_KEY,
+            extra_args=extra_args,
+        ):
+            logger.error(log_prefix_local + "failed to mirror upload manifest to S3")
+
+    logger.info(
+        log_prefix_local
+        + f"saved upload manifest of {len(manifest_as_dict['uploads'])} objects"
+    )
+
+
+def shutdown_uploader(timeout=None, log_prefix=""):
+    global upload_queue
+    flush_uploads(timeout=timeout, log_prefix=log_prefix)
+    with upload_workers_lock:
+        if upload_queue is None:
+            return
+        for _ in upload_workers:
+            upload_queue.put((None, None))
+        for upload_worker in upload_workers:
+            upload_worker.join(timeout=timeout)
+        upload_workers.clear()
+        upload_queue = None
+
+    save_upload_manifest(log_prefix=log_prefix)
+
+
 def get_json_from_s3_as_dict(full_s3_key):
     try:
         obj = s3_resource.Object(
@@ -104,67 +416,89 @@ def upload_file_to_s3(
     full_s3_key=None,
     full_local_filename=None,
     extra_args=None,
-    retries_left=3,
     bucket=None,
+    content_hash=None,
+    max_age_if_unchanged_s=None,
 ):
-    log_prefix = "upload_file_to_s3():"
-
-    if not extra_args:
-        extra_args = {
-            "Tagging": "Activity=UploadFile",
-        }
-
-    try:
-        bucket.upload_file(
-            Key=full_s3_key,
-            Filename=full_local_filename,
-            ExtraArgs=extra_args,
-        )
-    except (
-        boto3.exceptions.S3UploadFailedError,
-        botocore.exceptions.EndpointConnectionError,
-    ) as exc:
-        exc_module = exc.__class__.__module__
-        exc_short_name = exc.__class__.__name__
-        exc_name = exc_module + "." + exc_short_name
-        exc_msg = str(exc)
-        exc_slug = exc_name + ": " + exc_msg
-        tb_str = traceback.format_exc()
-
-        if retries_left > 0:
+    # waits for the upload, which still goes through the upload workers and their retries
+    return enqueue_upload(
+        full_s3_key=full_s3_key,
+        full_local_filename=full_local_filename,
+        extra_args=extra_args,
+        bucket=bucket,
+        content_hash=content_hash,
+        max_age_if_unchanged_s=max_age_if_unchanged_s,
+    ).result()
+
+
+def upload_file_with_retries(
+    full_s3_key, full_local_filename, extra_args, bucket_name, log_prefix=""
+):
+    log_prefix_local = log_prefix + "upload_file_with_retries: "
+    s3_uploads_settings = config.settings["S3_UPLOADS"]
+
+    for attempt in range(1, s3_uploads_settings["MAX_ATTEMPTS"] + 1):
+        try:
+            # upload_file switches to a multipart upload above the multipart threshold
+            get_s3_client().upload_file(
+                Filename=full_local_filename,
+                Bucket=bucket_name,
+                Key=full_s3_key,
+                ExtraArgs=extra_args,
+                Config=get_transfer_config(),
+            )
+            with upload_stats_lock:
+                upload_stats["uploads"] += 1
+                upload_stats["bytes"] += os.path.getsize(full_local_filename)
+            return
+
+        except retryable_upload_exceptions as exc:
+            exc_name = f"{exc.__class__.__module__}.{exc.__class__.__name__}"
+            exc_msg = str(exc)
+            exc_slug = f"{exc_name}: {exc_msg}"
+
+            if attempt == s3_uploads_settings["MAX_ATTEMPTS"]:
+                with upload_stats_lock:
+                    upload_stats["failures"] += 1
+                logger.error(
+                    log_prefix_local
+                    + f"giving up on uploading {full_local_filename} to {full_s3_key} after {attempt} attempts: "
+                    + exc_slug
+                    + " ~Tim~"
+                )
+                raise exc
+
+            # full jitter, so uploads that failed together don't all retry together
+            delay = random.uniform(
+                0,
+                min(
+                    s3_uploads_settings["RETRY_MAX_DELAY_S"],
+                    s3_uploads_settings["RETRY_BASE_DELAY_S"] * 2 ** (attempt - 1),
+                ),
+            )
+            with upload_stats_lock:
+                upload_stats["retries"] += 1
             logger.info(
-                log_prefix
-                + f"problem uploading {full_local_filename} to {full_s3_key} ; will retry: "
+                log_prefix_local
+                + f"problem uploading {full_local_filename} to {full_s3_key}; will retry in {delay:.1f}s: "
                 + exc_slug
-                + " ~Tim~"
-            )
-            logger.info(log_prefix + tb_str)
-            time.sleep(1)
-            upload_file_to_s3(
-                full_s3_key=full_s3_key,
-                full_local_filename=full_local_filename,
-                extra_args=extra_args,
-                retries_left=retries_left - 1,
-                bucket=bucket,
             )
-        else:
+            time.sleep(delay)
+
+        except Exception as exc:
+            exc_name = f"{exc.__class__.__module__}.{exc.__class__.__name__}"
+            exc_msg = str(exc)
+            exc_slug = f"{exc_name}: {exc_msg}"
+            with upload_stats_lock:
+                upload_stats["failures"] += 1
+            logger.error(log_prefix_local + exc_slug + f" {full_local_filename=}")
+            logger.error(log_prefix_local + traceback.format_exc())
             raise exc
 
-    except Exception as exc:
-        exc_module = exc.__class__.__module__
-        exc_short_name = exc.__class__.__name__
-        exc_name = exc_module + "." + exc_short_name
-        exc_msg = str(exc)
-        exc_slug = exc_name + ": " + exc_msg
-        tb_str = traceback.format_exc()
-        logger.error(exc_slug + f" {full_local_filename=}")
-        logger.error(tb_str)
-        raise exc
 
-    return True
-
-
-def upload_page_of_stories(page_filename=None, log_prefix=""):
+def upload_page_of_stories(page_filename=None, content_hash=None, log_prefix=""):
+    # content_hash identifies the page's content for the upload manifest, so that a page
+    # that only differs in, e.g., its generation time isn't uploaded again
     extra_args = {
         "ContentLanguage": "en",
         "ContentType": "text/html",
@@ -179,10 +513,13 @@ def upload_page_of_stories(page_filename=None, log_prefix=""):
             ),
             extra_args=extra_args,
             bucket=bucket_html,
+            content_hash=content_hash,
+            max_age_if_unchanged_s=3600
+            * config.settings["S3_UPLOADS"]["MANIFEST"]["MAX_AGE_HOURS_PAGES"],
         )
         logger.info(log_prefix + f"uploaded {page_filename} to S3")
     except Exception as exc:
-        logger.error(log_prefix + f"failed to upload {page_filename} to S3 " + exc)
+        logger.error(log_prefix + f"failed to upload {page_filename} to S3: {str(exc)}")
         raise exc
 
 
@@ -203,8 +540,9 @@ def upload_string_to_s3(string: str, full_s3_key, extra_args=None, bucket=bucket
         }
 
     try:
-        bucket.upload_fileobj(
+        get_s3_client().upload_fileobj(
             Fileobj=buffer,
+            Bucket=bucket.name,
             Key=full_s3_key,
             ExtraArgs=extra_args,
         )
@@ -226,17 +564,16 @@ def upload_string_to_s3(string: str, full_s3_key, extra_args=None, bucket=bucket
     #     return False
 
 
-def upload_thumb(thumb_filename: str):
+def upload_thumb(thumb_filename: str) -> concurrent.futures.Future:
+    # uploads in the background, then deletes the thumb from TEMP_DIR
     extra_args = {"ContentType": "image/webp", "Tagging": "Activity=UploadThumb"}
 
-    try:
-        upload_file_to_s3(
-            full_s3_key=f"{config.s3_thumbs_path}{thumb_filename}",
-            full_local_filename=os.path.join(
-                config.settings["TEMP_DIR"], thumb_filename
-            ),
-            extra_args=extra_args,
-            bucket=bucket_cdn,
-        )
-    except Exception as exc:
-        raise exc
+    return enqueue_upload(
+        full_s3_key=f"{config.s3_thumbs_path}{thumb_filename}",
+        full_local_filename=os.path.join(config.settings["TEMP_DIR"], thumb_filename),
+        extra_args=extra_args,
+        bucket=bucket_cdn,
+        delete_local_file=True,
+        max_age_if_unchanged_s=3600
+        * config.settings["S3_UPLOADS"]["MANIFEST"]["MAX_AGE_HOURS_THUMBS"],
+    )
@@ -0,0 +1,184 @@
+import atexit
+import collections
+import contextlib
+import logging
+import queue
+import threading
+import time
+
+import hrequests
+import hrequests.exceptions
+
+import config
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# warm headless browsers shared by every render(), one pool per browser type. A browser is
+# checked out of its pool's queue for one page at a time, so each render costs a new browser
+# context instead of launching a browser. Browsers are retired after
+# BROWSER_POOL.MAX_USES_PER_BROWSER pages (they grow over time) or as soon as one crashes,
+# and a fresh one is started on demand
+browser_pools = {}
+browser_pools_lock = threading.Lock()
+
+browser_pool_stats = collections.Counter()
+browser_pool_stats_lock = threading.Lock()
+
+
+class PooledBrowser:
+    def __init__(self, browser: str) -> None:
+        self.engine = hrequests.BrowserEngine(browser=browser)
+        self.num_uses = 0
+
+    def close(self) -> None:
+        try:
+            self.engine.stop()
+        except Exception as exc:
+            exc_name = f"{exc.__class__.__module__}.{exc.__class__.__name__}"
+            logger.info(f"PooledBrowser: failed to stop browser: {exc_name}: {exc}")
+
+
+class BrowserPool:
+    def __init__(self, browser: str) -> None:
+        self.browser = browser
+        self.idle_browsers = queue.Queue()
+        self.lock = threading.Lock()
+        self.num_browsers_started = 0
+
+    def checkout(self) -> PooledBrowser:
+        pool_settings = get_browser_pool_settings()
+        deadline = time.monotonic() + pool_settings["LEASE_TIMEOUT_S"]
+
+        while True:
+            try:
+                return self.idle_browsers.get_nowait()
+            except queue.Empty:
+                pass
+
+            with self.lock:
+                can_start_browser = (
+                    self.num_browsers_started < pool_settings["BROWSERS"]
+                )
+                if can_start_browser:
+                    self.num_browsers_started += 1
+
+            if can_start_browser:
+                try:
+                    pooled_browser = PooledBrowser(self.browser)
+                except Exception:
+                    with self.lock:
+                        self.num_browsers_started -= 1
+                    raise
+                increment_browser_pool_stat("browsers_started")
+                return pooled_browser
+
+            # wait for a browser to be checked back in, or for a broken one to be retired
+            if time.monotonic() >= deadline:
+                raise TimeoutError(
+                    f"no {self.browser} browser free after {pool_settings['LEASE_TIMEOUT_S']} s"
+                )
+            try:
+                return self.idle_browsers.get(timeout=1)
+            except queue.Empty:
+                continue
+
+    def checkin(self, pooled_browser: PooledBrowser, is_healthy: bool) -> None:
+        pooled_browser.num_uses += 1
+
+        if not is_healthy:
+            increment_browser_pool_stat("retired_after_crash")
+        elif pooled_browser.num_uses >= get_browser_pool_settings()["MAX_USES_PER_BROWSER"]:
+            increment_browser_pool_stat("retired_after_max_uses")
+        else:
+            self.idle_browsers.put(pooled_browser)
+            return
+
+        pooled_browser.close()
+        with self.lock:
+            self.num_browsers_started -= 1
+
+    def close(self) -> None:
+        # leased browsers are closed when they're checked back in
+        while True:
+            try:
+                pooled_browser = self.idle_browsers.get_nowait()
+            except queue.Empty:
+                break
+            pooled_browser.close()
+            with self.lock:
+                self.num_browsers_started -= 1
+
+
+def get_browser_pool_settings():
+    return config.settings["BROWSER_POOL"]
+
+
+def get_browser_pool(browser: str) -> BrowserPool:
+    with browser_pools_lock:
+        if browser not in browser_pools:
+            browser_pools[browser] = BrowserPool(browser)
+        return browser_pools[browser]
+
+
+def increment_browser_pool_stat(stat_name, amount=1) -> None:
+    with browser_pool_stats_lock:
+        browser_pool_stats[stat_name] += amount
+
+
+@contextlib.contextmanager
+def render(response, browser="chrome", mock_human=True):
+    # drop-in for `with response.render(headless=True, mock_human=True) as page:` that
+    # leases a warm browser from the pool instead of launching one
+    browser_pool = get_browser_pool(browser)
+
+    lease_start_ts = time.monotonic()
+    pooled_browser = browser_pool.checkout()
+    increment_browser_pool_stat("leases")
+    increment_browser_pool_stat("lease_wait_s", time.monotonic() - lease_start_ts)
+
+    is_healthy = True
+    try:
+        with response.render(
+            headless=True, mock_human=mock_human, engine=pooled_browser.engine
+        ) as page:
+            yield page
+    except hrequests.exceptions.BrowserTimeoutException:
+        # a slow page isn't the browser's fault
+        raise
+    except Exception:
+        is_healthy = False
+        raise
+    finally:
+        browser_pool.checkin(pooled_browser, is_healthy=is_healthy)
+
+
+def wait_for_page_to_settle(page) -> None:
+    # goto() returns once the page has loaded; this gives scripts that run on load a
+    # moment to fill in the page
+    time.sleep(get_browser_pool_settings()["SETTLE_S"])
+
+
+def log_browser_pool_stats(log_prefix=""):
+    log_prefix_local = log_prefix + "browser pool: "
+    with browser_pool_stats_lock:
+        stats = dict(browser_pool_stats)
+    if not stats.get("leases"):
+        return
+    logger.info(
+        log_prefix_local
+        + f"{stats['leases']} pages rendered by {stats.get('browsers_started', 0)} browsers, "
+        + f"avg wait for a browser {stats.get('lease_wait_s', 0) / stats['leases']:.2f} s; "
+        + f"{stats.get('retired_after_max_uses', 0)} browsers retired after max uses, "
+        + f"{stats.get('retired_after_crash', 0)} after crashing"
+    )
+
+
+def shutdown() -> None:
+    with browser_pools_lock:
+        pools_to_close = list(browser_pools.values())
+    for browser_pool in pools_to_close:
+        browser_pool.close()
+
+
+atexit.register(shutdown)
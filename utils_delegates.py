@@ -0,0 +1,216 @@
+import atexit
+import logging
+import queue
+import subprocess
+import threading
+from typing import Dict, List
+
+import config
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# long-lived exiftool processes in -stay_open mode, checked out of a queue one job at a time,
+# so that each file costs a round trip over a pipe instead of a Perl interpreter startup
+exiftool_processes = queue.Queue()
+exiftool_processes_lock = threading.Lock()
+num_exiftool_processes_started = 0
+
+# other delegates (e.g., ghostscript) still run one subprocess per job, but only
+# MAX_CONCURRENT_SUBPROCESSES at once overall, and a memory-hungry delegate can be
+# held to fewer still via its own <NAME>_PROCESSES setting. Once the image pipeline
+# starts, the slots are semaphores shared with its worker processes, so these limits
+# hold across the pipeline and this process together
+delegate_slots = {}
+delegate_slots_lock = threading.Lock()
+shared_delegate_slots = None
+
+
+class ExiftoolProcess:
+    def __init__(self, exiftool_binary: str) -> None:
+        self.proc = subprocess.Popen(
+            [exiftool_binary, "-stay_open", "True", "-@", "-"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+        )
+        self.num_jobs = 0
+
+    def execute(self, args: List[str], timeout: float) -> str:
+        # returns what exiftool printed for this job (including any error messages)
+        self.num_jobs += 1
+        ready_marker = "{ready" + str(self.num_jobs) + "}"
+
+        # a hung exiftool is killed, which ends the readline() loop below with EOF
+        watchdog = threading.Timer(timeout, self.proc.kill)
+        watchdog.start()
+        try:
+            self.proc.stdin.write(
+                "\n".join(args) + "\n" + f"-execute{self.num_jobs}\n"
+            )
+            self.proc.stdin.flush()
+
+            output_lines = []
+            while True:
+                line = self.proc.stdout.readline()
+                if not line:
+                    raise RuntimeError("exiftool exited during job")
+                if line.rstrip("\r\n") == ready_marker:
+                    break
+                output_lines.append(line)
+        finally:
+            watchdog.cancel()
+
+        return "".join(output_lines)
+
+    def is_alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def close(self) -> None:
+        try:
+            if self.is_alive():
+                self.proc.stdin.write("-stay_open\nFalse\n")
+                self.proc.stdin.flush()
+                self.proc.wait(timeout=5)
+        except Exception:
+            self.proc.kill()
+
+
+def get_delegate_settings():
+    return config.settings["DELEGATES"]
+
+
+def checkout_exiftool_process() -> ExiftoolProcess:
+    global num_exiftool_processes_started
+
+    while True:
+        try:
+            return exiftool_processes.get_nowait()
+        except queue.Empty:
+            pass
+
+        delegate_settings = get_delegate_settings()
+        with exiftool_processes_lock:
+            can_start_process = (
+                num_exiftool_processes_started
+                < delegate_settings["EXIFTOOL_PROCESSES"]
+            )
+            if can_start_process:
+                num_exiftool_processes_started += 1
+
+        if can_start_process:
+            try:
+                return ExiftoolProcess(
+                    delegate_settings["EXIFTOOL_BINARY"][config.settings["cur_host"]]
+                )
+            except Exception:
+                with exiftool_processes_lock:
+                    num_exiftool_processes_started -= 1
+                raise
+
+        # wait for a process to be checked back in, or for a broken one to be retired
+        try:
+            return exiftool_processes.get(timeout=1)
+        except queue.Empty:
+            continue
+
+
+def run_exiftool(args: List[str], timeout: float = 30) -> str:
+    # queue-based front end to the exiftool processes; raises if exiftool failed outright
+    global num_exiftool_processes_started
+
+    exiftool_process = checkout_exiftool_process()
+    try:
+        output = exiftool_process.execute(args, timeout=timeout)
+    except Exception:
+        # retire the broken process; a fresh one is started on demand
+        exiftool_process.proc.kill()
+        with exiftool_processes_lock:
+            num_exiftool_processes_started -= 1
+        raise
+
+    exiftool_processes.put(exiftool_process)
+    return output
+
+
+def get_delegate_slots(delegate_name: str = None) -> threading.BoundedSemaphore:
+    if delegate_name:
+        setting_name = f"{delegate_name.upper()}_PROCESSES"
+    else:
+        setting_name = "MAX_CONCURRENT_SUBPROCESSES"
+
+    with delegate_slots_lock:
+        if setting_name not in delegate_slots:
+            delegate_slots[setting_name] = threading.BoundedSemaphore(
+                get_delegate_settings()[setting_name]
+            )
+        return delegate_slots[setting_name]
+
+
+def get_delegate_slot_setting_names() -> List[str]:
+    # exiftool has its own pool of processes rather than slots
+    return ["MAX_CONCURRENT_SUBPROCESSES"] + sorted(
+        setting_name
+        for setting_name in get_delegate_settings()
+        if setting_name.endswith("_PROCESSES") and setting_name != "EXIFTOOL_PROCESSES"
+    )
+
+
+def get_shared_delegate_slots(mp_context) -> Dict:
+    # slots that can be handed to processes started from mp_context (see
+    # use_delegate_slots()); this process switches to them too
+    global shared_delegate_slots
+    with delegate_slots_lock:
+        if shared_delegate_slots is None:
+            shared_delegate_slots = {
+                setting_name: mp_context.BoundedSemaphore(
+                    get_delegate_settings()[setting_name]
+                )
+                for setting_name in get_delegate_slot_setting_names()
+            }
+            delegate_slots.update(shared_delegate_slots)
+        return shared_delegate_slots
+
+
+def reset_shared_delegate_slots() -> None:
+    # called when the image pipeline's workers have died: a worker killed while holding a
+    # slot never releases it, so the next pool gets fresh slots rather than the leaked ones
+    global shared_delegate_slots
+    with delegate_slots_lock:
+        if shared_delegate_slots is not None:
+            for setting_name in shared_delegate_slots:
+                delegate_slots.pop(setting_name, None)
+            shared_delegate_slots = None
+
+
+def use_delegate_slots(slots: Dict) -> None:
+    # called in a worker process with the slots from get_shared_delegate_slots()
+    with delegate_slots_lock:
+        delegate_slots.update(slots)
+
+
+def run_delegate(
+    cmd: List[str], timeout: float = 120, delegate_name: str = None
+) -> subprocess.CompletedProcess:
+    if delegate_name:
+        with get_delegate_slots(delegate_name):
+            with get_delegate_slots():
+                return subprocess.run(cmd, capture_output=True, timeout=timeout)
+
+    with get_delegate_slots():
+        return subprocess.run(cmd, capture_output=True, timeout=timeout)
+
+
+def shutdown() -> None:
+    while True:
+        try:
+            exiftool_process = exiftool_processes.get_nowait()
+        except queue.Empty:
+            break
+        exiftool_process.close()
+
+
+atexit.register(shutdown)
@@ -14,23 +14,39 @@ def delete_file(file_full_path, log_prefix=""):
         logger.error(log_prefix_local + f"failed to delete {file_full_path}")
 
 
-def save_response_content_to_disk(response, dest_local_file, log_prefix=""):
-    log_prefix_local = log_prefix + "save_response_content_to_disk: "
+def get_response_content_as_bytes(response, log_prefix=""):
+    log_prefix_local = log_prefix + "get_response_content_as_bytes: "
 
     if isinstance(response.content, bytes):
-        content_to_use = response.content
+        return response.content
     elif isinstance(response.content, str):
-        content_to_use = response.content.encode("utf-8")
+        return response.content.encode("utf-8")
     else:
         logger.error(
             log_prefix_local
             + f"unexpected type of response.content: {type(response.content)}"
         )
+        return None
+
+
+def save_response_content_to_disk(response, dest_local_file, log_prefix=""):
+    log_prefix_local = log_prefix + "save_response_content_to_disk: "
+
+    content_to_use = get_response_content_as_bytes(
+        response, log_prefix=log_prefix_local
+    )
+    if content_to_use is None:
         return False
 
+    return save_bytes_to_disk(content_to_use, dest_local_file, log_prefix=log_prefix)
+
+
+def save_bytes_to_disk(content, dest_local_file, log_prefix=""):
+    log_prefix_local = log_prefix + "save_bytes_to_disk: "
+
     try:
         with open(dest_local_file, "wb") as fout:
-            fout.write(content_to_use)
+            fout.write(content)
         return True
     except Exception as exc:
         short_exc_name = exc.__class__.__name__
@@ -1,11 +1,18 @@
+import asyncio
 import builtins
+import collections
+import concurrent.futures
+import functools
 import importlib
 import json
 import logging
 import os
 import re
+import tempfile
+import threading
 import time
 import traceback
+import urllib.parse
 import warnings  # to quiet httpx deprecation warnings
 
 import hrequests
@@ -13,12 +20,17 @@ import hrequests.exceptions
 import httpx
 import lxml.etree
 import requests
+import requests.adapters
 import urllib3
 
 import config
 import secrets_file
+import utils_browser
+import utils_file
 import utils_random
-from thnr_exceptions import FailedAfterRetrying
+from HostScheduler import HostScheduler
+from HttpCache import HttpCache
+from thnr_exceptions import FailedAfterRetrying, ResponseBodyTooLarge
 from Trie import Trie
 
 logger = logging.getLogger(__name__)
@@ -34,6 +46,703 @@ urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 empty_page_source = "<html><head></head><body></body></html>"
 # user_agent = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36"
 
+# process-wide requests sessions, one per host, so that repeat fetches from the same host
+# re-use open (and already TLS-negotiated) connections; least recently used hosts are evicted
+sessions_by_host = collections.OrderedDict()
+sessions_by_host_lock = threading.Lock()
+requests_by_host = collections.Counter()
+session_pool_stats = {
+    "sessions_created": 0,
+    "sessions_evicted": 0,
+    "connections_of_evicted_sessions": 0,
+    "requests_of_evicted_sessions": 0,
+}
+
+
+def get_session_pool_settings():
+    session_pool_settings = {"MAX_HOSTS": 256, "POOL_CONNECTIONS": 4, "POOL_MAXSIZE": 10}
+    if "SCRAPING" in config.settings:
+        session_pool_settings.update(
+            config.settings["SCRAPING"].get("SESSION_POOL", {})
+        )
+    return session_pool_settings
+
+
+def create_pooled_session(host):
+    session_pool_settings = get_session_pool_settings()
+
+    # pool_connections is how many hosts (this host plus any redirect targets) keep
+    # their connections; pool_maxsize is how many idle connections each host keeps
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=session_pool_settings["POOL_CONNECTIONS"],
+        pool_maxsize=session_pool_settings["POOL_MAXSIZE"],
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    def count_request(response, *args, **kwargs):
+        with sessions_by_host_lock:
+            requests_by_host[host] += 1
+
+    session.hooks["response"].append(count_request)
+
+    return session
+
+
+def get_session_for_url(url):
+    # sessions are shared between threads, so callers pass headers, timeouts, etc.
+    # with each request instead of setting them on the session
+    host = urllib.parse.urlsplit(url).hostname or ""
+
+    with sessions_by_host_lock:
+        session = sessions_by_host.get(host)
+        if session:
+            sessions_by_host.move_to_end(host)
+            return session
+
+        session = create_pooled_session(host)
+        sessions_by_host[host] = session
+        session_pool_stats["sessions_created"] += 1
+
+        while len(sessions_by_host) > get_session_pool_settings()["MAX_HOSTS"]:
+            evicted_host, evicted_session = sessions_by_host.popitem(last=False)
+            session_pool_stats["sessions_evicted"] += 1
+            session_pool_stats[
+                "connections_of_evicted_sessions"
+            ] += count_session_connections(evicted_session)
+            session_pool_stats["requests_of_evicted_sessions"] += requests_by_host.pop(
+                evicted_host, 0
+            )
+            evicted_session.close()
+
+    return session
+
+
+def count_session_connections(session):
+    # number of connections the session has opened over its lifetime
+    num_connections = 0
+    for adapter in set(session.adapters.values()):
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool:
+                num_connections += pool.num_connections
+    return num_connections
+
+
+def log_session_pool_stats(log_prefix=""):
+    log_prefix_local = log_prefix + "session pool: "
+
+    with sessions_by_host_lock:
+        connections_by_host = {
+            host: count_session_connections(session)
+            for host, session in sessions_by_host.items()
+        }
+        num_requests = (
+            sum(requests_by_host.values())
+            + session_pool_stats["requests_of_evicted_sessions"]
+        )
+        num_connections = (
+            sum(connections_by_host.values())
+            + session_pool_stats["connections_of_evicted_sessions"]
+        )
+        busiest_hosts = requests_by_host.most_common(5)
+        stats = dict(session_pool_stats)
+
+    num_reused = max(0, num_requests - num_connections)
+    reuse_pct = 100 * num_reused / num_requests if num_requests else 0
+    logger.info(
+        log_prefix_local
+        + f"{num_requests} requests over {num_connections} new connections ({num_reused} or {reuse_pct:.0f}% re-used a connection); "
+        + f"{len(connections_by_host)} hosts pooled, {stats['sessions_created']} sessions created, {stats['sessions_evicted']} evicted"
+    )
+    if busiest_hosts:
+        logger.info(
+            log_prefix_local
+            + "busiest hosts: "
+            + ", ".join(
+                f"{host} ({n} requests, {connections_by_host.get(host, 0)} connections)"
+                for host, n in busiest_hosts
+            )
+        )
+
+
+# every outbound request (requests, hrequests, browser renders, firebaseio) waits for a slot
+# from one scheduler, so that a roster full of links to one site doesn't hit it with dozens
+# of requests at once and get throttled (see SCRAPING.HOST_LIMITS in settings.yaml)
+host_scheduler = None
+host_scheduler_lock = threading.Lock()
+
+
+def get_host_scheduler():
+    global host_scheduler
+    with host_scheduler_lock:
+        if not host_scheduler:
+            host_scheduler = HostScheduler(config.settings["SCRAPING"]["HOST_LIMITS"])
+    return host_scheduler
+
+
+def host_slot(url):
+    # `with host_slot(url):` around each request
+    return get_host_scheduler().slot(urllib.parse.urlsplit(url).hostname or "")
+
+
+def host_slot_async(url):
+    # `async with host_slot_async(url):` around each request made from the event loop
+    return get_host_scheduler().slot_async(urllib.parse.urlsplit(url).hostname or "")
+
+
+def log_host_scheduler_stats(log_prefix=""):
+    log_prefix_local = log_prefix + "host scheduler: "
+    if not host_scheduler:
+        return
+
+    scheduler_stats = host_scheduler.get_stats()
+    stats = scheduler_stats["stats"]
+    num_requests = stats.get("requests", 0)
+    num_delayed = stats.get("requests_delayed", 0)
+    logger.info(
+        log_prefix_local
+        + f"{num_requests} requests, {num_delayed} delayed for politeness "
+        + f"(avg {stats.get('wait_s', 0) / num_delayed if num_delayed else 0:.2f} s, max {stats.get('max_wait_s', 0):.2f} s); "
+        + f"at most {stats.get('peak_waiting', 0)} requests queued at once"
+    )
+    if scheduler_stats["most_delayed_hosts"]:
+        logger.info(
+            log_prefix_local
+            + "most delayed hosts: "
+            + ", ".join(
+                f"{host} ({wait_s:.1f} s total, up to {scheduler_stats['peak_waiting_by_host'].get(host, 0)} queued)"
+                for host, wait_s in scheduler_stats["most_delayed_hosts"]
+            )
+        )
+
+
+# conditional GETs (If-None-Match / If-Modified-Since) against an on-disk cache of
+# response bodies, so that re-fetching an unchanged page or og:image costs only a round trip
+http_cache = None
+http_cache_lock = threading.Lock()
+http_cache_stats = collections.Counter()
+
+
+def get_http_cache():
+    global http_cache
+    with http_cache_lock:
+        if not http_cache:
+            http_cache = HttpCache(config.settings["HTTP_CACHE_DIR"])
+    return http_cache
+
+
+def conditional_get(
+    url, headers=None, log_prefix="", max_body_bytes=None, deadline_ts=None, **kwargs
+):
+    # drop-in for session.get(url, ...) that revalidates a cached copy of url; a 304 is
+    # turned back into a 200 response carrying the cached body and headers. With
+    # max_body_bytes or deadline_ts, the body is streamed and the request is given up
+    # once the body gets bigger than that or is still arriving at deadline_ts
+    log_prefix_local = log_prefix + "conditional_get: "
+
+    cache = get_http_cache()
+    cached = cache.get(url)
+
+    request_headers = dict(headers or {})
+    if cached:
+        cached_meta, cached_body = cached
+        if "etag" in cached_meta["headers"]:
+            request_headers["If-None-Match"] = cached_meta["headers"]["etag"]
+        if "last-modified" in cached_meta["headers"]:
+            request_headers["If-Modified-Since"] = cached_meta["headers"][
+                "last-modified"
+            ]
+
+    if max_body_bytes or deadline_ts:
+        kwargs["stream"] = True
+
+    with host_slot(url):
+        response = get_session_for_url(url).get(
+            url, headers=request_headers, **kwargs
+        )
+        if max_body_bytes or deadline_ts:
+            read_body_within_limits(response, max_body_bytes, deadline_ts)
+
+    if response.status_code == 304 and cached:
+        response.status_code = 200
+        response.reason = "OK (cached)"
+        response._content = cached_body
+        response.headers.update(cached_meta["headers"])
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        cache.touch(url)
+        with http_cache_lock:
+            http_cache_stats["revalidated"] += 1
+            http_cache_stats["bytes_saved"] += len(cached_body)
+        logger.info(
+            log_prefix_local
+            + f"not modified; served {len(cached_body)} cached bytes for {url}"
+        )
+        return response
+
+    with http_cache_lock:
+        http_cache_stats["fetched"] += 1
+
+    if response.status_code == 200 and is_cacheable_response(response):
+        try:
+            cache.put(url, response.url, response.headers, response.content)
+            with http_cache_lock:
+                http_cache_stats["stored"] += 1
+        except Exception as exc:
+            exc_name = f"{exc.__class__.__module__}.{exc.__class__.__name__}"
+            logger.info(
+                log_prefix_local + f"failed to cache {url}: {exc_name}: {exc}"
+            )
+    elif cached:
+        # the cached copy can no longer be revalidated
+        cache.delete(url)
+
+    return response
+
+
+def read_body_within_limits(response, max_body_bytes=None, deadline_ts=None):
+    # reads a streamed response's body into response.content. the deadline is checked
+    # between chunks, so a stalled body still takes up to the request's read timeout to
+    # give up on
+    chunks = []
+    num_bytes = 0
+    try:
+        for chunk in response.iter_content(chunk_size=65536):
+            chunks.append(chunk)
+            num_bytes += len(chunk)
+            if max_body_bytes and num_bytes > max_body_bytes:
+                raise ResponseBodyTooLarge(f"body is over {max_body_bytes} bytes")
+            if deadline_ts and time.time() > deadline_ts:
+                raise requests.exceptions.ReadTimeout(
+                    f"body still arriving after the deadline ({num_bytes} bytes read)"
+                )
+    except Exception:
+        response.close()
+        raise
+
+    response._content = b"".join(chunks)
+    response._content_consumed = True
+
+
+def is_cacheable_response(response):
+    if "etag" not in response.headers and "last-modified" not in response.headers:
+        return False
+    if "no-store" in response.headers.get("cache-control", "").lower():
+        return False
+    max_body_bytes = config.settings["HTTP_CACHE"]["MAX_BODY_BYTES"]
+    content_length = response.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > max_body_bytes:
+        return False
+    return len(response.content) <= max_body_bytes
+
+
+def log_http_cache_stats(log_prefix=""):
+    with http_cache_lock:
+        stats = dict(http_cache_stats)
+    logger.info(
+        log_prefix
+        + f"http cache: {stats.get('revalidated', 0)} responses not modified ({stats.get('bytes_saved', 0)} bytes not re-downloaded); "
+        + f"{stats.get('fetched', 0)} fetched in full, {stats.get('stored', 0)} of them cached"
+    )
+
+
+# a browser render costs seconds, while most pages (static blog posts, news articles) already
+# have their og:image and text in the GET body. render only pages that look JS-driven, and
+# keep a per-host history of whether rendering turned up anything the GET body didn't, so
+# that hosts whose renders never help stop being rendered (and vice versa)
+render_history = None
+render_history_lock = threading.Lock()
+render_decision_stats = collections.Counter()
+
+re_og_image_meta_tag = re.compile(r"<meta\b[^>]*og:image", re.IGNORECASE)
+re_non_visible_elements = re.compile(
+    r"<(script|style|noscript|template)\b.*?</\1\s*>", re.IGNORECASE | re.DOTALL
+)
+re_tags = re.compile(r"<[^>]*>")
+re_whitespace = re.compile(r"\s+")
+re_empty_app_root = re.compile(
+    r"<(div|main|app-root)\b[^>]*\bid=[\"']?(root|app|__next|__nuxt|svelte|main-app)\b[^>]*>\s*</\1>",
+    re.IGNORECASE,
+)
+spa_markers = ["data-reactroot", "ng-version=", "<app-root", "<flt-glass-pane"]
+
+
+def get_render_decision_settings():
+    return config.settings["SCRAPING"]["RENDER_DECISION"]
+
+
+def get_render_history():
+    # {host: [renders, useful renders]}; call with render_history_lock held
+    global render_history
+    if render_history is not None:
+        return render_history
+
+    try:
+        with open(
+            config.settings["RENDER_HISTORY_FILE"], mode="r", encoding="utf-8"
+        ) as f:
+            render_history = json.load(f)["hosts"]
+    except (FileNotFoundError, ValueError, KeyError):
+        render_history = {}
+    return render_history
+
+
+def get_visible_text_length(page_source):
+    page_source = re_non_visible_elements.sub(" ", page_source)
+    return len(re_whitespace.sub(" ", re_tags.sub(" ", page_source)).strip())
+
+
+def is_render_needed(url, page_source_via_get, log_prefix=""):
+    log_prefix_local = log_prefix + "is_render_needed: "
+    decision_settings = get_render_decision_settings()
+
+    if not page_source_via_get or page_source_via_get == empty_page_source:
+        should_render, reason = True, "no page source via GET"
+    else:
+        host = urllib.parse.urlsplit(url).hostname or ""
+        with render_history_lock:
+            renders, useful_renders = get_render_history().get(host, [0, 0])
+
+        if renders >= decision_settings["MIN_HISTORY_PER_HOST"]:
+            should_render = (
+                100 * useful_renders / renders >= decision_settings["MIN_USEFUL_PCT"]
+            )
+            reason = f"{useful_renders:.0f} of the last {renders:.0f} renders of {host} were useful"
+        else:
+            should_render, reason = is_page_source_js_driven(page_source_via_get)
+
+        # now and then, render anyway to find out whether the host has changed
+        if not should_render and utils_random.random_real(0, 100) < decision_settings["EXPLORE_PCT"]:
+            should_render, reason = True, reason + " (rendering anyway to check)"
+
+    with render_history_lock:
+        render_decision_stats["rendered" if should_render else "skipped"] += 1
+
+    logger.info(
+        log_prefix_local
+        + f"{'rendering' if should_render else 'not rendering'} {url}: {reason}"
+    )
+    return should_render
+
+
+def is_page_source_js_driven(page_source):
+    # returns (whether to render, why)
+    decision_settings = get_render_decision_settings()
+
+    if re_empty_app_root.search(page_source):
+        return True, "empty app root element"
+    for spa_marker in spa_markers:
+        if spa_marker in page_source:
+            return True, f"found SPA marker {spa_marker}"
+
+    visible_text_length = get_visible_text_length(page_source)
+    if visible_text_length < decision_settings["MIN_VISIBLE_TEXT_CHARS"]:
+        return True, f"only {visible_text_length} characters of visible text"
+
+    has_og_image = bool(re_og_image_meta_tag.search(page_source))
+    text_ratio_pct = 100 * visible_text_length / len(page_source)
+    if not has_og_image and text_ratio_pct < decision_settings["MIN_TEXT_RATIO_PCT"]:
+        return True, f"no og:image and only {text_ratio_pct:.1f}% visible text"
+
+    return False, "page source via GET looks complete"
+
+
+def record_render_result(url, page_source_via_get, page_source_via_render):
+    # a render was useful if it found an og:image or noticeably more text than the GET body
+    if not page_source_via_get or page_source_via_get == empty_page_source:
+        return
+
+    decision_settings = get_render_decision_settings()
+    is_useful = False
+    if page_source_via_render and page_source_via_render != empty_page_source:
+        if re_og_image_meta_tag.search(
+            page_source_via_render
+        ) and not re_og_image_meta_tag.search(page_source_via_get):
+            is_useful = True
+        elif get_visible_text_length(page_source_via_render) > get_visible_text_length(
+            page_source_via_get
+        ) * (1 + decision_settings["USEFUL_TEXT_GAIN_PCT"] / 100):
+            is_useful = True
+
+    host = urllib.parse.urlsplit(url).hostname or ""
+    with render_history_lock:
+        history = get_render_history()
+        renders, useful_renders = history.get(host, [0, 0])
+        renders += 1
+        useful_renders += 1 if is_useful else 0
+
+        # older renders count for less and less, so a host that changes is re-learned
+        if renders > decision_settings["MAX_HISTORY_PER_HOST"]:
+            renders /= 2
+            useful_renders /= 2
+        history[host] = [renders, useful_renders]
+
+        render_decision_stats["useful_renders" if is_useful else "wasted_renders"] += 1
+
+
+def save_render_history(log_prefix=""):
+    log_prefix_local = log_prefix + "save_render_history: "
+    with render_history_lock:
+        if render_history is None:
+            return
+        history_as_dict = {"time_saved": int(time.time()), "hosts": dict(render_history)}
+
+    # write to a temp file and rename, so an interrupted run can't leave a partial history
+    history_dir = os.path.dirname(config.settings["RENDER_HISTORY_FILE"])
+    fd, temp_path = tempfile.mkstemp(dir=history_dir, suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode="w", encoding="utf-8") as f:
+            json.dump(history_as_dict, f)
+        os.replace(temp_path, config.settings["RENDER_HISTORY_FILE"])
+    except Exception as exc:
+        utils_file.delete_file(temp_path)
+        logger.error(log_prefix_local + f"failed to save render history: {str(exc)}")
+
+
+def log_render_decision_stats(log_prefix=""):
+    with render_history_lock:
+        stats = dict(render_decision_stats)
+        num_hosts_not_rendered = sum(
+            1
+            for renders, useful_renders in (render_history or {}).values()
+            if renders >= get_render_decision_settings()["MIN_HISTORY_PER_HOST"]
+            and 100 * useful_renders / renders
+            < get_render_decision_settings()["MIN_USEFUL_PCT"]
+        )
+    logger.info(
+        log_prefix
+        + f"render decisions: {stats.get('rendered', 0)} pages rendered ({stats.get('useful_renders', 0)} usefully, "
+        + f"{stats.get('wasted_renders', 0)} not), {stats.get('skipped', 0)} renders skipped; "
+        + f"{num_hosts_not_rendered} hosts learned not to need rendering"
+    )
+
+
+# outbound urls that failed recently, so that a dead link costs one failed fetch instead of
+# the whole requests + hrequests sequence every time its story is acquired. an entry expires
+# after a TTL that depends on the kind of failure (see SCRAPING.NEGATIVE_CACHE). separately,
+# within a run (and only then), a host that fails CIRCUIT_BREAKER_FAILURES times in a row
+# isn't contacted again
+negative_cache = None
+negative_cache_lock = threading.Lock()
+negative_cache_stats = collections.Counter()
+consecutive_failures_by_host = collections.Counter()
+hosts_with_open_circuit = {}
+last_failure_class_by_url = {}
+
+# failures that say more about the host than about the url
+HOST_LEVEL_FAILURE_CLASSES = {"connection", "dns", "http_429", "timeout", "tls"}
+
+dns_failure_msgs = [
+    "ERR_NAME_NOT_RESOLVED",
+    "Name or service not known",
+    "No address associated with hostname",
+    "Temporary failure in name resolution",
+    "getaddrinfo failed",
+    "no such host",
+]
+tls_failure_msgs = ["ERR_CERT_", "ERR_SSL_", "SSL:", "tls:", "x509:"]
+timeout_failure_msgs = ["Timeout", "deadline exceeded", "i/o timeout", "timed out"]
+
+
+def get_negative_cache_settings():
+    return config.settings["SCRAPING"]["NEGATIVE_CACHE"]
+
+
+def get_negative_cache():
+    # {"url:<url>": [failure class, expiry in epoch seconds]};
+    # call with negative_cache_lock held
+    global negative_cache
+    if negative_cache is not None:
+        return negative_cache
+
+    try:
+        with open(
+            config.settings["NEGATIVE_CACHE_FILE"], mode="r", encoding="utf-8"
+        ) as f:
+            entries = json.load(f)["entries"]
+    except (FileNotFoundError, ValueError, KeyError):
+        entries = {}
+
+    now = time.time()
+    negative_cache = {
+        k: v for k, v in entries.items() if k.startswith("url:") and v[1] > now
+    }
+    return negative_cache
+
+
+def get_failure_class(exc):
+    # what kind of fetch failure exc is, or None if it isn't one (e.g., a parser error)
+    exc_msg = str(exc)
+
+    if isinstance(exc, requests.exceptions.SSLError) or any(
+        x in exc_msg for x in tls_failure_msgs
+    ):
+        return "tls"
+    if any(x in exc_msg for x in dns_failure_msgs):
+        return "dns"
+    if isinstance(
+        exc,
+        (requests.exceptions.Timeout, hrequests.exceptions.BrowserTimeoutException),
+    ) or any(x in exc_msg for x in timeout_failure_msgs):
+        return "timeout"
+    if isinstance(
+        exc,
+        (
+            requests.exceptions.InvalidSchema,
+            requests.exceptions.InvalidURL,
+            requests.exceptions.MissingSchema,
+        ),
+    ):
+        return "invalid_url"
+    if isinstance(
+        exc,
+        (
+            requests.exceptions.ConnectionError,
+            requests.exceptions.TooManyRedirects,
+            hrequests.exceptions.ClientException,
+        ),
+    ):
+        return "connection"
+    return None
+
+
+def get_failure_class_for_status_code(status_code):
+    if status_code and status_code >= 400:
+        return f"http_{status_code}"
+    return None
+
+
+def get_negative_cache_ttl_s(failure_class):
+    # e.g., http_404 has its own TTL, while http_418 falls back on the one for http_4xx
+    ttl_minutes = get_negative_cache_settings()["TTL_MINUTES"]
+    for key in [failure_class, failure_class[:6] + "xx", "other"]:
+        if key in ttl_minutes:
+            return 60 * ttl_minutes[key]
+
+
+def get_known_failure(url):
+    # (failure class, when to try url again in epoch seconds) if url failed recently or its
+    # host's circuit is open, else None
+    host = urllib.parse.urlsplit(url).hostname or ""
+    now = time.time()
+    with negative_cache_lock:
+        known_failure = None
+        if host in hosts_with_open_circuit:
+            # tried again in the next run
+            known_failure = (hosts_with_open_circuit[host], int(now))
+        else:
+            entry = get_negative_cache().get(f"url:{url}")
+            if entry and entry[1] > now:
+                known_failure = (entry[0], entry[1])
+        if known_failure:
+            negative_cache_stats["fetches_skipped"] += 1
+    return known_failure
+
+
+def get_known_host_failure(url):
+    # the failure class that opened the circuit of url's host in this run, if it's open;
+    # for fetches (e.g., of og:images) that don't record their failures per url
+    host = urllib.parse.urlsplit(url).hostname or ""
+    with negative_cache_lock:
+        failure_class = hosts_with_open_circuit.get(host)
+        if failure_class:
+            negative_cache_stats["fetches_skipped"] += 1
+    return failure_class
+
+
+def note_fetch_failure(url, failure_class, log_prefix=""):
+    if not failure_class:
+        return
+
+    host = urllib.parse.urlsplit(url).hostname or ""
+    with negative_cache_lock:
+        last_failure_class_by_url[url] = failure_class
+        if failure_class not in HOST_LEVEL_FAILURE_CLASSES:
+            return
+
+        consecutive_failures_by_host[host] += 1
+        num_failures = consecutive_failures_by_host[host]
+        if (
+            num_failures < get_negative_cache_settings()["CIRCUIT_BREAKER_FAILURES"]
+            or host in hosts_with_open_circuit
+        ):
+            return
+
+        hosts_with_open_circuit[host] = failure_class
+        negative_cache_stats["circuits_opened"] += 1
+
+    logger.info(
+        log_prefix
+        + f"not contacting {host} again in this run after {num_failures} failures in a row (last one {failure_class})"
+    )
+
+
+def note_fetch_success(url):
+    host = urllib.parse.urlsplit(url).hostname or ""
+    with negative_cache_lock:
+        consecutive_failures_by_host.pop(host, None)
+        last_failure_class_by_url.pop(url, None)
+
+
+def remember_failed_url(url, log_prefix=""):
+    # called once every way of fetching url has failed; returns when to try url again, in
+    # epoch seconds
+    with negative_cache_lock:
+        failure_class = last_failure_class_by_url.get(url) or "other"
+        ttl_s = get_negative_cache_ttl_s(failure_class)
+        retry_after_ts = int(time.time() + ttl_s)
+        get_negative_cache()[f"url:{url}"] = [failure_class, retry_after_ts]
+        negative_cache_stats["urls_remembered"] += 1
+
+    logger.info(
+        log_prefix
+        + f"not fetching {url} again for {ttl_s // 60} minutes ({failure_class})"
+    )
+    return retry_after_ts
+
+
+def save_negative_cache(log_prefix=""):
+    log_prefix_local = log_prefix + "save_negative_cache: "
+    now = time.time()
+    with negative_cache_lock:
+        if negative_cache is None:
+            return
+        negative_cache_as_dict = {
+            "time_saved": int(now),
+            "entries": {k: v for k, v in negative_cache.items() if v[1] > now},
+        }
+
+    # write to a temp file and rename, so an interrupted run can't leave a partial cache
+    negative_cache_dir = os.path.dirname(config.settings["NEGATIVE_CACHE_FILE"])
+    fd, temp_path = tempfile.mkstemp(dir=negative_cache_dir, suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode="w", encoding="utf-8") as f:
+            json.dump(negative_cache_as_dict, f)
+        os.replace(temp_path, config.settings["NEGATIVE_CACHE_FILE"])
+    except Exception as exc:
+        utils_file.delete_file(temp_path)
+        logger.error(log_prefix_local + f"failed to save negative cache: {str(exc)}")
+
+
+def log_negative_cache_stats(log_prefix=""):
+    with negative_cache_lock:
+        stats = dict(negative_cache_stats)
+        num_entries = len(negative_cache or {})
+        open_circuits = sorted(hosts_with_open_circuit.items())
+    logger.info(
+        log_prefix
+        + f"negative cache: {stats.get('fetches_skipped', 0)} fetches of recently failed urls or hosts skipped, "
+        + f"{stats.get('urls_remembered', 0)} failed urls remembered, {num_entries} entries; "
+        + f"{stats.get('circuits_opened', 0)} hosts not contacted for the rest of the run after repeated failures"
+        + (
+            ": " + ", ".join(f"{host} ({failure_class})" for host, failure_class in open_circuits)
+            if open_circuits
+            else ""
+        )
+    )
+
 
 def endpoint_query_via_requests(url=None, retries=3, delay=8, log_prefix=""):
     log_prefix_local = log_prefix + "endpoint_query_via_requests: "
@@ -42,12 +751,13 @@ def endpoint_query_via_requests(url=None, retries=3, delay=8, log_prefix=""):
         raise FailedAfterRetrying()
 
     try:
-        response = requests.get(
-            url,
-            headers={"User-Agent": config.settings["SCRAPING"]["UA_STR"]},
-            timeout=config.settings["SCRAPING"]["REQUESTS_GET_TIMEOUT_S"],
-            verify=False,
-        )
+        with host_slot(url):
+            response = get_session_for_url(url).get(
+                url,
+                headers={"User-Agent": config.settings["SCRAPING"]["UA_STR"]},
+                timeout=config.settings["SCRAPING"]["REQUESTS_GET_TIMEOUT_S"],
+                verify=False,
+            )
         response.raise_for_status()
         resp_as_dict = response.json()
         # logger.info(log_prefix + f"successfully queried endpoint {url}")
@@ -96,6 +806,60 @@ def firebaseio_endpoint_query(query=None, log_prefix=""):
         raise
 
 
+async def firebaseio_bulk_query_async(item_ids=None, log_prefix=""):
+    # queries /v0/item/{id}.json for all item_ids concurrently over one pooled HTTP/2 client
+    # returns {item_id: response as dict, or None if the query failed}
+    log_prefix_local = log_prefix + "firebaseio_bulk_query_async: "
+
+    results = {}
+    if not item_ids:
+        return results
+
+    max_concurrent_queries = config.settings["SCRAPING"][
+        "FIREBASEIO_MAX_CONCURRENT_QUERIES"
+    ]
+    semaphore = asyncio.Semaphore(max_concurrent_queries)
+
+    async def query_one_item(client, item_id):
+        query = f"/v0/item/{item_id}.json"
+        async with semaphore, host_slot_async(str(client.base_url)):
+            try:
+                response = await client.get(query)
+                response.raise_for_status()
+                results[item_id] = response.json()
+            except Exception as exc:
+                exc_name = f"{exc.__class__.__module__}.{exc.__class__.__name__}"
+                logger.info(
+                    log_prefix_local + f"query {query} failed: {exc_name}: {exc}"
+                )
+                results[item_id] = None
+
+    start_ts = time.time()
+
+    async with httpx.AsyncClient(
+        base_url="https://hacker-news.firebaseio.com",
+        headers={"User-Agent": config.settings["SCRAPING"]["UA_STR"]},
+        http2=True,
+        limits=httpx.Limits(
+            max_connections=max_concurrent_queries,
+            max_keepalive_connections=max_concurrent_queries,
+        ),
+        timeout=config.settings["SCRAPING"]["REQUESTS_GET_TIMEOUT_S"],
+        verify=False,
+    ) as client:
+        await asyncio.gather(
+            *[query_one_item(client, item_id) for item_id in item_ids]
+        )
+
+    num_failed = sum(1 for x in results.values() if not x)
+    logger.info(
+        log_prefix_local
+        + f"queried {len(item_ids)} items in {time.time() - start_ts:.2f} seconds; {num_failed} failed"
+    )
+
+    return results
+
+
 def get_content_type_via_head_request(url: str = None, log_prefix=""):
     log_prefix_local = log_prefix + "get_content_type_via_head_request: "
     if not url:
@@ -321,25 +1085,29 @@ def get_page_source_via_hrequests(
                 context={"url": url},
             )
 
-        # try to get page source via render()
-        try:
-            with response.render(headless=True, mock_human=True) as page:
-                time.sleep(utils_random.random_real(0, 1))
-                page.goto(url)
-                time.sleep(utils_random.random_real(6, 10))
-
-                page_source_via_render = (
-                    page.html.find("html").html
-                    if (page.html and page.html.find("html"))
-                    else ""
+        # try to get page source via render(), if the page looks like it needs it
+        if is_render_needed(url, page_source_via_get, log_prefix=log_prefix):
+            try:
+                with host_slot(url), utils_browser.render(
+                    response, browser=browser
+                ) as page:
+                    page.goto(url)
+                    utils_browser.wait_for_page_to_settle(page)
+
+                    page_source_via_render = (
+                        page.html.find("html").html
+                        if (page.html and page.html.find("html"))
+                        else ""
+                    )
+
+            except Exception as exc:
+                handle_exception(
+                    exc=exc,
+                    log_prefix=log_prefix + "gps_via_hr(): render: ",
+                    context={"url": url},
                 )
 
-        except Exception as exc:
-            handle_exception(
-                exc=exc,
-                log_prefix=log_prefix + "gps_via_hr(): render: ",
-                context={"url": url},
-            )
+            record_render_result(url, page_source_via_get, page_source_via_render)
 
     if page_source_via_get:
         if page_source_via_get == empty_page_source:
@@ -415,25 +1183,29 @@ def get_page_source_via_hrequests_via_proxy(
                 context={"url": url},
             )
 
-        # try to get page source via render()
-        try:
-            with response.render(headless=True, mock_human=True) as page:
-                time.sleep(utils_random.random_real(0, 1))
-                page.goto(url)
-                time.sleep(utils_random.random_real(6, 10))
-
-                page_source_via_render = (
-                    page.html.find("html").html
-                    if (page.html and page.html.find("html"))
-                    else ""
+        # try to get page source via render(), if the page looks like it needs it
+        if is_render_needed(url, page_source_via_get, log_prefix=log_prefix):
+            try:
+                with host_slot(url), utils_browser.render(
+                    response, browser=browser
+                ) as page:
+                    page.goto(url)
+                    utils_browser.wait_for_page_to_settle(page)
+
+                    page_source_via_render = (
+                        page.html.find("html").html
+                        if (page.html and page.html.find("html"))
+                        else ""
+                    )
+
+            except Exception as exc:
+                handle_exception(
+                    exc=exc,
+                    log_prefix=log_prefix + "gps_via_hr_via_proxy(): render: ",
+                    context={"url": url},
                 )
 
-        except Exception as exc:
-            handle_exception(
-                exc=exc,
-                log_prefix=log_prefix + "gps_via_hr_via_proxy(): render: ",
-                context={"url": url},
-            )
+            record_render_result(url, page_source_via_get, page_source_via_render)
 
     if page_source_via_get:
         if page_source_via_get == empty_page_source:
@@ -563,6 +1335,9 @@ def get_response_object_via_hrequests(
 
     log_prefix_local = log_prefix + "gro_via_hr: "
 
+    if get_known_host_failure(url):
+        return None
+
     with hrequests.Session(
         browser=browser,
         os=os.getenv("CUR_OS", default="lin"),
@@ -582,27 +1357,35 @@ def get_response_object_via_hrequests(
                 if "SCRAPING" in config.settings
                 else 30
             )
-            response = session.get(
-                allow_redirects=True,
-                headers={"Accept": "text/html,*/*"},
-                timeout=timeout,
-                url=url,
-            )
+            with host_slot(url):
+                response = session.get(
+                    allow_redirects=True,
+                    headers={"Accept": "text/html,*/*"},
+                    timeout=timeout,
+                    url=url,
+                )
             if response and response.status_code == 200:
+                note_fetch_success(url)
                 return response
             else:
                 logger.info(
                     log_prefix_local
                     + f"Failed to get response object. {response.status_code=}. {url=}"
                 )
+                note_fetch_failure(
+                    url,
+                    get_failure_class_for_status_code(response.status_code),
+                    log_prefix=log_prefix_local,
+                )
                 return None
 
         except Exception as exc:
-            handle_exception(
+            failure_class = handle_exception(
                 exc=exc,
                 log_prefix=log_prefix_local,
                 context={"url": url},
             )
+            note_fetch_failure(url, failure_class, log_prefix=log_prefix_local)
 
     return None
 
@@ -641,12 +1424,13 @@ def get_response_object_via_hrequests_via_proxy(
                 if "SCRAPING" in config.settings
                 else 30
             )
-            response = session.get(
-                allow_redirects=True,
-                headers={"Accept": "text/html,*/*"},
-                timeout=timeout,
-                url=url,
-            )
+            with host_slot(url):
+                response = session.get(
+                    allow_redirects=True,
+                    headers={"Accept": "text/html,*/*"},
+                    timeout=timeout,
+                    url=url,
+                )
             if response and response.status_code == 200:
                 logger.info(
                     log_prefix_local
@@ -676,53 +1460,218 @@ def get_response_object_via_hrequests_via_proxy(
 def get_response_object_via_requests(
     url=None,
     log_prefix="",
+    max_body_bytes=None,
+    deadline_s=None,
 ):
+    # see conditional_get() for max_body_bytes; deadline_s counts from now
     if not url:
         return None
 
     log_prefix_local = log_prefix + "gro_via_r:  "
 
-    with requests.Session() as session:
-        user_agent = (
-            config.settings["SCRAPING"]["UA_STR"]
+    if get_known_host_failure(url):
+        return None
+
+    user_agent = (
+        config.settings["SCRAPING"]["UA_STR"]
+        if "SCRAPING" in config.settings
+        else "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36"
+    )
+    try:
+        timeout = (
+            config.settings["SCRAPING"]["REQUESTS_GET_TIMEOUT_S"]
             if "SCRAPING" in config.settings
-            else "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36"
+            else 30
         )
-        session.headers.update({"User-Agent": user_agent})
-        try:
-            timeout = (
-                config.settings["SCRAPING"]["REQUESTS_GET_TIMEOUT_S"]
-                if "SCRAPING" in config.settings
-                else 30
-            )
-            with session.get(
-                allow_redirects=True,
-                headers={"Accept": "text/html,*/*"},
-                stream=False,
-                timeout=timeout,
-                url=url,
-                verify=False,
-                # proxies=secrets_file.proxies_for_requests,
-            ) as response:
-                if response and response.status_code == 200:
-                    return response
-                else:
-                    logger.info(
-                        log_prefix_local
-                        + f"Failed to get response object. {response.status_code=}. {url=}"
-                    )
-                    return None
+        with conditional_get(
+            allow_redirects=True,
+            deadline_ts=time.time() + deadline_s if deadline_s else None,
+            headers={"Accept": "text/html,*/*", "User-Agent": user_agent},
+            log_prefix=log_prefix_local,
+            max_body_bytes=max_body_bytes,
+            stream=False,
+            timeout=timeout,
+            url=url,
+            verify=False,
+            # proxies=secrets_file.proxies_for_requests,
+        ) as response:
+            if response and response.status_code == 200:
+                note_fetch_success(url)
+                return response
+            else:
+                logger.info(
+                    log_prefix_local
+                    + f"Failed to get response object. {response.status_code=}. {url=}"
+                )
+                note_fetch_failure(
+                    url,
+                    get_failure_class_for_status_code(response.status_code),
+                    log_prefix=log_prefix_local,
+                )
+                return None
 
-        except Exception as exc:
-            handle_exception(
-                exc=exc,
-                log_prefix=log_prefix_local,
-                context={"url": url},
-            )
+    except ResponseBodyTooLarge as exc:
+        # not the url's fault, so not noted as a failure
+        logger.info(log_prefix_local + f"gave up on {url}: {exc}")
+
+    except Exception as exc:
+        failure_class = handle_exception(
+            exc=exc,
+            log_prefix=log_prefix_local,
+            context={"url": url},
+        )
+        note_fetch_failure(url, failure_class, log_prefix=log_prefix_local)
 
     return None
 
 
+# the two fetchers for a story's url run side by side; threads can't be cancelled, so
+# a loser that is still running finishes in the background and is ignored. To keep such
+# abandoned fetches from holding on to the executor's threads, the fetch via requests is
+# cut off at the race's deadline and at FETCH_RACE.MAX_BODY_BYTES, and the one via
+# hrequests has a timeout that covers its whole request
+fetch_race_executor = None
+fetch_race_executor_lock = threading.Lock()
+
+textual_content_types = [
+    "application/atom+xml",
+    "application/json",
+    "application/rss+xml",
+    "application/xhtml+xml",
+    "application/xml",
+]
+
+
+def get_fetch_race_executor():
+    global fetch_race_executor
+    with fetch_race_executor_lock:
+        if not fetch_race_executor:
+            fetch_race_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=2 * config.max_workers,
+                thread_name_prefix="fetch_race",
+            )
+    return fetch_race_executor
+
+
+def is_textual_response(response):
+    content_type = (response.headers.get("Content-Type") or "").split(";")[0]
+    content_type = content_type.strip().lower()
+    return content_type.startswith("text/") or content_type in textual_content_types
+
+
+def get_response_objects_via_race(url=None, log_prefix=""):
+    # runs get_response_object_via_requests and get_response_object_via_hrequests
+    # concurrently under one deadline; returns ({fetcher name: response object}, whether
+    # the deadline ran out before every fetcher was done)
+    #
+    # - a response via requests is accepted as soon as it arrives
+    # - a response via hrequests is accepted right away only if it's textual, since
+    #   hrequests sometimes handles binary files as utf-8 strings
+    # - for binary content, the other fetcher gets a short grace period so that its
+    #   content-type is available for the disagreement checks in asdfft2
+    # - the deadline starts once a fetcher is running, so time spent queued behind other
+    #   races doesn't count against it, though the race gives up (as timed out) if no
+    #   fetcher has started within a deadline either
+    log_prefix_local = log_prefix + "race: "
+
+    fetch_race_settings = config.settings["SCRAPING"]["FETCH_RACE"]
+    fetchers = {
+        "get_response_object_via_requests": functools.partial(
+            get_response_object_via_requests,
+            url=url,
+            log_prefix=log_prefix,
+            max_body_bytes=fetch_race_settings["MAX_BODY_BYTES"],
+            deadline_s=fetch_race_settings["DEADLINE_S"],
+        ),
+        "get_response_object_via_hrequests": functools.partial(
+            get_response_object_via_hrequests, url=url, log_prefix=log_prefix
+        ),
+    }
+
+    fetch_started = threading.Event()
+
+    def run_fetcher(fetcher):
+        fetch_started.set()
+        return fetcher()
+
+    executor = get_fetch_race_executor()
+    futures = {
+        executor.submit(run_fetcher, fetcher): fetcher_name
+        for fetcher_name, fetcher in fetchers.items()
+    }
+
+    if not fetch_started.wait(timeout=fetch_race_settings["DEADLINE_S"]):
+        for future in futures:
+            future.cancel()
+        logger.info(
+            log_prefix_local
+            + f"gave up after {fetch_race_settings['DEADLINE_S']} seconds waiting for the other races to free up a fetcher"
+        )
+        return {}, True
+
+    start_ts = time.time()
+    deadline_ts = start_ts + fetch_race_settings["DEADLINE_S"]
+
+    response_objects = {}
+    pending = set(futures)
+    winner = None
+
+    while pending and not winner:
+        done, pending = concurrent.futures.wait(
+            pending,
+            timeout=max(0, deadline_ts - time.time()),
+            return_when=concurrent.futures.FIRST_COMPLETED,
+        )
+        if not done:
+            break
+
+        for future in done:
+            try:
+                response = future.result()
+            except Exception as exc:
+                handle_exception(
+                    exc=exc, log_prefix=log_prefix_local, context={"url": url}
+                )
+                response = None
+            if not response:
+                continue
+
+            fetcher_name = futures[future]
+            response_objects[fetcher_name] = response
+            if fetcher_name == "get_response_object_via_requests":
+                winner = fetcher_name
+            elif is_textual_response(response):
+                winner = fetcher_name
+
+    if winner and pending and not is_textual_response(response_objects[winner]):
+        grace_deadline_ts = min(
+            deadline_ts,
+            time.time() + fetch_race_settings["GRACE_FOR_SECOND_OPINION_S"],
+        )
+        done, pending = concurrent.futures.wait(
+            pending, timeout=max(0, grace_deadline_ts - time.time())
+        )
+        for future in done:
+            try:
+                response = future.result()
+            except Exception:
+                response = None
+            if response:
+                response_objects[futures[future]] = response
+
+    for future in pending:
+        future.cancel()
+
+    logger.info(
+        log_prefix_local
+        + f"got {sorted(response_objects)} in {time.time() - start_ts:.2f} seconds"
+        + (f"; winner {winner}" if winner else "")
+        + (f"; abandoned {sorted(futures[x] for x in pending)}" if pending else "")
+    )
+
+    return response_objects, bool(pending) and not winner
+
+
 browser_exception_msg_prefixes = [
     "Browser was closed. Attribute call failed: close",
     "Cookie should have a valid expires, only -1 or a positive number for the unix timestamp in seconds is allowed",
@@ -766,6 +1715,7 @@ for _ in hrequests_exceptions_suffixes:
 
 
 def handle_exception(exc: Exception = None, log_prefix="", context=None):
+    # returns the failure class of exc (see get_failure_class())
     # handle exceptions for:
     # - get_page_source_via_hrequests
     # - get_page_source_via_response_object
@@ -987,6 +1937,8 @@ def handle_exception(exc: Exception = None, log_prefix="", context=None):
             tb_str = traceback.format_exc()
         logger.error(log_prefix_local + tb_str)
 
+    return get_failure_class(exc)
+
 
 def head_request(url=None, log_prefix=""):
     log_prefix += "head_request: "
@@ -994,28 +1946,39 @@ def head_request(url=None, log_prefix=""):
         # logger.error(log_prefix + "no URL provided")
         raise Exception("no URL provided")
 
+    if get_known_host_failure(url):
+        return None
+
     try:
-        response = requests.head(
-            url,
-            headers={"User-Agent": config.settings["SCRAPING"]["UA_STR"]},
-            timeout=config.settings["SCRAPING"]["REQUESTS_GET_TIMEOUT_S"],
-            verify=False,
-        )
+        with host_slot(url):
+            response = get_session_for_url(url).head(
+                url,
+                headers={"User-Agent": config.settings["SCRAPING"]["UA_STR"]},
+                timeout=config.settings["SCRAPING"]["REQUESTS_GET_TIMEOUT_S"],
+                verify=False,
+            )
+        note_fetch_success(url)
         return response.headers
 
     except Exception as exc:
-        handle_exception(
+        failure_class = handle_exception(
             exc=exc,
             log_prefix=log_prefix,
             context={"url": url},
         )
+        note_fetch_failure(url, failure_class, log_prefix=log_prefix)
         return None
 
 
 def download_file_via_requests(url, dest_local_file, log_prefix="") -> bool:
     log_prefix_local = log_prefix + "download_file_via_requests: "
+
+    if get_known_host_failure(url):
+        return False
+
     try:
-        with requests.get(
+        # the slot is held until the body is downloaded
+        with host_slot(url), get_session_for_url(url).get(
             allow_redirects=True,
             headers={"User-Agent": config.settings["SCRAPING"]["UA_STR"]},
             stream=True,
@@ -1027,19 +1990,26 @@ def download_file_via_requests(url, dest_local_file, log_prefix="") -> bool:
                 with open(dest_local_file, "wb") as f:
                     for chunk in response.iter_content(chunk_size=8192):
                         f.write(chunk)
+                note_fetch_success(url)
                 return True
             else:
                 logger.info(
                     log_prefix_local
                     + f"Error: status code {response.status_code} for url {url}"
                 )
+                note_fetch_failure(
+                    url,
+                    get_failure_class_for_status_code(response.status_code),
+                    log_prefix=log_prefix_local,
+                )
                 return False
     except Exception as exc:
-        handle_exception(
+        failure_class = handle_exception(
             exc=exc,
             log_prefix=log_prefix,
             context={"url": url},
         )
+        note_fetch_failure(url, failure_class, log_prefix=log_prefix_local)
         return False
 
 
@@ -1051,6 +2021,8 @@ def download_file_via_hrequests(url, dest_local_file, log_prefix="") -> bool:
         url=url,
         log_prefix=log_prefix_local,
     )
+    if not response:
+        return False
 
     if isinstance(response.content, bytes):
         content_to_use = response.content
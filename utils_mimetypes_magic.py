@@ -6,15 +6,19 @@ import os
 import re
 import subprocess
 import sys
+import threading
 import traceback
-from collections import Counter, defaultdict
-from typing import List
+import xml.parsers.expat
+from collections import Counter, OrderedDict, defaultdict
+from typing import Dict, List
 from urllib.parse import unquote, urlparse
 
 import magic
 from bs4 import BeautifulSoup
 from intervaltree import IntervalTree
 
+import utils_delegates
+import utils_hash
 from Attribute import AttributeWithKey
 from MarkupTag import MarkupTag
 from Trie import Trie
@@ -536,10 +540,87 @@ tag_based_markup_languages = [
 ]
 
 
+# C0 control bytes that don't occur in text files (tab, newline, vertical tab,
+# form feed, carriage return, and escape are allowed)
+binary_control_bytes = bytes(
+    x for x in range(32) if x not in (0x09, 0x0A, 0x0B, 0x0C, 0x0D, 0x1B)
+)
+
+
+def is_probably_binary_content(content_head: bytes) -> bool:
+    # cheap in-memory check of the first few KB of a response, so that obviously binary
+    # content (PDFs, images, videos, archives) can skip the file-based textual checks
+    if not content_head:
+        return False
+
+    if b"\x00" in content_head:
+        return True
+
+    try:
+        # a multibyte character may be cut off at the end of the head
+        content_head.decode("utf-8")
+        return False
+    except UnicodeDecodeError as exc:
+        if exc.reason == "unexpected end of data":
+            return False
+
+    return len(content_head.translate(None, binary_control_bytes)) < len(content_head)
+
+
 def check_for_valid_text_encodings(local_file: str, log_prefix="") -> List[str]:
+    # in-process equivalent of check_for_valid_text_encodings_via_iconv(); returns the
+    # same list of encodings (of ASCII, ISO-8859-1, UTF-8, WINDOWS-1251) that the
+    # file's bytes are valid in
+    log_prefix_local = log_prefix + "check_for_valid_text_encodings: "
+
+    try:
+        with open(local_file, mode="rb") as file:
+            data = file.read()
+    except Exception as exc:
+        short_exc_name = exc.__class__.__name__
+        exc_name = exc.__class__.__module__ + "." + short_exc_name
+        exc_msg = str(exc)
+        exc_slug = f"{exc_name}: {exc_msg}"
+        logger.error(log_prefix_local + "unexpected exception: " + exc_slug)
+        return []
+
+    return get_valid_text_encodings_of_bytes(data)
+
+
+def get_valid_text_encodings_of_bytes(data: bytes) -> List[str]:
+    # each check is a single scan done in C, and the UTF-8 decode is skipped for pure ASCII
+    valid_encodings = []
+
+    is_ascii = data.isascii()
+    if is_ascii:
+        valid_encodings.append("ASCII")
+
+    # every byte value is a valid ISO-8859-1 character
+    valid_encodings.append("ISO-8859-1")
+
+    if is_ascii:
+        valid_encodings.append("UTF-8")
+    else:
+        try:
+            str(memoryview(data), "utf-8")
+            valid_encodings.append("UTF-8")
+        except UnicodeDecodeError:
+            pass
+
+    # 0x98 is the only byte value undefined in WINDOWS-1251
+    if b"\x98" not in data:
+        valid_encodings.append("WINDOWS-1251")
+
+    return valid_encodings
+
+
+def check_for_valid_text_encodings_via_iconv(
+    local_file: str, log_prefix=""
+) -> List[str]:
     # requires iconv (i.e., libiconv) command
+    # superseded by check_for_valid_text_encodings(); kept for bench-text-encodings.py
 
-    log_prefix_local = log_prefix + "check_for_valid_text_encodings: "
+    log_prefix_local = log_prefix + "check_for_valid_text_encodings_via_iconv: "
     valid_encodings = []
 
     text_encodings = [
@@ -602,24 +683,16 @@ def check_for_valid_text_encodings(local_file: str, log_prefix="") -> List[str]:
 
 
 def is_wellformed_xml_func(local_file: str, log_prefix="") -> bool:
-    # requires Linux xmlwf command
+    # in-process expat, the same parser that the xmlwf command wraps
     log_prefix_local = log_prefix + "is_wellformed_xml_func: "
 
-    cmd = f"xmlwf -c {local_file}"
-
     try:
-        result = subprocess.run(
-            cmd,
-            check=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            shell=True,
-        )
-        if result.returncode == 0:
-            return True
+        with open(local_file, mode="rb") as file:
+            data = file.read()
+        xml.parsers.expat.ParserCreate().Parse(data, True)
+        return True
 
-    except subprocess.CalledProcessError:
+    except xml.parsers.expat.ExpatError:
         pass
 
     except Exception as exc:
@@ -943,28 +1016,114 @@ def is_a_binary_mimetype(mimetype: str) -> bool:
 #         return None
 
 
+generic_binary_mimetypes = set(
+    [
+        "application/octet-stream",
+        "application/data",
+        "application/binary",
+        "binary/octet",
+    ]
+)
+
+# results of the magic checks, keyed by SHA1 of the bytes checked, since the same
+# file (e.g., a popular PDF) is often linked from several stories
+mimetype_cache = OrderedDict()
+mimetype_cache_lock = threading.Lock()
+MIMETYPE_CACHE_MAX_ENTRIES = 4096
+
+
+def get_mimetypes_via_magic(
+    content_head: bytes,
+    local_file: str,
+    srct=None,
+    content_types_guessed_from_uri_extension=None,
+    log_prefix="",
+) -> Dict[str, str]:
+    # returns {"python_magic": mimetype, ...} for the checks that were run
+    #
+    # libmagic runs in-process on content_head; the `file` command and exiftool run
+    # (against content_head spilled to local_file) only if libmagic's result is generic
+    # or disagrees with the server-reported content type or the url's extension
+    log_prefix_local = log_prefix + "get_mimetypes_via_magic: "
+
+    content_sha1 = utils_hash.get_sha1_of_bytes(content_head)
+    with mimetype_cache_lock:
+        results = dict(mimetype_cache.get(content_sha1, {}))
+
+    if "python_magic" not in results:
+        results["python_magic"] = get_mimetype_via_python_magic_from_buffer(
+            content_head, log_prefix=log_prefix
+        )
+
+    if magic_signals_agree(
+        results["python_magic"], srct, content_types_guessed_from_uri_extension
+    ):
+        logger.info(
+            log_prefix_local
+            + f"libmagic's {results['python_magic']} agrees with {srct=} and extension; not escalating"
+        )
+        results_to_return = {"python_magic": results["python_magic"]}
+
+    else:
+        logger.info(
+            log_prefix_local
+            + f"libmagic's {results['python_magic']} disagrees with {srct=} or {content_types_guessed_from_uri_extension=}; escalating"
+        )
+        if "file_command" not in results or "exiftool" not in results:
+            if not os.path.exists(local_file):
+                with open(local_file, "wb") as fout:
+                    fout.write(content_head)
+
+        if "file_command" not in results:
+            results["file_command"] = get_mimetype_via_file_command(
+                local_file=local_file, log_prefix=log_prefix
+            )
+        if "exiftool" not in results:
+            results["exiftool"] = get_mimetype_via_exiftool2(
+                local_file=local_file, log_prefix=log_prefix
+            )
+        results_to_return = results
+
+    with mimetype_cache_lock:
+        mimetype_cache[content_sha1] = results
+        mimetype_cache.move_to_end(content_sha1)
+        while len(mimetype_cache) > MIMETYPE_CACHE_MAX_ENTRIES:
+            mimetype_cache.popitem(last=False)
+
+    return results_to_return
+
+
+def magic_signals_agree(
+    mimetype_via_python_magic, srct, content_types_guessed_from_uri_extension
+) -> bool:
+    if (
+        not mimetype_via_python_magic
+        or mimetype_via_python_magic in generic_binary_mimetypes
+    ):
+        return False
+
+    if srct and srct not in generic_binary_mimetypes:
+        return srct == mimetype_via_python_magic
+
+    if content_types_guessed_from_uri_extension:
+        return mimetype_via_python_magic in content_types_guessed_from_uri_extension
+
+    return True
+
+
 def get_mimetype_via_exiftool2(local_file: str, log_prefix="") -> str:
     log_prefix_local = log_prefix + "get_mimetype_via_exiftool2: "
-    mimetype = None
-
-    cmd = f'/usr/local/bin/exiftool -File:MIMEType "{local_file}"'
 
     try:
-        result = subprocess.run(
-            cmd,
-            check=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            shell=True,
-        )
+        result_stdout = utils_delegates.run_exiftool(["-File:MIMEType", local_file])
 
-        if result.stdout:
-            match = re.search(r"MIME Type[\ ]*:\ ", result.stdout)
+        if result_stdout:
+            match = re.search(r"MIME Type[\ ]*:\ ", result_stdout)
             if match:
-                mimetype = result.stdout.split(":")[-1].strip()
+                mimetype = result_stdout.split(":")[-1].strip()
                 return mimetype
             else:
+                logger.info(log_prefix_local + result_stdout.strip())
                 return None
         else:
             return None
@@ -974,15 +1133,9 @@ def get_mimetype_via_exiftool2(local_file: str, log_prefix="") -> str:
         fq_exc_name = exc.__class__.__module__ + "." + exc_name
         exc_msg = str(exc)
         exc_slug = f"{fq_exc_name}: {exc_msg}"
-
-        if isinstance(exc, subprocess.CalledProcessError):
-            logger.info(log_prefix_local + exc_slug)
-
-        else:
-            logger.error(log_prefix_local + "unexpected exception: " + exc_slug)
-            tb_str = traceback.format_exc()
-            logger.error(log_prefix_local + result.stderr)
-            logger.error(log_prefix_local + tb_str)
+        logger.error(log_prefix_local + "unexpected exception: " + exc_slug)
+        tb_str = traceback.format_exc()
+        logger.error(log_prefix_local + tb_str)
 
         with open(local_file, mode="rb") as file:
             bytes = file.read(512)
@@ -1049,6 +1202,22 @@ def get_mimetype_via_python_magic(local_file, log_prefix="") -> str:
     return None
 
 
+def get_mimetype_via_python_magic_from_buffer(content: bytes, log_prefix="") -> str:
+    log_prefix_local = log_prefix + "get_mimetype_via_python_magic_from_buffer: "
+    try:
+        return magic.from_buffer(content, mime=True)
+    except Exception as exc:
+        short_exc_name = exc.__class__.__name__
+        exc_name = exc.__class__.__module__ + "." + short_exc_name
+        exc_msg = str(exc)
+        exc_slug = f"{exc_name}: {exc_msg}"
+        tb_str = traceback.format_exc()
+        logger.error(log_prefix_local + "unexpected exception: " + exc_slug)
+        logger.error(log_prefix_local + tb_str)
+
+    return None
+
+
 def guess_mimetype_from_uri_extension(url, log_prefix="", debug=False, context=None):
     # https://developer.mozilla.org/en-US/docs/Web/HTTP/Basics_of_HTTP/MIME_types/Common_types
     # https://www.digipres.org/formats/mime-types/#application/illustrator%0A
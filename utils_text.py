@@ -10,7 +10,7 @@ import lxml
 import lxml.etree
 from dateutil.tz import tzutc
 from goose3 import Goose
-from goose3.crawler import Crawler
+from goose3.crawler import CrawlCandidate, Crawler
 from goose3.extractors.publishdate import TIMEZONE_INFO
 from goose3.text import get_encodings_from_content
 
@@ -349,7 +349,9 @@ def get_filename_details_from_url(full_url):
     return filename_details
 
 
-def get_reading_time_via_goose(page_source=None, log_prefix=""):
+def get_reading_time_via_goose(page_source=None, page_tree=None, log_prefix=""):
+    # page_tree, if given, is page_source already parsed (see HtmlPage.tree); goose then
+    # skips parsing the page again, but cleans page_tree in place
     log_prefix += "grt_via_g: "
 
     try:
@@ -360,7 +362,12 @@ def get_reading_time_via_goose(page_source=None, log_prefix=""):
         g = Goose()
 
         try:
-            article = g.extract(raw_html=page_source)
+            if page_tree is not None:
+                crawler = Crawler(g.config, g.fetcher)
+                crawler.get_document = lambda raw_html: page_tree
+                article = crawler.crawl(CrawlCandidate(g.config, None, page_source))
+            else:
+                article = g.extract(raw_html=page_source)
         except lxml.etree.ParserError as exc:
             logger.error(log_prefix + f"lxml.etree.ParserError: {exc}")
             return None